@@ -2,40 +2,98 @@
 MCP Server Template
 """
 
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from pydantic import Field
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
 
-import mcp.types as types
-from mistralai import Mistral
 from dotenv import load_dotenv
+import contextlib
+import hmac
+import json
+import logging
 import os
-from src.prompt_resto_client import find_restaurant
-from src.caller import send_bland_pathway_call, get_call_transcript
-from src.caller import task
-
 
+# Before the src modules read their settings from the environment.
 load_dotenv()
 
+from src.agents import warm_agents
+from src.booking import Candidate, book_first_available
+from src.prompt_resto_client import find_restaurant_async, find_restaurants_async, RESTAURANT_AGENT
+from src.prompt_resto_client import PROGRESS_STEPS
+from src.prompt_sport_wellness import SPORT_AGENT
+from src import call_state, metrics
+from src.call_queue import CALL_QUEUE, is_job_id
+from src.caller import get_call_transcript_async
+from src.caller import BLAND_WEBHOOK_SECRET, CALL_STORE
+from src.caller import task
+from src.lazy import preload_in_background
+from src.mistral_gateway import get_client
+
 mcp = FastMCP("X-HEC Concierge", port=3000, stateless_http=True, debug=True)
 
+logger = logging.getLogger(__name__)
+
+# The Mistral SDK and numpy load on a thread while the server starts, instead of
+# on the first request that needs them. Set PRELOAD_BACKENDS=0 to load them on first use.
+if os.getenv("PRELOAD_BACKENDS", "1") != "0":
+    preload_in_background()
+
 
 @mcp.tool(
     title="Fetch restaurant suggestions",
-    description="Fetch restaurant suggestions from Mistral, you must provide the previous info if the previous research was sunsuccessful.",
+    description="Fetch restaurant suggestions from Mistral, you must provide the previous info if the previous research was sunsuccessful. "
+    "Alternatively, pass the same session_id on every message of a booking: follow-ups then only need the new details.",
 )
-def cherche_restaurant(prompt_utilisateur) -> str:
+async def cherche_restaurant(
+    prompt_utilisateur, ctx: Context, session_id: str | None = None
+) -> str:
     """
     This function takes the user's prompt, wraps it in an instruction
     for Mistral to obtain a list of 5 restaurants in JSON format.
+    Each stage is reported as a progress notification and a log message, so the
+    extracted details reach the client before the search is over.
+    With a session_id, the details of the previous messages of the session are kept.
+    """
+
+    async def progress(step: int, message: str) -> None:
+        await ctx.report_progress(step, PROGRESS_STEPS, message)
+        await ctx.info(message)
+
+    return await find_restaurant_async(prompt_utilisateur, progress, session_id)
+
+
+@mcp.tool(
+    title="Fetch restaurant suggestions for several requests",
+    description="Fetch restaurant suggestions for several independent requests at once, for example one dinner per team. "
+    "Each request must be complete on its own, as for cherche_restaurant. Returns one result per request, in order, with its own status.",
+)
+async def cherche_restaurants(
+    prompts_utilisateur: list[str], max_concurrent_extractions: int = 8
+) -> str:
+    """
+    This function searches restaurants for several requests at once.
+
+    Arguments:
+        prompts_utilisateur: The requests, each with all its booking details
+        max_concurrent_extractions: The maximum number of requests analysed at once
+    Returns:
+        The result of every request (found, missing_info or error) and the number
+        of distinct searches made, as JSON.
     """
-    return find_restaurant(prompt_utilisateur)
+    try:
+        result = await find_restaurants_async(prompts_utilisateur, max_concurrent_extractions)
+    except ValueError as e:
+        return f"Error: {e}"
+    return json.dumps(result, indent=2)
 
 
 @mcp.tool(
     title="Call restaurant",
-    description="Call the restaurant to book a table, you must provide the previous info if the previous research was sunsuccessful.",
+    description="Call the restaurant to book a table, you must provide the previous info if the previous research was sunsuccessful. "
+    "The call is queued and a job_id is returned at once; asking again for the same booking returns the same job.",
 )
-def call_restaurant(
+async def call_restaurant(
     phone_number: str,
     restaurant_name: str,
     number_of_people: int,
@@ -44,7 +102,7 @@ def call_restaurant(
     reservation_name: str,
 ) -> str:
     """
-    This function takes the user's prompt, and calls the restaurant to book a table.
+    This function takes the user's prompt, and queues a call to the restaurant to book a table.
 
     Arguments:
         phone_number: The phone number of the restaurant
@@ -54,9 +112,9 @@ def call_restaurant(
         time_of_reservation: The time of the reservation
         reservation_name: The name of the reservation
     Returns:
-        The transcript of the call, or raises for HTTP errors.        The call_id on success, or raises for HTTP errors.
+        A message with the job_id of the call, to pass to fetch_call_transcript.
     """
-    return send_bland_pathway_call(
+    job, queued = CALL_QUEUE.enqueue(
         phone_number=phone_number,
         restaurant_name=restaurant_name,
         number_of_people=number_of_people,
@@ -64,11 +122,130 @@ def call_restaurant(
         time_of_reservation=time_of_reservation,
         reservation_name=reservation_name,
     )
+    job_id = job["job_id"]
+    if not queued:
+        return f"This call was already requested ({job['status']}). Check back on the {job_id=} to get the transcript."
+    return f"Call queued. Check back on the {job_id=} to get the transcript."
+
+
+@mcp.tool(
+    title="Call restaurants",
+    description="Call several candidate restaurants at once to book a table, and keep the first one that confirms. The other calls are ended. "
+    "Restaurants that confirmed too are listed under duplicates, to cancel; status is unconfirmed when a call ended without a clear answer.",
+)
+async def call_restaurants(
+    candidates: list[Candidate],
+    number_of_people: int,
+    date_of_reservation: str,
+    time_of_reservation: str,
+    reservation_name: str,
+    max_concurrent_calls: int = 3,
+) -> str:
+    """
+    This function calls the candidate restaurants concurrently until one books the table.
+
+    Arguments:
+        candidates: The restaurants to call (phone_number, restaurant_name), in order of preference
+        number_of_people: The number of people in the reservation
+        date_of_reservation: The date of the reservation
+        time_of_reservation: The time of the reservation
+        reservation_name: The name of the reservation
+        max_concurrent_calls: The maximum number of calls in progress at once (at least 1)
+    Returns:
+        The booking, if any, the duplicate bookings and the outcome and timings of every call, as JSON.
+    """
+    result = await book_first_available(
+        candidates,
+        number_of_people=number_of_people,
+        date_of_reservation=date_of_reservation,
+        time_of_reservation=time_of_reservation,
+        reservation_name=reservation_name,
+        max_concurrency=max_concurrent_calls,
+    )
+    return json.dumps(result, indent=2)
 
 
 @mcp.tool(
     title="Get call transcript",
-    description="Get the transcript of a call.",
+    description="Get the outcome of a call, from its job_id or call_id: whether the table was booked, the booking details "
+    "and, once confirmed, a ready Google Calendar link and .ics event, with the call summary and transcript.",
+)
+async def fetch_call_transcript(call_id: str) -> str:
+    if is_job_id(call_id):
+        return await CALL_QUEUE.transcript(call_id)
+    return await get_call_transcript_async(call_id)
+
+
+@mcp.tool(
+    title="List calls",
+    description="List the booking calls placed so far, most recent first, optionally only those to a restaurant or for a date (YYYY-MM-DD).",
 )
-def fetch_call_transcript(call_id: str) -> str:
-    return get_call_transcript(call_id)
+async def list_calls(
+    restaurant_name: str | None = None,
+    date: str | None = None,
+    limit: int = 20,
+) -> str:
+    """
+    This function lists the calls recorded in the call store.
+
+    Arguments:
+        restaurant_name: Only calls to restaurants whose name contains this
+        date: Only calls for a reservation on, or placed on, this date (YYYY-MM-DD)
+        limit: The maximum number of calls to return
+    Returns:
+        The calls with their booking details, status and summary, as JSON.
+    """
+    return json.dumps(CALL_STORE.list(restaurant_name, date, limit=limit), indent=2)
+
+
+@mcp.custom_route("/bland/webhook", methods=["POST"])
+async def bland_webhook(request: Request) -> JSONResponse:
+    """
+    Receives the call details Bland posts when a call placed with a webhook ends.
+    Only calls placed by this server are recorded, and only with the secret token.
+    """
+    token = request.query_params.get("token", "")
+    if not BLAND_WEBHOOK_SECRET or not hmac.compare_digest(token, BLAND_WEBHOOK_SECRET):
+        return JSONResponse({"status": "error", "message": "invalid token"}, 403)
+    details = await request.json()
+    call_id = details.get("call_id")
+    if not call_id:
+        return JSONResponse({"status": "error", "message": "missing call_id"}, 400)
+    if CALL_STORE.get(call_id) is None:
+        return JSONResponse({"status": "error", "message": "unknown call_id"}, 404)
+    await call_state.record(call_id, details)
+    CALL_STORE.record_completed(call_id, details)
+    return JSONResponse({"status": "ok"})
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_route(request: Request) -> PlainTextResponse:
+    """Per-stage timings and error counts, in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def _on_startup() -> None:
+    """Runs in the server's event loop, before it accepts requests."""
+    # Calls queued or in progress before a restart resume at once.
+    CALL_QUEUE.start()
+    # Set WARM_AGENTS=1 to create the web-search agents at startup instead of on the first search.
+    if os.getenv("WARM_AGENTS") == "1":
+        try:
+            await warm_agents(get_client(), [RESTAURANT_AGENT, SPORT_AGENT])
+        except Exception as e:
+            logger.warning("Agents not warmed, they will be created on first use: %s", e)
+
+
+def create_app():
+    """The ASGI app of the server, for `uvicorn --factory main:create_app` and serve.py."""
+    app = mcp.streamable_http_app()
+    run_session_manager = app.router.lifespan_context
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await _on_startup()
+        async with run_session_manager(app):
+            yield
+
+    app.router.lifespan_context = lifespan
+    return app
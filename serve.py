@@ -0,0 +1,50 @@
+"""
+Runs the server over streamable HTTP with several worker processes on one port.
+
+Each worker is a separate process built from `main.create_app`, so the tools run
+on every core. Caches, sessions and call completions are shared through the
+state backend (STATE_BACKEND, see src/shared_state.py), which defaults to
+sqlite here as soon as there is more than one worker; the call queue and call
+records already live in SQLite files shared by the workers of the host. Metrics
+are per worker.
+
+Usage:
+    python serve.py --workers 4
+    STATE_BACKEND=redis REDIS_URL=redis://cache:6379/0 python serve.py --workers 8 --host 0.0.0.0
+"""
+
+import argparse
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 3000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", 1)))
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        os.environ.setdefault("STATE_BACKEND", "sqlite")
+        if os.environ["STATE_BACKEND"] == "memory":
+            parser.error("several workers need a shared STATE_BACKEND (sqlite or redis)")
+    # Read by the workers, to split account-wide quotas between them.
+    os.environ["WORKERS"] = str(args.workers)
+
+    uvicorn.run(
+        "main:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Process-wide registry of Mistral agents.
+
+Agents are created once per process and reused by every tool call. They are
+keyed by (model, instructions, tools), so changing any of these creates a new
+agent, and an agent whose id is rejected upstream is recreated transparently.
+"""
+
+import asyncio
+import json
+
+from src.lazy import lazy_import
+from src.metrics import span
+from src.mistral_gateway import route_agent
+
+models = lazy_import("mistralai.models")
+
+
+_agent_ids: dict[tuple, str] = {}
+_key_locks: dict[tuple, asyncio.Lock] = {}
+
+
+def agent_key(spec: dict) -> tuple:
+    return (
+        spec["model"],
+        spec["instructions"],
+        json.dumps(spec.get("tools", []), sort_keys=True),
+    )
+
+
+def _lock_for(key: tuple) -> asyncio.Lock:
+    return _key_locks.setdefault(key, asyncio.Lock())
+
+
+async def get_agent_id(client, spec: dict) -> str:
+    """
+    Returns the id of the agent described by `spec`, creating it on first use.
+    Arguments:
+        client: The Mistral client
+        spec: The agent configuration (model, name, description, instructions, tools)
+    Returns:
+        The agent id.
+    """
+    key = agent_key(spec)
+    agent_id = _agent_ids.get(key)
+    if agent_id:
+        return agent_id
+    async with _lock_for(key):
+        agent_id = _agent_ids.get(key)
+        if not agent_id:
+            with span("agents.create", model=spec["model"]):
+                agent = await client.beta.agents.create_async(**spec)
+            agent_id = _agent_ids[key] = agent.id
+            route_agent(agent_id, spec["model"])
+    return agent_id
+
+
+def invalidate(spec: dict, agent_id: str | None = None) -> None:
+    """Forgets the cached agent, unless it was already replaced by another id."""
+    key = agent_key(spec)
+    if agent_id is None or _agent_ids.get(key) == agent_id:
+        _agent_ids.pop(key, None)
+
+
+def _agent_rejected(error, agent_id: str) -> bool:
+    """
+    Whether the request failed because the agent no longer exists. Other 400s are
+    about the request itself: recreating the agent for them would leak one each time.
+    """
+    return error.status_code == 404 or (error.status_code == 400 and agent_id in (error.body or ""))
+
+
+async def start_conversation(client, spec: dict, inputs: str):
+    """
+    Starts a conversation with the registered agent for `spec`.
+    If the cached agent no longer exists upstream, it is recreated once.
+    """
+    agent_id = await get_agent_id(client, spec)
+    try:
+        with span("conversations.start", model=spec["model"]):
+            return await client.beta.conversations.start_async(
+                agent_id=agent_id, inputs=inputs
+            )
+    except models.SDKError as e:
+        if not _agent_rejected(e, agent_id):
+            raise
+        invalidate(spec, agent_id)
+    agent_id = await get_agent_id(client, spec)
+    with span("conversations.start", model=spec["model"]):
+        return await client.beta.conversations.start_async(agent_id=agent_id, inputs=inputs)
+
+
+async def warm_agents(client, specs: list[dict]) -> None:
+    """Creates the given agents ahead of the first tool call."""
+    await asyncio.gather(*(get_agent_id(client, spec) for spec in specs))
@@ -0,0 +1,162 @@
+"""
+Pooled, retrying client for the Bland API.
+
+One keep-alive connection pool is shared by every request of the process, each
+endpoint has its own timeout, 429 and 5xx answers are retried with jittered
+exponential backoff (honouring Retry-After), and call creation is rate limited to
+stay within the account's call quota.
+"""
+
+import asyncio
+import os
+import random
+
+import httpx
+
+from src import cassette
+from src.metrics import inc, span
+from src.ratelimit import SharedTokenBucket, TokenBucket, retry_after
+from src.shared_state import get_state
+
+
+BLAND_API_URL = os.getenv("BLAND_API_URL", "https://api.bland.ai")
+# Calls we may place per minute, see the rate limits of the Bland plan. The quota
+# is for the account: with a shared state backend, every worker takes from the same
+# bucket, whichever of them places the calls.
+BLAND_CALLS_PER_MINUTE = float(os.getenv("BLAND_CALLS_PER_MINUTE", 60))
+
+# Seconds, per endpoint.
+TIMEOUTS = {
+    "create_call": 30.0,
+    "get_call": 10.0,
+    "stop_call": 10.0,
+    "corrected_transcript": 20.0,
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class BlandError(RuntimeError):
+    pass
+
+
+class BlandClient:
+    def __init__(
+        self,
+        base_url: str = BLAND_API_URL,
+        api_key: str | None = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 10.0,
+        calls_per_minute: float = BLAND_CALLS_PER_MINUTE,
+        max_connections: int = 100,
+    ):
+        self.base_url = base_url
+        self._api_key = api_key
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        rate, burst = calls_per_minute / 60, max(1.0, calls_per_minute / 6)
+        state = get_state()
+        self.calls_quota = (
+            SharedTokenBucket(state, "bland_calls", rate, burst)
+            if state.shared
+            else TokenBucket(rate, capacity=burst)
+        )
+        self._limits = httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections
+        )
+        self._http: httpx.AsyncClient | None = None
+        self._loop = None
+
+    def _client(self) -> httpx.AsyncClient:
+        # Connections belong to an event loop: the blocking wrappers run each call
+        # in a fresh loop, so the pool is rebuilt when the loop changes.
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                transport=cassette.wrap(httpx.AsyncHTTPTransport(limits=self._limits), "bland"),
+            )
+            self._loop = loop
+        return self._http
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self._api_key or os.getenv('BLAND_API_KEY')}",
+            "Content-Type": "application/json",
+        }
+
+    def _delay(self, attempt: int, response: httpx.Response | None) -> float:
+        if response is not None:
+            delay = retry_after(response)
+            if delay is not None:
+                return delay
+        return min(self.max_backoff, self.backoff * 2**attempt) * random.uniform(0.5, 1.5)
+
+    async def _request(
+        self, endpoint: str, method: str, path: str, idempotent: bool = True, **kwargs
+    ) -> httpx.Response:
+        """
+        Sends a request, retrying rate limits, server errors and connection failures.
+        Non-idempotent requests are only retried when the server cannot have acted
+        on them (429 or a failure to connect).
+        """
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                with span(f"bland.{endpoint}"):
+                    response = await self._client().request(
+                        method, path, headers=self._headers(), timeout=TIMEOUTS[endpoint], **kwargs
+                    )
+            except httpx.ConnectError:
+                if attempt == self.max_retries:
+                    raise
+            except httpx.TransportError:
+                if attempt == self.max_retries or not idempotent:
+                    raise
+            else:
+                retry = response.status_code == 429 or (
+                    idempotent and response.status_code in RETRY_STATUSES
+                )
+                if not retry or attempt == self.max_retries:
+                    return response
+            inc("bland_retries", endpoint=endpoint)
+            await asyncio.sleep(self._delay(attempt, response))
+        raise AssertionError("unreachable")
+
+    async def create_call(self, payload: dict) -> str:
+        """Places a call and returns its call_id."""
+        with span("bland.rate_limit"):
+            await self.calls_quota.acquire()
+        resp = await self._request("create_call", "POST", "/v1/calls", idempotent=False, json=payload)
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("status") != "success":
+            raise BlandError(f"Bland API error: {data}")
+        return data["call_id"]
+
+    async def get_call(self, call_id: str) -> dict:
+        resp = await self._request("get_call", "GET", f"/v1/calls/{call_id}")
+        resp.raise_for_status()
+        return resp.json()
+
+    async def stop_call(self, call_id: str) -> None:
+        """Ends a call in progress. Calls that already ended are left as they are."""
+        resp = await self._request("stop_call", "POST", f"/v1/calls/{call_id}/stop")
+        if resp.status_code not in (200, 400, 404):
+            resp.raise_for_status()
+
+    async def corrected_transcript(self, call_id: str) -> str | None:
+        """The corrected transcript of a completed call, or None if there is none."""
+        resp = await self._request(
+            "corrected_transcript", "GET", f"/v1/calls/{call_id}/correct"
+        )
+        resp.raise_for_status()
+        corrected = resp.json().get("corrected") or []
+        transcript = " ".join(seg.get("text", "").strip() for seg in corrected).strip()
+        return transcript or None
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
@@ -0,0 +1,160 @@
+"""
+Batch booking: call several candidate restaurants at once and keep the first table.
+
+Calls go through the call queue, so they share its concurrency caps and
+idempotency with `call_restaurant`, and at most `max_concurrency` of the batch are
+in progress at once. As soon as one restaurant confirms, or a call ends without a
+clear outcome (the table may be held), the calls still ringing are ended and the
+candidates not called yet are skipped. A second restaurant confirming at the same time is reported as a
+duplicate, for the client to cancel. A booking already requested earlier is not
+called again, and stops the batch like an unclear outcome.
+"""
+
+import asyncio
+import time
+
+from pydantic import BaseModel
+
+from src.call_queue import CALL_QUEUE
+from src.caller import CALL_TIMEOUT, stop_call_async, wait_for_call_async
+from src.post_call import booking_outcome
+
+# How long a call still being placed is waited for, to hang it up, in seconds.
+PLACEMENT_TIMEOUT = 30
+
+
+class Candidate(BaseModel):
+    phone_number: str
+    restaurant_name: str
+
+
+async def book_first_available(
+    candidates: list[Candidate],
+    number_of_people: int,
+    date_of_reservation: str,
+    time_of_reservation: str,
+    reservation_name: str,
+    max_concurrency: int = 3,
+) -> dict:
+    """
+    Calls the candidates concurrently until one confirms the booking.
+    Arguments:
+        candidates: The restaurants to call, in order of preference
+        number_of_people: The number of people in the reservation
+        date_of_reservation: The date of the reservation
+        time_of_reservation: The time of the reservation
+        reservation_name: The name of the reservation
+        max_concurrency: The maximum number of calls in progress at once
+    Returns:
+        The booking (or None), the duplicate bookings and the outcome and timings
+        of every call.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1.")
+    started = time.perf_counter()
+    slots = asyncio.Semaphore(max_concurrency)
+    # Set once a table is or may be booked: calling more restaurants could book a second one.
+    stop = asyncio.Event()
+    # Jobs of this batch whose call has not ended: cancelled if still queued, hung
+    # up once placed otherwise.
+    pending: dict[str, dict] = {}
+    results = [
+        {
+            "restaurant_name": c.restaurant_name,
+            "phone_number": c.phone_number,
+            "outcome": "skipped",
+        }
+        for c in candidates
+    ]
+
+    async def call(candidate: Candidate, result: dict) -> None:
+        async with slots:
+            if stop.is_set():
+                return
+            result["placed_after_s"] = round(time.perf_counter() - started, 3)
+            placed = time.perf_counter()
+            try:
+                job, queued = CALL_QUEUE.enqueue(
+                    phone_number=candidate.phone_number,
+                    restaurant_name=candidate.restaurant_name,
+                    number_of_people=number_of_people,
+                    date_of_reservation=date_of_reservation,
+                    time_of_reservation=time_of_reservation,
+                    reservation_name=reservation_name,
+                )
+                result["job_id"] = job["job_id"]
+                if not queued:
+                    # Placed by an earlier request, which may hold the table.
+                    result["outcome"] = "already_requested"
+                    result["job_status"] = job["status"]
+                    stop.set()
+                    return
+                pending[job["job_id"]] = result
+                job = await CALL_QUEUE.wait_placed(job["job_id"], CALL_TIMEOUT)
+                if not job["call_id"]:
+                    raise RuntimeError(job["error"] or "the call was not placed in time")
+                result["call_id"] = job["call_id"]
+                details = await wait_for_call_async(job["call_id"])
+                pending.pop(job["job_id"])
+                result["summary"] = details.get("summary") or details.get(
+                    "concatenated_transcript"
+                )
+                result["outcome"] = booking_outcome(result["summary"])
+            except asyncio.CancelledError:
+                result["outcome"] = "ended"
+                raise
+            except Exception as e:
+                result["outcome"] = "error"
+                result["error"] = str(e)
+            finally:
+                result["call_s"] = round(time.perf_counter() - placed, 3)
+            if result["outcome"] == "confirmed":
+                booked = any(r["outcome"] == "booked" for r in results)
+                result["outcome"] = "duplicate" if booked else "booked"
+                stop.set()
+            elif result["outcome"] == "unknown":
+                stop.set()
+
+    tasks = [asyncio.create_task(call(c, r)) for c, r in zip(candidates, results)]
+    all_done = asyncio.gather(*tasks, return_exceptions=True)
+    first_booking = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait(
+            [all_done, first_booking], return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        # The remaining calls are hung up, the ones not placed yet never start.
+        first_booking.cancel()
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(
+            *(_hang_up(job_id, result) for job_id, result in pending.items()),
+            return_exceptions=True,
+        )
+
+    booking = next((r for r in results if r["outcome"] == "booked"), None)
+    duplicates = [r for r in results if r["outcome"] == "duplicate"]
+    if booking:
+        status = "booked"
+    elif any(r["outcome"] in ("unknown", "already_requested") for r in results):
+        status = "unconfirmed"
+    else:
+        status = "not_booked"
+    return {
+        "status": status,
+        "booking": booking,
+        "duplicates": duplicates,
+        "calls": results,
+        "total_s": round(time.perf_counter() - started, 3),
+    }
+
+
+async def _hang_up(job_id: str, result: dict) -> None:
+    """Ends the call of a job, or cancels the job if its call is not placed yet."""
+    if CALL_QUEUE.cancel(job_id):
+        return
+    job = await CALL_QUEUE.wait_placed(job_id, PLACEMENT_TIMEOUT)
+    if job and job["call_id"]:
+        result["call_id"] = job["call_id"]
+        await stop_call_async(job["call_id"])
@@ -0,0 +1,148 @@
+"""
+Bounded TTL/LRU cache for extraction and search results.
+
+Values must be JSON-serialisable. They are stored serialised, which gives every
+reader its own copy and lets the memory cap be enforced in bytes. Entries are
+also written to the shared state backend when there is one (see
+src/shared_state.py), so every worker process sees them, or else to a SQLite file
+when CACHE_PATH is set, so the cache survives a restart. Hits and misses are
+counted in `concierge_cache_requests_total`, by tier.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.extractor import normalize
+from src.metrics import inc
+from src.shared_state import SqliteState, get_state
+
+
+CACHE_PATH = os.getenv("CACHE_PATH")
+
+
+def normalize_query(query: str) -> str:
+    """Folds case, accents, whitespace and trailing punctuation of a user query."""
+    return " ".join(normalize(query).split()).strip(" .!?")
+
+
+def criteria_key(criteria: dict, fields: list[str]) -> str:
+    """A stable key for the given fields of extracted search criteria."""
+    return json.dumps(
+        {f: normalize(str(criteria.get(f))) for f in fields}, sort_keys=True
+    )
+
+
+class TTLCache:
+    """
+    One cache tier: entries expire after `ttl` seconds and the least recently used
+    ones are evicted beyond `max_entries` or `max_bytes` of serialised values.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        max_entries: int = 1024,
+        max_bytes: int = 4 * 1024 * 1024,
+        path: str | None = CACHE_PATH,
+        state=None,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if state is None:
+            state = get_state()
+            if not state.shared:
+                state = SqliteState(path) if path else None
+        # The second tier, behind the entries kept in memory.
+        self._shared = state
+
+    def get(self, key: str):
+        """Returns a copy of the cached value, or None when missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self._shared is not None:
+            entry = self._load(key, self._shared.get(self.name, key))
+        return self._read(key, entry)
+
+    async def get_async(self, key: str):
+        """`get`, reading the shared tier without blocking the event loop."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self._shared is not None:
+            entry = self._load(key, await self._shared.get_async(self.name, key))
+        return self._read(key, entry)
+
+    def set(self, key: str, value) -> None:
+        entry = self._entry(key, value)
+        if self._shared is not None:
+            self._shared.set(self.name, key, json.dumps(entry), ttl=self.ttl)
+
+    async def set_async(self, key: str, value) -> None:
+        """`set`, writing the shared tier without blocking the event loop."""
+        entry = self._entry(key, value)
+        if self._shared is not None:
+            await self._shared.set_async(self.name, key, json.dumps(entry), ttl=self.ttl)
+
+    def stats(self) -> dict:
+        return {
+            "tier": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _entry(self, key: str, value) -> tuple[float, str]:
+        entry = (time.time() + self.ttl, json.dumps(value))
+        with self._lock:
+            self._store(key, entry)
+        return entry
+
+    def _load(self, key: str, stored: str | None) -> tuple[float, str] | None:
+        if not stored:
+            return None
+        entry = tuple(json.loads(stored))
+        with self._lock:
+            self._store(key, entry)
+        return entry
+
+    def _read(self, key: str, entry: tuple[float, str] | None):
+        with self._lock:
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                inc("cache_requests", tier=self.name, outcome="miss")
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        inc("cache_requests", tier=self.name, outcome="hit")
+        return json.loads(entry[1])
+
+    def _store(self, key: str, entry: tuple[float, str]) -> None:
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key)[1])
+        self._entries[key] = entry
+        self._bytes += len(entry[1])
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def _drop(self, key: str) -> None:
+        # The shared tier expires its copy at the same time on its own.
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
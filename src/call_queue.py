@@ -0,0 +1,360 @@
+"""
+Durable queue of the outbound booking calls.
+
+`call_restaurant` enqueues its call here and returns a job id at once. Jobs are
+kept in SQLite, keyed by an idempotency key derived from the phone number, date,
+time and reservation name, so asking twice for the same booking (an agent
+retrying the tool) gives back the first job instead of calling the restaurant
+again. A job that failed before its call was placed, was cancelled before it, or
+whose call the restaurant declined is queued again instead.
+
+A scheduler, started with the server (see `start`) or else on first use, places
+the queued calls in order while keeping at most `CALL_QUEUE_MAX_CALLS` calls in
+progress overall and `CALL_QUEUE_MAX_CALLS_PER_RESTAURANT` per restaurant; a slot
+is held until the call ends. After a restart, queued jobs are placed and calls already in progress
+are waited on again. A job interrupted while its call was being placed is marked
+failed rather than placed twice.
+
+When several worker processes share the queue, only the one holding the lock file
+next to it runs the scheduler; the others enqueue and watch the jobs, and take
+over if it exits.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from src.caller import (
+    CALL_TIMEOUT,
+    get_call_transcript_async,
+    start_call_async,
+    wait_for_call_async,
+)
+from src.extractor import normalize, parse_date, parse_time
+from src.metrics import inc
+from src.post_call import booking_outcome
+
+
+CALL_QUEUE_DB_PATH = os.getenv("CALL_QUEUE_DB_PATH", "call_queue.db")
+CALL_QUEUE_MAX_CALLS = int(os.getenv("CALL_QUEUE_MAX_CALLS", "10"))
+CALL_QUEUE_MAX_CALLS_PER_RESTAURANT = int(
+    os.getenv("CALL_QUEUE_MAX_CALLS_PER_RESTAURANT", "1")
+)
+
+JOB_PREFIX = "job_"
+# How often jobs written by other workers are looked for, in seconds.
+POLL_INTERVAL = 0.5
+
+# queued -> placing -> in-progress -> done (or declined), failed at any step, or
+# cancelled while queued.
+_COLUMNS = [
+    "job_id",
+    "idempotency_key",
+    "restaurant_key",
+    "params",
+    "status",
+    "call_id",
+    "error",
+    "created_at",
+    "updated_at",
+]
+
+
+def is_job_id(value: str) -> bool:
+    return value.startswith(JOB_PREFIX)
+
+
+def idempotency_key(
+    phone_number: str, date_of_reservation: str, time_of_reservation: str, reservation_name: str
+) -> str:
+    """The same booking written differently ("tomorrow" / its date, "8pm" / "20:00") gives the same key."""
+    reservation_date = parse_date(str(date_of_reservation))
+    parts = [
+        _restaurant_key(phone_number),
+        reservation_date.isoformat() if reservation_date else normalize(str(date_of_reservation)).strip(),
+        parse_time(str(time_of_reservation)) or normalize(str(time_of_reservation)).strip(),
+        " ".join(normalize(reservation_name).split()),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+def _restaurant_key(phone_number: str) -> str:
+    return re.sub(r"\D", "", phone_number)
+
+
+class CallQueue:
+    def __init__(
+        self,
+        path: str = CALL_QUEUE_DB_PATH,
+        max_calls: int = CALL_QUEUE_MAX_CALLS,
+        max_calls_per_restaurant: int = CALL_QUEUE_MAX_CALLS_PER_RESTAURANT,
+    ):
+        self.max_calls = max_calls
+        self.max_calls_per_restaurant = max_calls_per_restaurant
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                restaurant_key TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                call_id TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at)")
+        self._db.commit()
+        self._lock_path = f"{path}.lock"
+        self._leader_file = None
+        # Jobs holding a call slot, by restaurant.
+        self._active: dict[str, str] = {}
+        self._scheduler: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._settled: dict[str, asyncio.Event] = {}
+
+    def enqueue(
+        self,
+        phone_number: str,
+        restaurant_name: str,
+        number_of_people: int,
+        date_of_reservation: str,
+        time_of_reservation: str,
+        reservation_name: str,
+    ) -> tuple[dict, bool]:
+        """
+        Queues a booking call, unless the same booking was already requested.
+        Returns:
+            The job, and whether it was newly queued.
+        """
+        self._ensure_scheduler()
+        params = {
+            "phone_number": phone_number,
+            "restaurant_name": restaurant_name,
+            "number_of_people": number_of_people,
+            "date_of_reservation": date_of_reservation,
+            "time_of_reservation": time_of_reservation,
+            "reservation_name": reservation_name,
+        }
+        key = idempotency_key(phone_number, date_of_reservation, time_of_reservation, reservation_name)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE idempotency_key = ?", (key,)
+            ).fetchone()
+            existing = dict(zip(_COLUMNS, row)) if row else None
+            if existing and not _retryable(existing):
+                inc("call_jobs", outcome="duplicate")
+                return existing, False
+            if existing:
+                # Nothing was booked: requesting it again retries the call.
+                self._db.execute(
+                    "UPDATE jobs SET status = 'queued', params = ?, call_id = NULL, error = NULL, "
+                    "updated_at = ? WHERE job_id = ?",
+                    (json.dumps(params), now, existing["job_id"]),
+                )
+                job_id = existing["job_id"]
+            else:
+                job_id = f"{JOB_PREFIX}{uuid.uuid4().hex}"
+                self._db.execute(
+                    "INSERT INTO jobs (job_id, idempotency_key, restaurant_key, params, status, "
+                    "created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                    (job_id, key, _restaurant_key(phone_number), json.dumps(params), now, now),
+                )
+            self._db.commit()
+        inc("call_jobs", outcome="queued")
+        self._settled.pop(job_id, None)
+        self._wakeup.set()
+        return self.get(job_id), True
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancels a job whose call is not placed yet. Returns whether it was still queued."""
+        with self._lock:
+            cancelled = self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? "
+                "WHERE job_id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            ).rowcount
+            self._db.commit()
+        if cancelled:
+            inc("call_jobs", outcome="cancelled")
+            self._settled.setdefault(job_id, asyncio.Event()).set()
+        return bool(cancelled)
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def position(self, job_id: str) -> int | None:
+        """How many queued jobs are ahead of this one, if it is queued."""
+        job = self.get(job_id)
+        if job is None or job["status"] != "queued":
+            return None
+        with self._lock:
+            (ahead,) = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?",
+                (job["created_at"],),
+            ).fetchone()
+        return ahead
+
+    async def wait_placed(self, job_id: str, timeout: float) -> dict | None:
+        """Waits up to `timeout` seconds for the call of a job to be placed (or to fail, or be cancelled)."""
+        self._ensure_scheduler()
+        deadline = time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["call_id"] or job["status"] in ("failed", "cancelled"):
+                return job
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return job
+            event = self._settled.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+
+    async def transcript(self, job_id: str, timeout: float = CALL_TIMEOUT) -> str:
+        """The transcript of the call of a job, once it is placed and completed."""
+        job = await self.wait_placed(job_id, timeout)
+        if job is None:
+            return f"No call was queued with {job_id=}."
+        if job["call_id"]:
+            return await get_call_transcript_async(job["call_id"])
+        if job["status"] == "failed":
+            return f"The call could not be placed: {job['error']}. Call the restaurant again to retry."
+        if job["status"] == "cancelled":
+            return "The call was cancelled before being placed. Call the restaurant again to retry."
+        ahead = self.position(job_id)
+        waiting = f", behind {ahead} other calls" if ahead else ""
+        return f"The call is still queued{waiting}. Check back on the {job_id=} later."
+
+    def _update(self, job_id: str, **values) -> None:
+        assignments = ", ".join(f"{k} = ?" for k in values)
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE job_id = ?",
+                (*values.values(), time.time(), job_id),
+            )
+            self._db.commit()
+        if "call_id" in values or values.get("status") == "failed":
+            self._settled.setdefault(job_id, asyncio.Event()).set()
+
+    def _claim(self, job_id: str) -> bool:
+        """Moves a job from queued to placing, unless it was cancelled in the meantime."""
+        with self._lock:
+            claimed = self._db.execute(
+                "UPDATE jobs SET status = 'placing', updated_at = ? "
+                "WHERE job_id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            ).rowcount
+            self._db.commit()
+        return bool(claimed)
+
+    def _jobs(self, status: str) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE status = ? ORDER BY created_at",
+                (status,),
+            ).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def start(self) -> None:
+        """
+        Starts the scheduler in the running event loop, so the jobs left queued or
+        in progress by a previous run resume without waiting for a tool call.
+        """
+        self._ensure_scheduler()
+
+    def _ensure_scheduler(self) -> None:
+        if self._scheduler is not None and not self._scheduler.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._active.clear()
+        self._scheduler = asyncio.get_running_loop().create_task(self._schedule())
+
+    def _lead(self) -> bool:
+        """Takes the scheduler lock, if no other process holds it."""
+        if self._leader_file is None:
+            self._leader_file = open(self._lock_path, "a")
+        try:
+            fcntl.flock(self._leader_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    async def _schedule(self) -> None:
+        while not self._lead():
+            await asyncio.sleep(POLL_INTERVAL * 2)
+        # Whatever a previous run left behind.
+        for job in self._jobs("placing"):
+            self._update(
+                job["job_id"],
+                status="failed",
+                error="interrupted while the call was being placed",
+            )
+        for job in self._jobs("in-progress"):
+            self._start(job)
+        while True:
+            self._wakeup.clear()
+            for job in self._jobs("queued"):
+                if len(self._active) >= self.max_calls:
+                    break
+                busy = sum(1 for r in self._active.values() if r == job["restaurant_key"])
+                if busy < self.max_calls_per_restaurant and self._claim(job["job_id"]):
+                    self._start(job)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, job: dict) -> None:
+        self._active[job["job_id"]] = job["restaurant_key"]
+        task = asyncio.create_task(self._run(job))
+        task.add_done_callback(lambda t: self._release(job["job_id"]))
+
+    def _release(self, job_id: str) -> None:
+        self._active.pop(job_id, None)
+        self._wakeup.set()
+
+    async def _run(self, job: dict) -> None:
+        call_id = job["call_id"]
+        try:
+            if call_id is None:
+                call_id = await start_call_async(**json.loads(job["params"]))
+                self._update(job["job_id"], status="in-progress", call_id=call_id)
+                inc("call_jobs", outcome="placed")
+            # The slot is held for as long as the call is in progress.
+            details = await wait_for_call_async(call_id)
+            summary = details.get("summary") or details.get("concatenated_transcript")
+            declined = booking_outcome(summary) == "declined"
+            self._update(job["job_id"], status="declined" if declined else "done")
+        except Exception as e:
+            self._update(job["job_id"], status="failed", error=str(e) or type(e).__name__)
+            inc("call_jobs", outcome="failed")
+
+
+def _retryable(job: dict) -> bool:
+    """Whether requesting the booking of `job` again should call the restaurant again."""
+    if job["status"] == "failed":
+        return not job["call_id"]
+    return job["status"] in ("declined", "cancelled")
+
+
+CALL_QUEUE = CallQueue()
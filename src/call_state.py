@@ -0,0 +1,82 @@
+"""
+In-process store of Bland call-completion events.
+
+The webhook receiver in main.py records the call details Bland posts when a call
+ends, and `get_call_transcript_async` waits on them instead of polling.
+
+With a shared state backend, the details are also written there, since the
+webhook may reach another worker than the one waiting: waiters then check it
+every `SHARED_POLL_INTERVAL` seconds as well.
+"""
+
+import asyncio
+import json
+import time
+
+from src.shared_state import get_state
+
+
+MAX_CALLS = 10_000
+SHARED_POLL_INTERVAL = 0.25
+# How long completed calls are kept in the shared state, in seconds.
+SHARED_TTL = 24 * 3600
+
+_completed: dict[str, dict] = {}
+_events: dict[str, asyncio.Event] = {}
+
+
+def _event_for(call_id: str) -> asyncio.Event:
+    return _events.setdefault(call_id, asyncio.Event())
+
+
+async def record(call_id: str, details: dict) -> None:
+    """Stores the final details of a call and wakes up everyone waiting on it."""
+    _remember(call_id, details)
+    state = get_state()
+    if state.shared:
+        await state.set_async("call", call_id, json.dumps(details), ttl=SHARED_TTL)
+
+
+def _remember(call_id: str, details: dict) -> None:
+    _completed[call_id] = details
+    _event_for(call_id).set()
+    while len(_completed) > MAX_CALLS:
+        forget(next(iter(_completed)))
+
+
+async def get(call_id: str) -> dict | None:
+    details = _completed.get(call_id)
+    state = get_state()
+    if details is None and state.shared:
+        stored = await state.get_async("call", call_id)
+        if stored:
+            details = json.loads(stored)
+            _remember(call_id, details)
+    return details
+
+
+async def wait(call_id: str, timeout: float) -> dict | None:
+    """Waits up to `timeout` seconds for the call to complete. Returns None on timeout."""
+    if not get_state().shared:
+        try:
+            await asyncio.wait_for(_event_for(call_id).wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return _completed.get(call_id)
+    deadline = time.monotonic() + timeout
+    while (details := await get(call_id)) is None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        try:
+            await asyncio.wait_for(
+                _event_for(call_id).wait(), min(SHARED_POLL_INTERVAL, remaining)
+            )
+        except asyncio.TimeoutError:
+            pass
+    return details
+
+
+def forget(call_id: str) -> None:
+    _completed.pop(call_id, None)
+    _events.pop(call_id, None)
@@ -0,0 +1,164 @@
+"""
+Persistent store of the booking calls placed through Bland.
+
+Every call is recorded when it is placed, with its booking parameters, and
+updated when it completes with its summary and transcripts. A completed call is
+then answered from here, so fetching its transcript again costs no request to
+Bland, even after a restart. Past calls can be listed by restaurant or date.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from src.extractor import normalize, parse_date
+
+
+CALL_DB_PATH = os.getenv("CALL_DB_PATH", "calls.db")
+
+_COLUMNS = [
+    "call_id",
+    "phone_number",
+    "restaurant_name",
+    "number_of_people",
+    "date_of_reservation",
+    "time_of_reservation",
+    "reservation_name",
+    "reservation_date",
+    "status",
+    "summary",
+    "transcript",
+    "corrected_transcript",
+    "placed_at",
+    "completed_at",
+]
+
+
+class CallStore:
+    def __init__(self, path: str = CALL_DB_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS calls (
+                call_id TEXT PRIMARY KEY,
+                phone_number TEXT,
+                restaurant_name TEXT,
+                number_of_people INTEGER,
+                date_of_reservation TEXT,
+                time_of_reservation TEXT,
+                reservation_name TEXT,
+                reservation_date TEXT,
+                status TEXT NOT NULL,
+                summary TEXT,
+                transcript TEXT,
+                corrected_transcript TEXT,
+                placed_at REAL,
+                completed_at REAL
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS calls_by_restaurant ON calls (restaurant_name COLLATE NOCASE)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS calls_by_date ON calls (reservation_date, placed_at)"
+        )
+        self._db.commit()
+
+    def record_placed(
+        self,
+        call_id: str,
+        phone_number: str,
+        restaurant_name: str,
+        number_of_people: int,
+        date_of_reservation: str,
+        time_of_reservation: str,
+        reservation_name: str,
+    ) -> None:
+        """Adds a call that was just placed."""
+        # Free-form dates ("tomorrow") are also kept as a date, for filtering.
+        reservation_date = parse_date(normalize(str(date_of_reservation)))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO calls (call_id, phone_number, restaurant_name, "
+                "number_of_people, date_of_reservation, time_of_reservation, reservation_name, "
+                "reservation_date, status, placed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    call_id,
+                    phone_number,
+                    restaurant_name,
+                    number_of_people,
+                    date_of_reservation,
+                    time_of_reservation,
+                    reservation_name,
+                    reservation_date.isoformat() if reservation_date else None,
+                    "in-progress",
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def record_completed(self, call_id: str, details: dict) -> None:
+        """Marks a call as completed with its final details from Bland."""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO calls (call_id, status, summary, transcript, completed_at) "
+                "VALUES (?, 'completed', ?, ?, ?) ON CONFLICT (call_id) DO UPDATE SET "
+                "status = 'completed', summary = excluded.summary, "
+                "transcript = excluded.transcript, completed_at = excluded.completed_at",
+                (
+                    call_id,
+                    details.get("summary"),
+                    details.get("concatenated_transcript"),
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def record_corrected_transcript(self, call_id: str, transcript: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE calls SET corrected_transcript = ? WHERE call_id = ?",
+                (transcript, call_id),
+            )
+            self._db.commit()
+
+    def get(self, call_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM calls WHERE call_id = ?", (call_id,)
+            ).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def list(
+        self,
+        restaurant_name: str | None = None,
+        date: str | None = None,
+        status: str | None = None,
+        limit: int = 50,
+    ) -> list[dict]:
+        """
+        The most recent calls, optionally only those to restaurants whose name
+        contains `restaurant_name`, for a reservation on (or placed on) the ISO
+        `date`, or with the given status.
+        """
+        query = f"SELECT {', '.join(_COLUMNS)} FROM calls WHERE 1"
+        params: list = []
+        if restaurant_name:
+            query += " AND restaurant_name LIKE ? COLLATE NOCASE"
+            params.append(f"%{restaurant_name}%")
+        if date:
+            query += (
+                " AND (reservation_date = ? OR date(placed_at, 'unixepoch', 'localtime') = ?)"
+            )
+            params += [date, date]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        with self._lock:
+            rows = self._db.execute(
+                query + " ORDER BY placed_at DESC LIMIT ?", params + [limit]
+            ).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
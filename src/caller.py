@@ -1,9 +1,15 @@
-import requests
+import asyncio
+import httpx
+import json
 import os
-import dotenv
 import time
 
-dotenv.load_dotenv()
+from src import call_state
+from src.bland_client import BlandClient
+from src.call_store import CallStore
+from src.metrics import span
+from src.post_call import call_result
+from src.singleflight import SingleFlight
 
 
 task = f"""
@@ -21,7 +27,24 @@ Paige (AI): Perfect, thank you very much. Have a great evening—goodbye.
 """
 
 
-def send_bland_pathway_call(
+# Public URL of the /bland/webhook route mounted in main.py, e.g. https://concierge.example.com/bland/webhook.
+# Only used with a secret: the route rejects every webhook without one.
+BLAND_WEBHOOK_URL = os.getenv("BLAND_WEBHOOK_URL")
+BLAND_WEBHOOK_SECRET = os.getenv("BLAND_WEBHOOK_SECRET")
+
+CALL_TIMEOUT = 300
+POLL_INITIAL_DELAY = 2
+POLL_MAX_DELAY = 30
+
+# Shared by every call so connections to Bland are kept alive between requests.
+bland = BlandClient()
+# Every call placed, with its outcome once known.
+CALL_STORE = CallStore()
+TRANSCRIPTS = SingleFlight("call_transcript")
+CORRECTIONS = SingleFlight("corrected_transcript")
+
+
+async def start_call_async(
     phone_number: str,
     restaurant_name: str,
     number_of_people: int,
@@ -31,7 +54,6 @@ def send_bland_pathway_call(
 ) -> str:
     """
     Starts a Bland AI call that uses an existing conversational pathway.
-    Returns the call_id on success, or raises for HTTP errors.
     Arguments:
         phone_number: The phone number of the restaurant
         restaurant_name: The name of the restaurant
@@ -43,14 +65,6 @@ def send_bland_pathway_call(
         The call_id on success, or raises for HTTP errors.
     """
 
-    api_key = os.getenv("BLAND_API_KEY")
-
-    url = "https://api.bland.ai/v1/calls"
-    headers = {
-        "Authorization": f"Bearer {api_key}",  # API key auth
-        "Content-Type": "application/json",
-    }
-
     first_sentence = f"""Hi, I’d like to book a table at your restaurant for {{number_of_people}}. Would that be possible ?"""
 
     payload = {
@@ -73,59 +87,162 @@ def send_bland_pathway_call(
         "wait_for_greeting": True,
         "interruption_threshold": 90,
     }
-    resp = requests.post(url, headers=headers, json=payload)
-    resp.raise_for_status()
-    data = resp.json()
-    if data.get("status") != "success":
-        raise RuntimeError(f"Bland API error: {data}")
-    call_id = data["call_id"]
+    if BLAND_WEBHOOK_URL and BLAND_WEBHOOK_SECRET:
+        payload["webhook"] = f"{BLAND_WEBHOOK_URL}?token={BLAND_WEBHOOK_SECRET}"
+    call_id = await bland.create_call(payload)
+    CALL_STORE.record_placed(
+        call_id,
+        phone_number=phone_number,
+        restaurant_name=restaurant_name,
+        number_of_people=number_of_people,
+        date_of_reservation=date_of_reservation,
+        time_of_reservation=time_of_reservation,
+        reservation_name=reservation_name,
+    )
+    return call_id
+
+
+async def send_bland_pathway_call_async(
+    phone_number: str,
+    restaurant_name: str,
+    number_of_people: int,
+    date_of_reservation: str,
+    time_of_reservation: str,
+    reservation_name: str,
+) -> str:
+    """
+    Starts a Bland AI call to book a table, see `start_call_async`.
+    Returns a message with the call_id on success, or raises for HTTP errors.
+    """
+    call_id = await start_call_async(
+        phone_number=phone_number,
+        restaurant_name=restaurant_name,
+        number_of_people=number_of_people,
+        date_of_reservation=date_of_reservation,
+        time_of_reservation=time_of_reservation,
+        reservation_name=reservation_name,
+    )
     print(f"Call started. Check back on the {call_id=} to get the transcript.")
     return f"Call started. Check back on the {call_id=} to get the transcript."
 
 
-def get_call_transcript(call_id: str) -> str:
+async def wait_for_call_async(call_id: str, timeout: float = CALL_TIMEOUT) -> dict:
     """
-    Gets the transcript of a call.
-    Arguments:
-        call_id: The id of the call
-    Returns:
-        The transcript of the call, or raises for HTTP errors.
+    Waits for a call to complete and returns its details.
+    The webhook usually wakes us up as soon as the call ends; polling with
+    exponential backoff only covers calls whose webhook never arrives.
+    Calls already completed are answered from the call store.
+    Raises TimeoutError after `timeout` seconds, or for HTTP errors.
     """
-    # --- Wait for the call to complete ---
-    status_url = f"https://api.bland.ai/v1/calls/{call_id}"
-    deadline = time.time() + 300
-    last = None
-    while True:
-        api_key = os.getenv("BLAND_API_KEY")
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",  # API key auth
-            "Content-Type": "application/json",
+    stored = CALL_STORE.get(call_id)
+    if stored and stored["status"] == "completed":
+        return {
+            "call_id": call_id,
+            "completed": True,
+            "summary": stored["summary"],
+            "concatenated_transcript": stored["transcript"],
         }
-        r = requests.get(status_url, headers=headers, timeout=15)
-        r.raise_for_status()
-        last = r.json()
+    deadline = time.time() + timeout
+    delay = POLL_INITIAL_DELAY
+    last = await call_state.get(call_id)
+    while last is None:
+        details = await bland.get_call(call_id)
         # Prefer the 'completed' boolean; 'status' may also be "completed"
-        if last.get("completed") or last.get("status") == "success":
+        if details.get("completed") or details.get("status") == "success":
+            await call_state.record(call_id, details)
+            last = details
             break
-        if time.time() > deadline:
+        remaining = deadline - time.time()
+        if remaining <= 0:
             raise TimeoutError("Timed out waiting for the call to complete.")
-        time.sleep(2)
+        last = await call_state.wait(call_id, min(delay, remaining))
+        delay = min(delay * 2, POLL_MAX_DELAY)
+    CALL_STORE.record_completed(call_id, last)
+    return last
 
-    summary= last["summary"] if last["summary"] else last["concatenated_transcript"]
+
+async def stop_call_async(call_id: str) -> None:
+    """Ends a call in progress. Calls that already ended are left as they are."""
+    await bland.stop_call(call_id)
+
+
+async def get_call_transcript_async(call_id: str) -> str:
+    """
+    Gets the transcript of a call.
+    Arguments:
+        call_id: The id of the call
+    Returns:
+        The outcome of the call, the booking details and, once confirmed, a Google
+        Calendar link and an .ics event for it, with the summary and corrected
+        transcript, as JSON. Raises for HTTP errors.
+    """
+    stored = CALL_STORE.get(call_id)
+    if stored and stored["status"] == "completed":
+        # Completed calls do not change any more: only the corrected transcript may
+        # be missing, when the call completed with no one waiting for it (queued
+        # calls, the webhook).
+        transcript = stored["corrected_transcript"]
+        if transcript is None:
+            transcript = await CORRECTIONS.do(call_id, lambda: _corrected_transcript(call_id))
+        summary = stored["summary"] or stored["transcript"]
+        return _transcript_message(call_id, stored, summary, transcript or stored["transcript"])
+    # Requests for the same call share one wait, and one corrected transcript fetch.
+    return await TRANSCRIPTS.do(call_id, lambda: _fetch_transcript(call_id))
+
+
+async def _fetch_transcript(call_id: str) -> str:
+    # --- Wait for the call to complete ---
+    with span("call.wait"):
+        last = await wait_for_call_async(call_id)
+    summary = last.get("summary") or last.get("concatenated_transcript")
     print(summary)
+    transcript = await _corrected_transcript(call_id)
+    # The corrected transcript is optional, the call transcript stands in for it.
+    transcript = transcript or last.get("concatenated_transcript")
+    return _transcript_message(call_id, CALL_STORE.get(call_id), summary, transcript)
+
+
+async def _corrected_transcript(call_id: str) -> str | None:
+    """Fetches the corrected transcript of a completed call and records it, if Bland has one."""
     try:
-        corr = requests.get(f"{status_url}/correct", headers=headers, timeout=15)
-        corr.raise_for_status()
-        corrected = corr.json().get("corrected") or []
-        if corrected:
-            transcript = " ".join(
-                seg.get("text", "").strip() for seg in corrected
-            ).strip()
-    except requests.RequestException:
-        pass
-
-    return f"Based on this summary of the transcript, create a google calendar link for the event if successful. Otherwise explain to the user the situation. \n\summary of the transcript: {summary}"
+        transcript = await bland.corrected_transcript(call_id)
+    except httpx.HTTPError:
+        return None
+    if transcript:
+        CALL_STORE.record_corrected_transcript(call_id, transcript)
+    return transcript
+
+
+def _transcript_message(
+    call_id: str, call: dict | None, summary: str | None, transcript: str | None
+) -> str:
+    return json.dumps(call_result(call_id, call, summary, transcript), indent=2)
+
+
+def send_bland_pathway_call(
+    phone_number: str,
+    restaurant_name: str,
+    number_of_people: int,
+    date_of_reservation: str,
+    time_of_reservation: str,
+    reservation_name: str,
+) -> str:
+    """Blocking wrapper around `send_bland_pathway_call_async`."""
+    return asyncio.run(
+        send_bland_pathway_call_async(
+            phone_number=phone_number,
+            restaurant_name=restaurant_name,
+            number_of_people=number_of_people,
+            date_of_reservation=date_of_reservation,
+            time_of_reservation=time_of_reservation,
+            reservation_name=reservation_name,
+        )
+    )
+
+
+def get_call_transcript(call_id: str) -> str:
+    """Blocking wrapper around `get_call_transcript_async`."""
+    return asyncio.run(get_call_transcript_async(call_id))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,265 @@
+"""
+Record and replay of the upstream traffic (Mistral and Bland).
+
+With CASSETTE_MODE=record, every request sent to Mistral or Bland and its
+response are appended to the cassette at CASSETTE_PATH, one JSON line each (the
+file is gzipped when its name ends in .gz). Each entry keeps the time it took
+to get the response headers and the offsets of the body chunks, so streamed
+answers keep their pace. API keys and the webhook secret are redacted wherever
+they appear, and request headers are not kept at all.
+
+With CASSETTE_MODE=replay, no request leaves the process: each one is answered
+from the cassette. The entry used is the next one recorded for the same service,
+method, path and body; when the body differs (a prompt was changed), the next
+one for the same path, which is counted as a mismatch. A request with nothing
+recorded for its path fails with CassetteMiss. CASSETTE_SPEED=recorded waits as
+long as the recording did, and CASSETTE_SPEED=fast (the default) answers at once.
+
+Requests are counted by service in `counts` and in
+`concierge_upstream_requests_total`, so replaying a trace against a new build
+shows any change in the number of upstream calls a tool makes.
+"""
+
+import asyncio
+import base64
+import collections
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import httpx
+
+from src.metrics import inc
+
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassettes/traffic.jsonl.gz")
+CASSETTE_SPEED = os.getenv("CASSETTE_SPEED", "fast")
+
+REDACTED = "<redacted>"
+SECRETS = ["MISTRAL_API_KEY", "BLAND_API_KEY", "BLAND_WEBHOOK_SECRET"]
+# Response headers worth replaying; the body is stored decoded.
+KEPT_HEADERS = ["content-type", "retry-after"]
+
+# service -> requests sent (recording) or answered (replay)
+counts: collections.Counter = collections.Counter()
+
+
+class CassetteMiss(httpx.TransportError):
+    pass
+
+
+def _redact(text: str) -> str:
+    for name in SECRETS:
+        secret = os.getenv(name)
+        if secret:
+            text = text.replace(secret, REDACTED)
+    return text
+
+
+def _body_text(content: bytes) -> str:
+    text = _redact(content.decode("utf-8", errors="replace"))
+    try:
+        # The same JSON body may be serialized with its keys in another order.
+        return json.dumps(json.loads(text), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        return text
+
+
+def _request_key(service: str, request: httpx.Request) -> tuple[str, str, str, str]:
+    path = _redact(request.url.raw_path.decode())
+    body = hashlib.sha256(_body_text(request.content).encode()).hexdigest()[:16]
+    return service, request.method, path, body
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _chunk(data: bytes) -> str | dict:
+    try:
+        return _redact(data.decode("utf-8"))
+    except UnicodeDecodeError:
+        return {"b64": base64.b64encode(data).decode()}
+
+
+def _unchunk(chunk: str | dict) -> bytes:
+    if isinstance(chunk, dict):
+        return base64.b64decode(chunk["b64"])
+    return chunk.encode("utf-8")
+
+
+class _Recorder:
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def write(self, entry: dict) -> None:
+        line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False)
+        with self._lock, _open(self._path, "a") as f:
+            f.write(line + "\n")
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """Passes the decoded body through, and writes the entry once it is read."""
+
+    def __init__(self, response: httpx.Response, entry: dict, sent: float, recorder: _Recorder):
+        self._response = response
+        self._entry = entry
+        self._sent = sent
+        self._recorder = recorder
+        self._chunks: list[list] = []
+
+    async def __aiter__(self):
+        async for data in self._response.aiter_bytes():
+            self._chunks.append([round(time.monotonic() - self._sent, 4), _chunk(data)])
+            yield data
+
+    async def aclose(self) -> None:
+        await self._response.aclose()
+        if self._entry is not None:
+            self._entry["chunks"] = self._chunks
+            self._recorder.write(self._entry)
+            self._entry = None
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: list[list], headers_after: float, realtime: bool):
+        self._chunks = chunks
+        self._headers_after = headers_after
+        self._realtime = realtime
+
+    async def __aiter__(self):
+        started = time.monotonic() - self._headers_after
+        for offset, chunk in self._chunks:
+            if self._realtime:
+                await asyncio.sleep(max(0.0, started + offset - time.monotonic()))
+            yield _unchunk(chunk)
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, service: str, cassette: "Cassette"):
+        self._transport = transport
+        self._service = service
+        self._cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        counts[self._service] += 1
+        inc("upstream_requests", service=self._service, mode=self._cassette.mode)
+        if self._cassette.mode == "replay":
+            return await self._cassette.replay(self._service, request)
+
+        sent = time.monotonic()
+        response = await self._transport.handle_async_request(request)
+        service, method, path, body = _request_key(self._service, request)
+        entry = {
+            "service": service,
+            "method": method,
+            "path": path,
+            "body": body,
+            "at": round(sent - self._cassette.recorder.started, 4),
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+            "headers_after": round(time.monotonic() - sent, 4),
+        }
+        return httpx.Response(
+            response.status_code,
+            headers=[
+                (k, v)
+                for k, v in response.headers.items()
+                if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+            ],
+            stream=_RecordingStream(response, entry, sent, self._cassette.recorder),
+            extensions=response.extensions,
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class Cassette:
+    def __init__(
+        self, mode: str = CASSETTE_MODE, path: str = CASSETTE_PATH, speed: str = CASSETTE_SPEED
+    ):
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"Unknown CASSETTE_MODE: {mode!r} (expected off, record or replay)")
+        if speed not in ("recorded", "fast"):
+            raise ValueError(f"Unknown CASSETTE_SPEED: {speed!r} (expected recorded or fast)")
+        self.mode = mode
+        self.path = path
+        self.realtime = speed == "recorded"
+        self.recorder = _Recorder(path) if mode == "record" else None
+        # (service, method, path, body) and (service, method, path) -> entries not served yet
+        self._exact: dict[tuple, collections.deque] = collections.defaultdict(collections.deque)
+        self._by_path: dict[tuple, collections.deque] = collections.defaultdict(collections.deque)
+        # The last entry served for a path, served again once the recording runs out.
+        self._last: dict[tuple, dict] = {}
+        if mode == "replay":
+            with _open(path, "r") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._exact[(entry["service"], entry["method"], entry["path"], entry["body"])].append(entry)
+                    self._by_path[(entry["service"], entry["method"], entry["path"])].append(entry)
+
+    def wrap(self, transport: httpx.AsyncBaseTransport, service: str) -> httpx.AsyncBaseTransport:
+        """`transport`, recorded or replayed as `service` when a mode is set."""
+        if self.mode == "off":
+            return transport
+        return CassetteTransport(transport, service, self)
+
+    def _take(self, key: tuple) -> tuple[dict | None, str]:
+        exact = self._exact.get(key)
+        if exact:
+            entry = exact.popleft()
+            self._by_path[key[:3]].remove(entry)
+            return entry, "hit"
+        by_path = self._by_path.get(key[:3])
+        if by_path:
+            entry = by_path.popleft()
+            self._exact[(*key[:3], entry["body"])].remove(entry)
+            return entry, "mismatch"
+        # A call polled more often than when it was recorded gets its last state.
+        return self._last.get(key[:3]), "repeat"
+
+    async def replay(self, service: str, request: httpx.Request) -> httpx.Response:
+        key = _request_key(service, request)
+        entry, outcome = self._take(key)
+        inc("cassette_replays", service=service, outcome=outcome if entry else "miss")
+        if entry is None:
+            raise CassetteMiss(
+                f"Nothing recorded for {request.method} {key[2]} in {self.path}", request=request
+            )
+        self._last[key[:3]] = entry
+        if self.realtime:
+            await asyncio.sleep(entry["headers_after"])
+        return httpx.Response(
+            entry["status"],
+            headers=entry["headers"],
+            stream=_ReplayStream(entry["chunks"], entry["headers_after"], self.realtime),
+            request=request,
+        )
+
+
+_cassette: Cassette | None = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Cassette:
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette()
+        return _cassette
+
+
+def wrap(transport: httpx.AsyncBaseTransport, service: str) -> httpx.AsyncBaseTransport:
+    """`transport`, recorded or replayed as set by CASSETTE_MODE."""
+    return get_cassette().wrap(transport, service)
@@ -0,0 +1,456 @@
+"""
+Rule-based pre-extraction of restaurant booking requests.
+
+Agents often phrase their queries in a regular way, e.g.
+"Italian, Paris 16, 2 people, 19/10 at 19:00, 20-50€". When every field needed for
+the search is found here without ambiguity, `find_restaurant` skips the LLM
+extraction entirely.
+"""
+
+import re
+import unicodedata
+from datetime import date, timedelta
+
+
+EXTRACTION_KEYS = [
+    "restaurant_type",
+    "neighborhood",
+    "allergies",
+    "time",
+    "date",
+    "number_of_people",
+    "price",
+    "reservation_name",
+    "time_flexibility",
+]
+
+REQUIRED_FIELDS = ["restaurant_type", "neighborhood", "date", "time", "number_of_people"]
+
+
+CUISINES = {
+    "Italian": ["italian", "italien", "italienne", "pizza", "pizzeria", "trattoria", "osteria"],
+    "French": ["french", "francais", "francaise", "bistro", "bistrot", "brasserie"],
+    "Japanese": ["japanese", "japonais", "sushi", "ramen", "izakaya"],
+    "Chinese": ["chinese", "chinois", "dim sum", "cantonese", "sichuan"],
+    "Korean": ["korean", "coreen", "korean bbq"],
+    "Thai": ["thai", "thailandais"],
+    "Vietnamese": ["vietnamese", "vietnamien", "pho"],
+    "Indian": ["indian", "indien", "curry"],
+    "Lebanese": ["lebanese", "libanais"],
+    "Moroccan": ["moroccan", "marocain", "tajine", "couscous"],
+    "Greek": ["greek", "grec"],
+    "Spanish": ["spanish", "espagnol", "tapas"],
+    "Mexican": ["mexican", "mexicain", "tacos"],
+    "Peruvian": ["peruvian", "peruvien", "ceviche"],
+    "American": ["american", "americain", "burger", "burgers"],
+    "Seafood": ["seafood", "fruits de mer", "fish", "poisson", "oysters", "huitres"],
+    "Steakhouse": ["steakhouse", "steak house", "grill"],
+    "Vegetarian": ["vegetarian", "vegetarien", "vegan", "vegetalien", "plant-based"],
+}
+
+# Named areas and the arrondissement they belong to.
+NEIGHBORHOODS = {
+    "Le Marais": (["marais", "le marais"], 3),
+    "Montmartre": (["montmartre"], 18),
+    "Pigalle": (["pigalle", "sopi"], 9),
+    "Saint-Germain-des-Prés": (["saint-germain", "saint germain", "st germain", "saint-germain-des-pres"], 6),
+    "Latin Quarter": (["latin quarter", "quartier latin"], 5),
+    "Bastille": (["bastille"], 11),
+    "Oberkampf": (["oberkampf"], 11),
+    "République": (["republique"], 10),
+    "Canal Saint-Martin": (["canal saint-martin", "canal saint martin", "canal st martin"], 10),
+    "Belleville": (["belleville"], 20),
+    "Batignolles": (["batignolles"], 17),
+    "Opéra": (["opera"], 9),
+    "Les Halles": (["les halles", "chatelet"], 1),
+    "Champs-Élysées": (["champs-elysees", "champs elysees"], 8),
+    "Trocadéro": (["trocadero"], 16),
+    "Passy": (["passy"], 16),
+    "Auteuil": (["auteuil"], 16),
+    "Montparnasse": (["montparnasse"], 14),
+    "Butte-aux-Cailles": (["butte-aux-cailles", "butte aux cailles"], 13),
+    "Bercy": (["bercy"], 12),
+    "Nation": (["nation"], 12),
+    "Sentier": (["sentier"], 2),
+}
+
+ALLERGENS = {
+    "gluten": ["gluten", "celiac", "coeliac", "coeliaque"],
+    "nuts": ["nut", "nuts", "peanut", "peanuts", "arachide", "noix"],
+    "lactose": ["lactose", "dairy", "milk", "lait"],
+    "shellfish": ["shellfish", "crustacean", "crustaces"],
+    "fish": ["fish allergy"],
+    "eggs": ["egg", "eggs", "oeuf", "oeufs"],
+    "soy": ["soy", "soja"],
+    "sesame": ["sesame"],
+}
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "twelve": 12,
+    "deux": 2, "trois": 3, "quatre": 4, "cinq": 5, "sept": 7,
+    "huit": 8, "neuf": 9, "dix": 10, "douze": 12,
+}
+
+MONTHS = {
+    "january": 1, "jan": 1, "janvier": 1,
+    "february": 2, "feb": 2, "fevrier": 2,
+    "march": 3, "mar": 3, "mars": 3,
+    "april": 4, "apr": 4, "avril": 4,
+    "may": 5, "mai": 5,
+    "june": 6, "jun": 6, "juin": 6,
+    "july": 7, "jul": 7, "juillet": 7,
+    "august": 8, "aug": 8, "aout": 8,
+    "september": 9, "sep": 9, "sept": 9, "septembre": 9,
+    "october": 10, "oct": 10, "octobre": 10,
+    "november": 11, "nov": 11, "novembre": 11,
+    "december": 12, "dec": 12, "decembre": 12,
+}
+
+WEEKDAYS = {
+    "monday": 0, "lundi": 0,
+    "tuesday": 1, "mardi": 1,
+    "wednesday": 2, "mercredi": 2,
+    "thursday": 3, "jeudi": 3,
+    "friday": 4, "vendredi": 4,
+    "saturday": 5, "samedi": 5,
+    "sunday": 6, "dimanche": 6,
+}
+
+RELATIVE_DAYS = {
+    "today": 0, "tonight": 0, "this evening": 0, "aujourd'hui": 0, "ce soir": 0,
+    "tomorrow": 1, "demain": 1, "day after tomorrow": 2, "apres-demain": 2,
+}
+
+
+def _alternation(terms) -> str:
+    return "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True))
+
+
+def _lexicon_pattern(lexicon: dict[str, list[str]]) -> tuple[re.Pattern, dict[str, str]]:
+    canonical = {term: name for name, terms in lexicon.items() for term in terms}
+    return re.compile(rf"\b({_alternation(canonical)})\b"), canonical
+
+
+_CUISINE_RE, _CUISINE_OF = _lexicon_pattern(CUISINES)
+_NEIGHBORHOOD_RE, _NEIGHBORHOOD_OF = _lexicon_pattern(
+    {name: terms for name, (terms, _) in NEIGHBORHOODS.items()}
+)
+_ALLERGEN_RE, _ALLERGEN_OF = _lexicon_pattern(ALLERGENS)
+_ALLERGY_MENTION_RE = re.compile(
+    r"allerg|intoleran|celiac|coeliac|sans gluten|(?:gluten|nut|dairy|lactose)[- ]free"
+)
+_NO_ALLERGY_RE = re.compile(r"\bno (?:known )?allerg\w*|\bpas d'allergie")
+
+_ARRONDISSEMENT_RE = re.compile(
+    r"\b(?:paris\s*(\d{1,2})(?:e|eme|er|th|st|nd|rd)?"
+    r"|750(\d{2})"
+    r"|(\d{1,2})(?:e|eme|er)"
+    r"|(\d{1,2})(?:st|nd|rd|th)?\s*(?:arrondissement|arr))\b"
+)
+_PEOPLE_RE = re.compile(
+    rf"\b(?:(\d{{1,2}})|({_alternation(NUMBER_WORDS)}))\s*"
+    r"(?:people|persons?|pers\.?|personnes?|guests?|pax|couverts|adults)\b"
+    rf"|\b(?:table for|party of|for|pour)\s+(?:(\d{{1,2}})|({_alternation(NUMBER_WORDS)}))\b(?!\s*(?:[:h/.]|am\b|pm\b|€|eur|min))"
+)
+_TIME_RE = re.compile(
+    r"\b(\d{1,2})(?::(\d{2})\s*(am|pm)?|\s*(am|pm)|h(\d{2})?)(?![\w/])"
+    r"|\b(noon|midi|midnight|minuit)\b"
+)
+_NUMERIC_DATE_RE = re.compile(
+    r"\b(?:(\d{4})-(\d{1,2})-(\d{1,2})|(\d{1,2})[/.](\d{1,2})(?:[/.](\d{2,4}))?)\b"
+)
+_MONTH_NAMES = _alternation(MONTHS)
+_WRITTEN_DATE_RE = re.compile(
+    rf"\b(?:(\d{{1,2}})(?:st|nd|rd|th|er)?\s+(?:of\s+)?({_MONTH_NAMES})\.?"
+    rf"|({_MONTH_NAMES})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?)(?:,?\s+(\d{{4}}))?\b"
+)
+_WEEKDAY_RE = re.compile(rf"\b(?:next\s+|this\s+)?({_alternation(WEEKDAYS)})\b")
+_RELATIVE_DAY_RE = re.compile(rf"(?<![\w-])({_alternation(RELATIVE_DAYS)})(?![\w-])")
+_PRICE_RANGE_RE = re.compile(
+    r"(\d+)\s*(?:€|eur\b|euros?\b)?\s*(?:-|–|to|and|à|a|et)\s*(\d+)\s*(?:€|eur\b|euros?\b)"
+)
+_PRICE_BOUND_RE = re.compile(
+    r"\b(under|less than|below|max(?:imum)?|up to|not more than|moins de|over|more than|at least|min(?:imum)?)"
+    r"\s*(\d+)\s*(?:€|eur\b|euros?\b)"
+    r"|(\d+)\s*(?:€|eur\b|euros?\b)\s*(max|maximum|min|minimum)\b"
+)
+# The cue is matched in any case ("Name is Smith"), the name itself must be capitalized.
+_NAME_RE = re.compile(
+    r"(?i:under the name(?: of)?|in the name of|au nom de|reservation is for|booking is for|"
+    r"name is|name:|under)"
+    r"\s+((?:Mr\.?|Mrs\.?|Ms\.?|M\.|Mme)?\s*[A-Z][\w'-]+(?:\s+[A-Z][\w'-]+)?)"
+)
+_FLEXIBILITY_RE = re.compile(
+    r"((?:not |no |in)?flexib\w*[^.,;]*|(?:\+/-|±|plus or minus)\s*\d+\s*(?:min\w*|h\w*)[^.,;]*)",
+    re.IGNORECASE,
+)
+# Words announcing a reservation name, a time flexibility or a price. A message
+# using them in a way the patterns above cannot read is left to the LLM, instead
+# of losing it.
+_NAME_CUE_RE = re.compile(r"\b(?:[Nn]ame|[Nn]om)\b|\b[Uu]nder\s+(?:the\s+name\b|[A-Z])")
+_FLEXIBILITY_CUE_RE = re.compile(
+    r"flexib|give or take|more or less|\bor (?:so|later|earlier)\b|\+/-|±|plus or minus",
+    re.IGNORECASE,
+)
+_PRICE_CUE_RE = re.compile(
+    r"€|\$|\beur(?:os?)?\b|\b(?:budget|cheap\w*|(?:pas |bon )?cher|expensive|pricey|affordable|"
+    r"price\w*|prix|tarif\w*|bon marche|upscale|fancy|luxur\w*)\b",
+    re.IGNORECASE,
+)
+
+# What each field looks like once normalized, whether the rules can read it or not.
+_MENTION_RES = {
+    "restaurant_type": [_CUISINE_RE],
+    "neighborhood": [_NEIGHBORHOOD_RE, _ARRONDISSEMENT_RE],
+    "time": [_TIME_RE],
+    "date": [_NUMERIC_DATE_RE, _WRITTEN_DATE_RE, _WEEKDAY_RE, _RELATIVE_DAY_RE],
+    "number_of_people": [_PEOPLE_RE],
+    "price": [_PRICE_RANGE_RE, _PRICE_BOUND_RE],
+}
+
+
+def normalize(text: str) -> str:
+    """Lowercases `text` and strips accents so lexicon lookups are accent-insensitive."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _single(values: set):
+    """The only value of `values`, or None when nothing or conflicting values were found."""
+    return next(iter(values)) if len(values) == 1 else None
+
+
+def _next_date(month: int, day: int, today: date) -> date | None:
+    for year in (today.year, today.year + 1):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            return None
+        if candidate >= today:
+            return candidate
+    return None
+
+
+def parse_date(text: str, today: date | None = None) -> date | None:
+    """
+    Parses the date of a booking request.
+    Arguments:
+        text: The request, or just the date part of it
+        today: The reference date for relative dates, defaults to today
+    Returns:
+        The date, or None when no date or several different dates were found.
+    """
+    today = today or date.today()
+    text = normalize(text)
+    found = set()
+    for y, m, d, d2, m2, y2 in _NUMERIC_DATE_RE.findall(text):
+        try:
+            if y:
+                found.add(date(int(y), int(m), int(d)))
+            elif y2:
+                year = int(y2) + 2000 if len(y2) == 2 else int(y2)
+                found.add(date(year, int(m2), int(d2)))
+            else:
+                found.add(_next_date(int(m2), int(d2), today))
+        except ValueError:
+            found.add(None)
+    for d, month, month2, d2, year in _WRITTEN_DATE_RE.findall(text):
+        month_number, day = MONTHS[month or month2], int(d or d2)
+        try:
+            found.add(
+                date(int(year), month_number, day)
+                if year
+                else _next_date(month_number, day, today)
+            )
+        except ValueError:
+            found.add(None)
+    for word in _RELATIVE_DAY_RE.findall(text):
+        found.add(today + timedelta(days=RELATIVE_DAYS[word]))
+    for word in _WEEKDAY_RE.findall(text):
+        found.add(today + timedelta(days=(WEEKDAYS[word] - today.weekday()) % 7))
+    return _single(found)
+
+
+def find_times(text: str) -> list[tuple[int, str]]:
+    """Every valid time in the normalized `text`, as its offset and HH:MM."""
+    found = []
+    for match in _TIME_RE.finditer(text):
+        hour, minutes, suffix, suffix2, h_minutes, word = match.groups()
+        if word:
+            found.append((match.start(), "12:00" if word in ("noon", "midi") else "00:00"))
+            continue
+        hour, minutes = int(hour), int(minutes or h_minutes or 0)
+        suffix = suffix or suffix2
+        if suffix == "pm" and hour < 12:
+            hour += 12
+        elif suffix == "am" and hour == 12:
+            hour = 0
+        if hour < 24 and minutes < 60:
+            found.append((match.start(), f"{hour:02d}:{minutes:02d}"))
+    return found
+
+
+def _parse_time(text: str) -> str | None:
+    return _single({t for _, t in find_times(text)})
+
+
+def parse_time(text: str) -> str | None:
+    """The time in `text` as HH:MM, or None when no time or several different times were found."""
+    return _parse_time(normalize(text))
+
+
+def _parse_people(text: str) -> int | None:
+    found = set()
+    for digits, word, digits2, word2 in _PEOPLE_RE.findall(text):
+        found.add(int(digits or digits2) if digits or digits2 else NUMBER_WORDS[word or word2])
+    return _single(found)
+
+
+def parse_neighborhood(text: str) -> str | None:
+    """The neighborhood ("Le Marais") or arrondissement ("Paris 11") named in `text`, if only one is."""
+    return _parse_neighborhood(normalize(text))
+
+
+def _parse_neighborhood(text: str) -> str | None:
+    arrondissements = {
+        int("".join(groups)) for groups in _ARRONDISSEMENT_RE.findall(text)
+    } & set(range(1, 21))
+    named = {_NEIGHBORHOOD_OF[m] for m in _NEIGHBORHOOD_RE.findall(text)}
+    if len(named) == 1:
+        name = next(iter(named))
+        if not arrondissements:
+            return name
+        if arrondissements == {NEIGHBORHOODS[name][1]}:
+            return f"{name} (Paris {NEIGHBORHOODS[name][1]})"
+        return None
+    if not named and len(arrondissements) == 1:
+        return f"Paris {next(iter(arrondissements))}"
+    return None
+
+
+def _parse_price(text: str) -> str | None:
+    found = {f"{low}-{high}€" for low, high in _PRICE_RANGE_RE.findall(text)}
+    for word, amount, amount2, word2 in _PRICE_BOUND_RE.findall(text):
+        found.add(f"{word or word2} {amount or amount2}€")
+    return _single(found)
+
+
+def _parse_allergies(text: str) -> str | None:
+    if _NO_ALLERGY_RE.search(text) or not _ALLERGY_MENTION_RE.search(text):
+        return "no allergies"
+    allergens = sorted({_ALLERGEN_OF[m] for m in _ALLERGEN_RE.findall(text)})
+    # An allergy we do not know how to name is left to the LLM.
+    return ", ".join(allergens) if allergens else None
+
+
+def extract_fields(user_query: str, today: date | None = None) -> dict:
+    """
+    Extracts every booking field the rules can find without ambiguity.
+    Fields that are missing, or mentioned with conflicting values, are None.
+    """
+    text = normalize(user_query)
+    booking_date = parse_date(text, today)
+    flexibility = _FLEXIBILITY_RE.search(user_query)
+    name = _NAME_RE.search(user_query)
+    return {
+        "restaurant_type": _single({_CUISINE_OF[m] for m in _CUISINE_RE.findall(text)}),
+        "neighborhood": _parse_neighborhood(text),
+        "allergies": _parse_allergies(text),
+        "time": _parse_time(text),
+        "date": booking_date.isoformat() if booking_date else None,
+        "number_of_people": _parse_people(text),
+        "price": _parse_price(text),
+        "reservation_name": name.group(1).strip() if name else None,
+        "time_flexibility": flexibility.group(1).strip() if flexibility else None,
+    }
+
+
+def missed_cues(user_query: str, fields: dict) -> list[str]:
+    """The fields `user_query` announces ("name is", "give or take", "budget") but `fields` lacks."""
+    missed = []
+    if _NAME_CUE_RE.search(user_query) and fields.get("reservation_name") is None:
+        missed.append("reservation_name")
+    if _FLEXIBILITY_CUE_RE.search(user_query) and fields.get("time_flexibility") is None:
+        missed.append("time_flexibility")
+    if _PRICE_CUE_RE.search(normalize(user_query)) and fields.get("price") is None:
+        missed.append("price")
+    return missed
+
+
+def ambiguous_fields(user_query: str, fields: dict) -> list[str]:
+    """
+    The fields `user_query` mentions but `fields` lacks: stated with several values
+    ("9pm rather than 7pm") or in a form the rules cannot read.
+    """
+    text = normalize(user_query)
+    return [
+        key
+        for key, patterns in _MENTION_RES.items()
+        if fields.get(key) is None and any(p.search(text) for p in patterns)
+    ]
+
+
+def pre_extract(user_query: str, today: date | None = None) -> dict | None:
+    """
+    Returns the extracted fields when every field required for the search was
+    found with high confidence, or None when the LLM extraction is needed.
+    """
+    fields = extract_fields(user_query, today)
+    if fields["allergies"] is None or missed_cues(user_query, fields):
+        return None
+    if any(fields[key] is None for key in REQUIRED_FIELDS):
+        return None
+    return fields
+
+
+def extract_delta(user_query: str, today: date | None = None) -> dict:
+    """
+    The fields a follow-up message states explicitly, to be merged into the ones
+    already known. Unlike `extract_fields`, allergies are only reported when the
+    message talks about them.
+    """
+    fields = extract_fields(user_query, today)
+    text = normalize(user_query)
+    if not (_NO_ALLERGY_RE.search(text) or _ALLERGY_MENTION_RE.search(text)):
+        fields["allergies"] = None
+    return {k: v for k, v in fields.items() if v is not None}
+
+
+def _canonical(key: str, value) -> str | None:
+    """A model's value for `key` in the form the rules produce, when it can be read."""
+    if value is None:
+        return None
+    text = normalize(str(value))
+    if key == "time":
+        return _parse_time(text)
+    if key == "date":
+        parsed = parse_date(text)
+        return parsed.isoformat() if parsed else None
+    if key == "number_of_people":
+        digits = re.findall(r"\d+", text)
+        return digits[0] if len(digits) == 1 else None
+    if key == "restaurant_type":
+        return _single({_CUISINE_OF[m] for m in _CUISINE_RE.findall(text)})
+    return None
+
+
+def agrees_with_rules(
+    user_query: str,
+    fields: dict,
+    keys=("restaurant_type", "date", "time", "number_of_people"),
+    today: date | None = None,
+) -> bool:
+    """
+    Whether the fields a model extracted match the ones the rules find in the same
+    query. Only fields both sides state in a comparable form are checked.
+    """
+    rules = extract_fields(user_query, today)
+    for key in keys:
+        found = rules.get(key)
+        if found is None or fields.get(key) is None:
+            continue
+        given = _canonical(key, fields[key])
+        if given is not None and given != str(found):
+            return False
+    return True
@@ -0,0 +1,70 @@
+"""
+Modules loaded on first use.
+
+The Mistral SDK and numpy take most of the time it takes to import the server,
+and only the tools that search or embed need them. `lazy_import` returns a stand-in
+that imports its module the first time one of its attributes is read, so a cold
+start only pays for them on the first request that uses them. The import happens
+once, under a lock, even when that first use comes from several threads at once,
+so `preload_in_background` can also load them on a thread while the server
+starts and takes its first requests.
+"""
+
+import importlib
+import threading
+import time
+from types import ModuleType
+
+from src.metrics import observe
+
+
+class LazyModule:
+    """
+    Attributes of the stand-in itself shadow those of the module (numpy has a `load`
+    too), so all of them are underscored.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: ModuleType | None = None
+        self._lock = threading.Lock()
+
+    def _lazy_load(self) -> ModuleType:
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    self._module = importlib.import_module(self._name)
+                    observe("import", time.perf_counter() - started, module=self._name)
+                module = self._module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._lazy_load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+_modules: dict[str, LazyModule] = {}
+_modules_lock = threading.Lock()
+
+
+def lazy_import(name: str) -> LazyModule:
+    """The stand-in for module `name`, shared by every module that imports it lazily."""
+    with _modules_lock:
+        return _modules.setdefault(name, LazyModule(name))
+
+
+def preload_in_background() -> threading.Thread:
+    """Loads every lazily imported module on a daemon thread."""
+
+    def preload() -> None:
+        for module in list(_modules.values()):
+            module._lazy_load()
+
+    thread = threading.Thread(target=preload, name="preload", daemon=True)
+    thread.start()
+    return thread
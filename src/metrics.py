@@ -0,0 +1,143 @@
+"""
+Per-stage timings, counters and gauges, exposed in the Prometheus text format.
+
+    with span("conversations.start", model="mistral-large-latest"):
+        response = await client.beta.conversations.start_async(...)
+
+records the duration of the block in the `concierge_stage_seconds` histogram and
+counts the exceptions it raises in `concierge_stage_errors_total`, labelled by
+stage, model and exception type. Set METRICS_ENABLED=0 to turn recording off:
+`span` then hands back a shared no-op context manager.
+"""
+
+import bisect
+import contextlib
+import os
+import threading
+import time
+
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+# (stage, labels) -> [bucket counts..., +Inf count], sum
+_histograms: dict[tuple, list] = {}
+# (name, labels) -> value
+_counters: dict[tuple, float] = {}
+_gauges: dict[tuple, float] = {}
+
+_NOOP = contextlib.nullcontext()
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def observe(stage: str, seconds: float, **labels) -> None:
+    """Records a duration of `stage`."""
+    if not METRICS_ENABLED:
+        return
+    key = (stage, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+        histogram[0][bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    """Adds `amount` to the counter `concierge_<name>_total`."""
+    if not METRICS_ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def gauge(name: str, value: float, **labels) -> None:
+    """Sets the gauge `concierge_<name>` to `value`."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _gauges[(name, _labels(labels))] = value
+
+
+class _Span:
+    __slots__ = ("stage", "labels", "started")
+
+    def __init__(self, stage: str, labels: dict):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.stage, time.perf_counter() - self.started, **self.labels)
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            inc("stage_errors", stage=self.stage, error=exc_type.__name__, **self.labels)
+        return False
+
+
+def span(stage: str, **labels):
+    """Times the enclosed block as `stage`, counting the exceptions it raises."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Span(stage, labels)
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render() -> str:
+    """All the metrics recorded so far, in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {k: ([*v[0]], v[1]) for k, v in _histograms.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+
+    lines = [
+        "# HELP concierge_stage_seconds Duration of each stage of the tools.",
+        "# TYPE concierge_stage_seconds histogram",
+    ]
+    for (stage, labels), (counts, total) in sorted(histograms.items()):
+        labels = (("stage", stage),) + labels
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += count
+            lines.append(
+                f"concierge_stage_seconds_bucket{_format_labels(labels, (('le', str(bound)),))} {cumulative}"
+            )
+        lines.append(f"concierge_stage_seconds_sum{_format_labels(labels)} {total}")
+        lines.append(f"concierge_stage_seconds_count{_format_labels(labels)} {cumulative}")
+
+    names = sorted({name for name, _ in counters})
+    for name in names:
+        lines.append(f"# TYPE concierge_{name}_total counter")
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"concierge_{name}_total{_format_labels(labels)} {value:g}")
+
+    for name in sorted({name for name, _ in gauges}):
+        lines.append(f"# TYPE concierge_{name} gauge")
+        for (metric, labels), value in sorted(gauges.items()):
+            if metric == name:
+                lines.append(f"concierge_{name}{_format_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
@@ -0,0 +1,309 @@
+"""
+Process-wide gateway to the Mistral API.
+
+Every tool call uses the same client (`get_client`), whose connection pool is kept
+alive between requests, and every request it sends goes through the gateway,
+which keeps one lane per model:
+- a token bucket paces the requests to MISTRAL_REQUESTS_PER_SECOND, or to the rate
+  given for the model in MISTRAL_MODEL_RATES ("mistral-large-latest=1,mistral-embed=10").
+  The quota is for the workspace, so each of the WORKERS processes gets its share;
+- an adaptive limit caps the requests in flight (AIMD): it grows by one for every
+  `limit` requests answered at their usual latency, and halves on a 429 or when the
+  latency climbs past MISTRAL_LATENCY_TOLERANCE times its usual value;
+- requests over either limit wait in line instead of failing, and a 429 is retried
+  after the delay it asks for, as long as that stays within MISTRAL_QUEUE_TIMEOUT
+  seconds of the request being made. Past that deadline the 429 is handed back, or
+  GatewayTimeout raised if the request never left the line.
+
+Conversations with an agent do not name a model, so `route_agent` tells the
+gateway which model an agent runs on. The time spent in line is the
+"mistral.queue" stage; the queue depth, requests in flight and current limit are
+gauges labelled by model.
+"""
+
+import asyncio
+import collections
+import contextlib
+import json
+import os
+import random
+import time
+
+import httpx
+
+from src import cassette
+from src.lazy import lazy_import
+from src.metrics import gauge, inc, span
+from src.ratelimit import TokenBucket, retry_after
+
+mistralai = lazy_import("mistralai")
+
+
+MISTRAL_REQUESTS_PER_SECOND = float(os.getenv("MISTRAL_REQUESTS_PER_SECOND", 20))
+MISTRAL_MODEL_RATES = {
+    model.strip(): float(rate)
+    for model, rate in (
+        pair.split("=") for pair in os.getenv("MISTRAL_MODEL_RATES", "").split(",") if pair
+    )
+}
+MISTRAL_INITIAL_CONCURRENCY = int(os.getenv("MISTRAL_INITIAL_CONCURRENCY", 16))
+MISTRAL_MAX_CONCURRENCY = int(os.getenv("MISTRAL_MAX_CONCURRENCY", 128))
+MISTRAL_LATENCY_TOLERANCE = float(os.getenv("MISTRAL_LATENCY_TOLERANCE", 2.0))
+MISTRAL_QUEUE_TIMEOUT = float(os.getenv("MISTRAL_QUEUE_TIMEOUT", 30))
+WORKERS = int(os.getenv("WORKERS", 1))
+
+# Backoff between retries of a 429 that does not say how long to wait, in seconds.
+BACKOFF = 0.25
+MAX_BACKOFF = 5.0
+
+
+class GatewayTimeout(httpx.TimeoutException):
+    pass
+
+
+class AdaptiveLimit:
+    """
+    A limit on the operations in flight, adjusted by additive increase and
+    multiplicative decrease. Waiters are served in arrival order.
+
+    Latencies are compared per kind of operation, to the lowest smoothed latency
+    seen for that kind, which is slowly forgotten so a lasting change is learned.
+    """
+
+    def __init__(
+        self,
+        initial: int = MISTRAL_INITIAL_CONCURRENCY,
+        minimum: int = 1,
+        maximum: int = MISTRAL_MAX_CONCURRENCY,
+        decrease: float = 0.5,
+        tolerance: float = MISTRAL_LATENCY_TOLERANCE,
+        cooldown: float = 1.0,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._decrease = decrease
+        self._tolerance = tolerance
+        self._cooldown = cooldown
+        self._decreased_at = 0.0
+        # kind -> [baseline, smoothed] latencies
+        self._latencies: dict[str, list[float]] = {}
+        self._waiters: collections.deque[asyncio.Future] = collections.deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: float | None = None) -> None:
+        """Takes a slot, waiting for one if needed. Raises TimeoutError after `timeout` seconds."""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up on it.
+                self.release()
+            else:
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def on_success(self, kind: str, latency: float) -> None:
+        latencies = self._latencies.setdefault(kind, [latency, latency])
+        latencies[1] += (latency - latencies[1]) * 0.2
+        latencies[0] = min(latencies[1], latencies[0] + (latencies[1] - latencies[0]) * 0.01)
+        if latencies[1] > self._tolerance * latencies[0]:
+            self._back_off()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._wake()
+
+    def on_rate_limited(self) -> None:
+        self._back_off()
+
+    def _back_off(self) -> None:
+        # The answers to requests sent before a decrease say nothing about the new limit.
+        now = time.monotonic()
+        if now - self._decreased_at >= self._cooldown:
+            self._decreased_at = now
+            self.limit = max(self.minimum, self.limit * self._decrease)
+
+
+class _Lane:
+    def __init__(self, model: str):
+        self.model = model
+        rate = MISTRAL_MODEL_RATES.get(model, MISTRAL_REQUESTS_PER_SECOND) / WORKERS
+        self.bucket = TokenBucket(rate)
+        self.limit = AdaptiveLimit()
+        self.queued = 0
+
+    def report(self) -> None:
+        gauge("mistral_queue_depth", self.queued, model=self.model)
+        gauge("mistral_in_flight", self.limit.in_flight, model=self.model)
+        gauge("mistral_concurrency_limit", int(self.limit.limit), model=self.model)
+
+
+_lanes: dict[str, _Lane] = {}
+# agent id -> model
+_agent_models: dict[str, str] = {}
+
+
+def route_agent(agent_id: str, model: str) -> None:
+    """Counts the conversations with agent `agent_id` against `model`."""
+    _agent_models[agent_id] = model
+
+
+def _lane_for(model: str) -> _Lane:
+    found = _lanes.get(model)
+    if found is None:
+        found = _lanes[model] = _Lane(model)
+    return found
+
+
+def _model_of(request: httpx.Request) -> str:
+    try:
+        body = json.loads(request.content or b"{}")
+    except (ValueError, httpx.RequestNotRead):
+        return "other"
+    if not isinstance(body, dict):
+        return "other"
+    return body.get("model") or _agent_models.get(body.get("agent_id"), "other")
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """A response body that gives back its slot once it is read and closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, lane: _Lane):
+        self._stream = stream
+        self._lane = lane
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._lane.limit.release()
+                self._lane.report()
+
+
+class GatewayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, queue_timeout: float | None = None):
+        self._transport = transport
+        self._queue_timeout = MISTRAL_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+
+    async def _enter(self, lane: _Lane, request: httpx.Request, deadline: float) -> None:
+        lane.queued += 1
+        lane.report()
+        try:
+            with span("mistral.queue", model=lane.model):
+                await lane.bucket.acquire(timeout=max(0.0, deadline - time.monotonic()))
+                await lane.limit.acquire(timeout=max(0.0, deadline - time.monotonic()))
+        except TimeoutError as e:
+            inc("mistral_queue_timeouts", model=lane.model)
+            raise GatewayTimeout(
+                f"Gave up waiting for a {lane.model} request slot after {self._queue_timeout:g}s",
+                request=request,
+            ) from e
+        finally:
+            lane.queued -= 1
+            lane.report()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        lane = _lane_for(_model_of(request))
+        deadline = time.monotonic() + self._queue_timeout
+        attempt = 0
+        while True:
+            await self._enter(lane, request, deadline)
+            started = time.monotonic()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except BaseException:
+                lane.limit.release()
+                lane.report()
+                raise
+            if response.status_code != 429:
+                lane.limit.on_success(request.url.path, time.monotonic() - started)
+                lane.report()
+                return httpx.Response(
+                    response.status_code,
+                    headers=response.headers,
+                    stream=_ReleasingStream(response.stream, lane),
+                    extensions=response.extensions,
+                    request=request,
+                )
+            try:
+                content = await response.aread()
+            finally:
+                await response.aclose()
+                lane.limit.release()
+            lane.limit.on_rate_limited()
+            lane.report()
+            inc("mistral_rate_limited", model=lane.model)
+            delay = retry_after(response)
+            if delay is None:
+                delay = min(MAX_BACKOFF, BACKOFF * 2**attempt) * random.uniform(0.5, 1.5)
+            if time.monotonic() + delay > deadline:
+                return httpx.Response(429, headers=response.headers, content=content, request=request)
+            inc("mistral_retries", model=lane.model)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+_client = None
+_client_loop = None
+
+
+def get_client():
+    """
+    The Mistral client of the process. Its connections belong to an event loop:
+    the blocking wrappers run each call in a fresh loop, so it is rebuilt when the
+    loop changes.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        http = httpx.AsyncClient(
+            transport=GatewayTransport(
+                cassette.wrap(
+                    httpx.AsyncHTTPTransport(
+                        limits=httpx.Limits(
+                            max_connections=MISTRAL_MAX_CONCURRENCY,
+                            max_keepalive_connections=MISTRAL_MAX_CONCURRENCY,
+                        )
+                    ),
+                    "mistral",
+                )
+            )
+        )
+        _client = mistralai.Mistral(
+            api_key=os.getenv("MISTRAL_API_KEY"),
+            server_url=os.getenv("MISTRAL_SERVER_URL"),
+            async_client=http,
+        )
+        _client_loop = loop
+    return _client
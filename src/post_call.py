@@ -0,0 +1,258 @@
+"""
+What a completed booking call turns into, without another model generation.
+
+The outcome of a call is read from its Bland summary, and the booking details
+from the summary where it states them (a time the restaurant offered instead of
+the one asked for, a different party size) and otherwise from the parameters the
+call was placed with. A confirmed booking comes with a Google Calendar link and
+an iCalendar (.ics) event for it.
+"""
+
+import re
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlencode
+from zoneinfo import ZoneInfo
+
+from src.extractor import extract_fields, find_times, normalize, parse_date, parse_time
+
+
+CALENDAR_TIMEZONE = ZoneInfo("Europe/Paris")
+# How long the calendar event of a reservation lasts.
+EVENT_DURATION = timedelta(hours=2)
+GOOGLE_CALENDAR_URL = "https://calendar.google.com/calendar/render"
+
+_DECLINED = re.compile(
+    r"fully booked|no (?:table|availability|answer)|not available|unavailable|"
+    r"(?:could|can)(?:n't|not| not) (?:book|accommodate|offer|take|seat|fit)|unable to|declined|"
+    r"closed|voicemail|did not answer|no one answered|ended before|hung up|"
+    r"no reservation|not (?:be )?(?:booked|reserved|confirmed)|cancell?ed"
+)
+# Past tense only: "will call back to confirm" has not booked anything.
+_CONFIRMED = re.compile(
+    r"\b(?:confirmed|booked|reserved)\b|reservation (?:is|was|has been) (?:made|set|taken)|"
+    r"(?:got|secured) (?:a|the) table"
+)
+_PENDING = re.compile(r"\b(?:will|would|to be|yet|pending|awaiting|once)\b")
+# What a refusal after a confirmation must be about to undo it: "they cannot
+# accommodate dogs" leaves the table booked.
+_ABOUT_BOOKING = re.compile(
+    r"\b(?:tables?|reserv\w*|book\w*|slots?|seat\w*|party|people|persons?|guests?|"
+    r"times?|date|day|evening|night|tonight)\b"
+)
+# A summary is read clause by clause: "8pm was not available, but they confirmed
+# 9pm" ends on the booking.
+_CLAUSE_END = re.compile(r"(?<=[.!?])\s+|\s*[;,]\s*|\s+(?:but|however|although|though|whereas)\s+")
+# Cues before a time that was asked for or turned down, not the one booked.
+_OTHER_TIME = re.compile(
+    r"(?:instead of|rather than|not|than|asked for|requested|wanted|wished)(?:\s+[^\s]+){0,3}\s*$"
+)
+_BOOKED_TIME = re.compile(r"\b(?:booked|confirmed|reserved|offered|at|for)(?:\s+[^\s]+){0,3}\s*$")
+
+
+def _clause_outcome(clause: str) -> str | None:
+    if _DECLINED.search(clause):
+        return "declined"
+    if _CONFIRMED.search(clause) and not _PENDING.search(clause):
+        return "confirmed"
+    return None
+
+
+def _about_booking(clause: str) -> bool:
+    return bool(_ABOUT_BOOKING.search(clause) or find_times(clause))
+
+
+def _clauses(summary: str | None) -> list[str]:
+    return [c for c in _CLAUSE_END.split(normalize(summary or "")) if c]
+
+
+def booking_outcome(summary: str | None) -> str:
+    """
+    Classifies a call summary as "confirmed", "declined" or "unknown". The last
+    clause stating an outcome decides, so an alternative accepted after the time
+    asked for was refused counts as confirmed. A refusal after a confirmation only
+    undoes it when it is about the booking ("but then they were fully booked");
+    otherwise ("parking is not available") the summary is left "unknown".
+    """
+    stated = [(c, o) for c in _clauses(summary) if (o := _clause_outcome(c))]
+    if not stated:
+        return "unknown"
+    if stated[-1][1] == "confirmed" or "confirmed" not in [o for _, o in stated]:
+        return stated[-1][1]
+    last = len(stated) - 1 - [o for _, o in stated][::-1].index("confirmed")
+    if any(_about_booking(c) for c, _ in stated[last + 1:]):
+        return "declined"
+    return "unknown"
+
+
+def _clause_time(clause: str) -> str | None:
+    """The time booked in `clause`: the one after "confirmed", "at"... when it holds several."""
+    times = [
+        (bool(_BOOKED_TIME.search(clause[:start])), time)
+        for start, time in find_times(clause)
+        if not _OTHER_TIME.search(clause[:start])
+    ]
+    cued = {t for booked, t in times if booked}
+    if len(cued) == 1:
+        return cued.pop()
+    found = {t for _, t in times}
+    return found.pop() if len(found) == 1 else None
+
+
+def _booked_time(summary: str | None) -> str | None:
+    """
+    The time of the booking stated by the summary: the one in the last confirming
+    clause, or else in the closest clause before it that did not refuse a time
+    ("they offered 9pm, which was accepted and confirmed").
+    """
+    clauses = _clauses(summary)
+    outcomes = [_clause_outcome(c) for c in clauses]
+    if "confirmed" not in outcomes:
+        return None
+    last = len(outcomes) - 1 - outcomes[::-1].index("confirmed")
+    for clause, outcome in zip(clauses[last::-1], outcomes[last::-1]):
+        if outcome == "declined":
+            continue
+        found = _clause_time(clause)
+        if found:
+            return found
+    return None
+
+
+def booking_details(call: dict | None, summary: str | None) -> dict:
+    """
+    The date, time, party size and name of the booking made by a call.
+    Arguments:
+        call: The call as recorded in the call store, if it is known
+        summary: The summary of the call
+    Returns:
+        The details, None where neither the summary nor the call gives them.
+    """
+    call = call or {}
+    summary = summary or ""
+    placed = call.get("placed_at")
+    placed_on = datetime.fromtimestamp(placed, CALENDAR_TIMEZONE).date() if placed else None
+    stated = extract_fields(summary, placed_on)
+
+    booked_on = stated["date"] or call.get("reservation_date")
+    if booked_on is None and call.get("date_of_reservation"):
+        parsed = parse_date(call["date_of_reservation"], placed_on)
+        booked_on = parsed.isoformat() if parsed else None
+    requested_time = call.get("time_of_reservation")
+    return {
+        "date": booked_on,
+        "time": (
+            _booked_time(summary)
+            or stated["time"]
+            or (parse_time(requested_time) if requested_time else None)
+        ),
+        "number_of_people": stated["number_of_people"] or call.get("number_of_people"),
+        "reservation_name": stated["reservation_name"] or call.get("reservation_name"),
+    }
+
+
+def _event(call: dict, details: dict) -> dict | None:
+    if not details["date"] or not details["time"]:
+        return None
+    start = datetime.combine(
+        date.fromisoformat(details["date"]),
+        datetime.strptime(details["time"], "%H:%M").time(),
+        CALENDAR_TIMEZONE,
+    )
+    restaurant = call.get("restaurant_name") or "the restaurant"
+    lines = []
+    if details["number_of_people"]:
+        lines.append(f"Table for {details['number_of_people']}")
+    if details["reservation_name"]:
+        lines.append(f"Reservation name: {details['reservation_name']}")
+    if call.get("phone_number"):
+        lines.append(f"Restaurant phone: {call['phone_number']}")
+    return {
+        "uid": f"{call.get('call_id')}@x-hec-concierge",
+        "title": f"Reservation at {restaurant}",
+        "location": restaurant,
+        "description": "\n".join(lines),
+        "start": start,
+        "end": start + EVENT_DURATION,
+        "stamp": datetime.fromtimestamp(call.get("completed_at") or call.get("placed_at") or 0, timezone.utc),
+    }
+
+
+def google_calendar_link(event: dict) -> str:
+    """A link that opens Google Calendar on a new event, filled in."""
+    local = "%Y%m%dT%H%M%S"
+    params = {
+        "action": "TEMPLATE",
+        "text": event["title"],
+        "dates": f"{event['start'].strftime(local)}/{event['end'].strftime(local)}",
+        "ctz": event["start"].tzinfo.key,
+        "details": event["description"],
+        "location": event["location"],
+    }
+    return f"{GOOGLE_CALENDAR_URL}?{urlencode(params)}"
+
+
+def _ics_text(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Splits a content line into lines of at most 75 octets, as RFC 5545 asks."""
+    folded, current = [], ""
+    for char in line:
+        if len((current + char).encode()) > 75:
+            folded.append(current)
+            current = " "
+        current += char
+    return "\r\n".join(folded + [current])
+
+
+def ics_event(event: dict) -> str:
+    """The event as an iCalendar file, with its times in UTC."""
+    utc = "%Y%m%dT%H%M%SZ"
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//X-HEC Concierge//Bookings//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "BEGIN:VEVENT",
+        f"UID:{event['uid']}",
+        f"DTSTAMP:{event['stamp'].astimezone(timezone.utc).strftime(utc)}",
+        f"DTSTART:{event['start'].astimezone(timezone.utc).strftime(utc)}",
+        f"DTEND:{event['end'].astimezone(timezone.utc).strftime(utc)}",
+        f"SUMMARY:{_ics_text(event['title'])}",
+        f"LOCATION:{_ics_text(event['location'])}",
+        f"DESCRIPTION:{_ics_text(event['description'])}",
+        "END:VEVENT",
+        "END:VCALENDAR",
+    ]
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
+
+
+def call_result(
+    call_id: str, call: dict | None, summary: str | None, transcript: str | None
+) -> dict:
+    """
+    The finished result of a completed call: its outcome, the booking details and,
+    for a confirmed booking, its calendar link and .ics event.
+    """
+    outcome = booking_outcome(summary)
+    details = booking_details(call, summary)
+    call = {**(call or {}), "call_id": call_id}
+    result = {
+        "call_id": call_id,
+        "outcome": outcome,
+        "restaurant_name": call.get("restaurant_name"),
+        "booking": details,
+    }
+    event = _event(call, details) if outcome == "confirmed" else None
+    if event is not None:
+        result["calendar_link"] = google_calendar_link(event)
+        result["ics"] = ics_event(event)
+    elif outcome == "confirmed":
+        result["note"] = "The booking was confirmed, but its date or time could not be determined."
+    result["summary"] = summary
+    result["transcript"] = transcript
+    return result
@@ -1,9 +1,61 @@
+import asyncio
 import json
 import re
 import os
-from datetime import datetime
-from mistralai import Mistral
-import numpy as np
+from datetime import date, datetime
+
+from src.agents import get_agent_id, start_conversation
+from src.cache import TTLCache, criteria_key, normalize_query
+from src.extractor import (
+    REQUIRED_FIELDS,
+    agrees_with_rules,
+    ambiguous_fields,
+    extract_delta,
+    missed_cues,
+    pre_extract,
+)
+from src.metrics import inc, span
+from src.mistral_gateway import get_client
+from src import routing
+from src.schemas import ExtractedBooking, Venue
+from src.semantic import find_similar, remember
+from src.singleflight import SingleFlight
+from src.sport_catalog import locate
+from src.sessions import create_session_store, merge_fields
+from src.structured import parse_object
+from src.venue_store import ANY_PRICE, VenueStore, price_band
+
+
+RESTAURANT_AGENT = {
+    "model": "mistral-large-latest",
+    "name": "Web Search Restaurant Finder",
+    "description": "Agent that finds real restaurants using web search.",
+    "instructions": "You must use your web_search tool to find one single real restaurant matching the user's request. Your final answer must be ONLY a valid JSON object with the keys 'name' and 'address' and 'phone_number'. Do not include any other text.",
+    "tools": [{"type": "web_search"}],
+}
+
+SEARCH_CRITERIA = REQUIRED_FIELDS + ["price", "allergies"]
+
+# Stages reported to the `progress` callback of `find_restaurant_async`.
+PROGRESS_STEPS = 4
+# Requests `find_restaurants_async` accepts at once.
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 50))
+
+# Query -> extracted JSON, and normalized search criteria -> restaurant found.
+EXTRACTION_CACHE = TTLCache(
+    "restaurant_extraction", ttl=float(os.getenv("EXTRACTION_CACHE_TTL", 24 * 3600))
+)
+SEARCH_CACHE = TTLCache(
+    "restaurant_search", ttl=float(os.getenv("SEARCH_CACHE_TTL", 3600))
+)
+VENUE_STORE = VenueStore()
+# Fields extracted in the previous turns of a booking, by session id.
+SESSIONS = create_session_store()
+# Identical extractions and searches running at the same time share one request.
+EXTRACTIONS = SingleFlight("restaurant_extraction")
+SEARCHES = SingleFlight("restaurant_search")
+# The `on_field` callbacks of the requests waiting on each extraction in flight, by key.
+_FIELD_LISTENERS: dict[str, list] = {}
 
 
 def parse_time(time_str: str | None) -> str | None:
@@ -52,20 +104,216 @@ def parse_price(price_str: str | None) -> dict | None:
     return price_data
 
 
-def find_restaurant(user_query: str) -> str:
+async def _no_progress(step: int, message: str) -> None:
+    pass
+
+
+async def find_restaurant_async(
+    user_query: str, progress=_no_progress, session_id: str | None = None
+) -> str:
     """
     Analyzes a user's request for a restaurant.
 
     If the query has enough information, it performs a web search.
     If not, it requests the missing information.
     Once a restaurant is found, it asks for a name and time flexibility for the reservation.
+
+    `progress(step, message)` is awaited at each of the PROGRESS_STEPS stages, and
+    reports the extracted details as soon as they exist. Cancelling this coroutine
+    aborts the Mistral requests in flight.
+
+    With a `session_id`, the details extracted in the previous turns of the same
+    session are kept, and a follow-up message only needs to add the missing ones.
+    """
+    with span("tool.cherche_restaurant"):
+        return await _find_restaurant(get_client(), user_query, progress, session_id)
+
+
+def find_restaurant(user_query: str, session_id: str | None = None) -> str:
+    """Blocking wrapper around `find_restaurant_async`."""
+    return asyncio.run(find_restaurant_async(user_query, session_id=session_id))
+
+
+async def find_restaurants_async(user_queries: list[str], max_concurrency: int = 8) -> dict:
+    """
+    Resolves several independent restaurant requests at once.
+
+    The extractions run concurrently, at most `max_concurrency` at a time, and each
+    search starts as soon as its request is understood. Requests with the same
+    search criteria share one search. An error in one request does not affect the
+    others.
+    Returns:
+        {"results": [...], "searches": n}, with one result per request, in order:
+        its query, status ("found", "missing_info" or "error"), the extracted
+        details and the reply, or the error.
+    """
+    if not user_queries:
+        raise ValueError("No requests given.")
+    if len(user_queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} requests can be searched at once.")
+    with span("tool.cherche_restaurants"):
+        client = get_client()
+        setup = asyncio.create_task(get_agent_id(client, RESTAURANT_AGENT))
+        setup.add_done_callback(lambda task: task.cancelled() or task.exception())
+        slots = asyncio.Semaphore(max(1, max_concurrency))
+        try:
+            resolved = await asyncio.gather(
+                *(_resolve(client, user_query, slots) for user_query in user_queries)
+            )
+        finally:
+            setup.cancel()
+    searches = {key for _, key in resolved if key is not None}
+    return {"results": [result for result, _ in resolved], "searches": len(searches)}
+
+
+async def _resolve(client, user_query: str, slots: asyncio.Semaphore) -> tuple[dict, str | None]:
+    """The result of one request of a batch, and the key of its search if it needed one."""
+    try:
+        async with slots:
+            extracted_info, extraction_path = await _extract(client, user_query)
+    except Exception as e:
+        error = f"Could not extract details from your request. {e}"
+        return {"query": user_query, "status": "error", "error": error}, None
+    inc("extractions", path=extraction_path)
+    reply = await _reply(client, extracted_info, lookup=_EarlyLookup(client, user_query))
+    result = {
+        "query": user_query,
+        "extraction_path": extraction_path,
+        "details": extracted_info,
+    }
+    if any(extracted_info.get(field) is None for field in REQUIRED_FIELDS):
+        return {**result, "status": "missing_info", "reply": reply}, None
+    key = criteria_key(extracted_info, SEARCH_CRITERIA)
+    if reply.startswith("Error:"):
+        return {**result, "status": "error", "error": reply.removeprefix("Error: ")}, key
+    return {**result, "status": "found", "reply": reply}, key
+
+
+async def _find_restaurant(
+    client, user_query: str, progress, session_id: str | None = None
+) -> str:
+    # The web-search agent is set up while the request is being extracted, and
+    # abandoned if the search turns out not to be needed.
+    setup = asyncio.create_task(get_agent_id(client, RESTAURANT_AGENT))
+    setup.add_done_callback(lambda task: task.cancelled() or task.exception())
+    known = await SESSIONS.get_async(session_id) if session_id else None
+    # A follow-up message alone does not describe the restaurant wanted.
+    lookup = _EarlyLookup(client, user_query if known is None else None)
+    try:
+        await progress(0, "Extracting the booking details")
+        try:
+            if known is None:
+                extracted_info, extraction_path = await _extract(
+                    client, user_query, lookup.on_field
+                )
+            else:
+                extracted_info, extraction_path = await _extract_follow_up(
+                    client, user_query, known, lookup.on_field
+                )
+        except Exception as e:
+            return f"Error: Could not extract details from your request. {e}"
+        if session_id:
+            await SESSIONS.set_async(session_id, extracted_info)
+        inc("extractions", path=extraction_path)
+        await progress(
+            1, f"Understood ({extraction_path} extraction): {json.dumps(extracted_info)}"
+        )
+
+        reply = await _reply(client, extracted_info, progress, bool(session_id), lookup)
+        await progress(PROGRESS_STEPS, "Done")
+        return f"{reply}\n(extraction path: {extraction_path})"
+    finally:
+        setup.cancel()
+        lookup.cancel()
+
+
+async def _extract(client, user_query: str, on_field=None) -> tuple[dict, str]:
     """
+    Extracts the booking details of a new request, and how they were extracted.
+    `on_field(fields)` sees the fields of an LLM extraction as they stream in.
+    """
+    # Queries phrased in a regular way are extracted locally, without the LLM.
+    extracted_info = pre_extract(user_query)
+    if extracted_info is not None:
+        return extracted_info, "rules"
+    # Relative dates ("tomorrow") only mean the same thing on the same day.
+    key = f"{date.today().isoformat()}|{normalize_query(user_query)}"
+    extracted_info = await EXTRACTION_CACHE.get_async(key)
+    if extracted_info is None:
+        # The shared extraction streams its fields to the requests still waiting
+        # for it, not to the one that started it, which may have been cancelled.
+        listeners = _FIELD_LISTENERS.setdefault(key, [])
+        if on_field:
+            listeners.append(on_field)
+        try:
+            extracted_info = await EXTRACTIONS.do(
+                key,
+                lambda: _extract_with_llm(
+                    client, user_query, lambda fields: [f(fields) for f in list(listeners)]
+                ),
+            )
+        finally:
+            if on_field:
+                listeners.remove(on_field)
+            if not listeners and _FIELD_LISTENERS.get(key) is listeners:
+                del _FIELD_LISTENERS[key]
+        await EXTRACTION_CACHE.set_async(key, extracted_info)
+    return extracted_info, "llm"
+
 
-    extraction_model = "mistral-large-latest"
-    agent_model = "mistral-large-latest"
+async def _extract_follow_up(
+    client, user_query: str, known: dict, on_field=None
+) -> tuple[dict, str]:
+    """
+    Merges what a follow-up message adds or changes into the details known from the
+    previous turns. The LLM only sees the new message, and is only asked when the
+    rules find nothing in it, leave required details missing, or cannot read a detail
+    the message mentions (a name, "9pm rather than 7pm"): left out of the delta, it
+    would silently keep its old value.
+    """
+    delta = extract_delta(user_query)
+    merged = merge_fields(known, delta)
+    if (
+        delta
+        and not missed_cues(user_query, delta)
+        and not ambiguous_fields(user_query, delta)
+        and all(merged.get(field) is not None for field in REQUIRED_FIELDS)
+    ):
+        return merged, "session+rules"
+    delta = await _extract_delta_with_llm(
+        client,
+        user_query,
+        known,
+        on_field and (lambda fields: on_field(merge_fields(known, fields))),
+    )
+    return merge_fields(known, delta), "session+llm"
 
-    client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
 
+async def _extract_delta_with_llm(
+    client, user_query: str, known: dict, on_field=None
+) -> dict:
+    extraction_prompt = f"""
+    You are a restaurant booking assistant. These booking details are already known:
+    {json.dumps(known)}
+    Analyze the user's follow-up message and extract only the details it adds or
+    changes, into a strict JSON format using the same keys: "restaurant_type",
+    "neighborhood", "allergies", "time", "date", "number_of_people", "price",
+    "reservation_name", "time_flexibility". Leave out the keys the message does not mention.
+    Do not add any text before or after the JSON object.
+    User request: "{user_query}"
+    """
+    delta, _ = await routing.extract(
+        client,
+        extraction_prompt,
+        ExtractedBooking,
+        plausible=lambda fields: agrees_with_rules(user_query, fields),
+        partial=True,
+        on_field=on_field,
+    )
+    return delta
+
+
+async def _extract_with_llm(client, user_query: str, on_field=None) -> dict:
     extraction_prompt = f"""
     You are a restaurant booking assistant. Analyze the user's request and
     extract the following information into a strict JSON format.
@@ -75,33 +323,33 @@ def find_restaurant(user_query: str) -> str:
     Do not add any text before or after the JSON object.
     User request: "{user_query}"
     """
-    try:
-        extraction_response = client.chat.complete(
-            model=extraction_model,
-            messages=[{"role": "user", "content": extraction_prompt}],
-            response_format={"type": "json_object"},
-        )
-        extracted_info = json.loads(extraction_response.choices[0].message.content)
-    except Exception as e:
-        return f"Error: Could not extract details from your request. {e}"
+    # A small model answers first. The fields the rules did find in the query are
+    # used to check its answer before trusting it.
+    extracted_info, _ = await routing.extract(
+        client,
+        extraction_prompt,
+        ExtractedBooking,
+        plausible=lambda fields: agrees_with_rules(user_query, fields),
+        on_field=on_field,
+    )
+    return extracted_info
+
 
+async def _reply(
+    client,
+    extracted_info: dict,
+    progress=_no_progress,
+    in_session: bool = False,
+    lookup=None,
+) -> str:
     extracted_info["time"] = parse_time(extracted_info.get("time"))
     extracted_info["number_of_people"] = parse_people(
         extracted_info.get("number_of_people")
     )
     extracted_info["price"] = parse_price(extracted_info.get("price"))
 
-    required_fields_for_search = [
-        "restaurant_type",
-        "neighborhood",
-        "date",
-        "time",
-        "number_of_people",
-    ]
     missing_info = [
-        field
-        for field in required_fields_for_search
-        if extracted_info.get(field) is None
+        field for field in REQUIRED_FIELDS if extracted_info.get(field) is None
     ]
 
     if missing_info:
@@ -115,7 +363,11 @@ def find_restaurant(user_query: str) -> str:
         if found_details:
             message += f"Here's what I understood: {json.dumps(found_details)}. "
 
-        message += f"Please provide the missing details: {', '.join(missing_info).replace('_', ' ')}. Try sending all the information in one message."
+        message += f"Please provide the missing details: {', '.join(missing_info).replace('_', ' ')}. "
+        if in_session:
+            message += "Just send the missing details, I will remember the rest."
+        else:
+            message += "Try sending all the information in one message."
         return message
     else:
         price_info = extracted_info.get("price")
@@ -133,43 +385,24 @@ def find_restaurant(user_query: str) -> str:
                 price_msg = f"starting from {price_info['min']}€"
 
         try:
-            websearch_agent = client.beta.agents.create(
-                model=agent_model,
-                name="Web Search Restaurant Finder",
-                description="Agent that finds real restaurants using web search.",
-                instructions="You must use your web_search tool to find one single real restaurant matching the user's request. Your final answer must be ONLY a valid JSON object with the keys 'name' and 'address' and 'phone_number'. Do not include any other text.",
-                tools=[{"type": "web_search"}],
-            )
-
-            search_prompt = f"""
-            Find a single, real, and well-rated restaurant matching these criteria:
-            - Cuisine: {extracted_info.get('restaurant_type')}
-            - Location/Neighborhood: {extracted_info.get('neighborhood')}
-            - Price: {price_msg}
-            - Note: This is a booking for {extracted_info.get('number_of_people')} people on {extracted_info.get('date')} at {extracted_info.get('time')}, try making sure there is room at this time for those persons.
-            - Allergies to note: {extracted_info.get('allergies', 'None')}
-            """
-
-            response = client.beta.conversations.start(
-                agent_id=websearch_agent.id, inputs=search_prompt
-            )
-
-            final_message_content = next(
-                (
-                    output.content
-                    for output in response.outputs
-                    if hasattr(output, "type") and output.type == "message.output"
-                ),
-                None,
-            )
-
-            if not final_message_content:
-                raise ValueError("The search agent did not return a final answer.")
-
-            clean_json_str = re.sub(
-                r"^```json\s*|\s*```$", "", final_message_content, flags=re.MULTILINE
-            )
-            restaurant_found_dict = json.loads(clean_json_str)
+            await progress(2, "Looking for a matching restaurant")
+            key = criteria_key(extracted_info, SEARCH_CRITERIA)
+            restaurant_found_dict = await SEARCH_CACHE.get_async(key)
+            if restaurant_found_dict is None:
+                # Known venues are looked up by each request; only the web search
+                # is shared, and it uses nothing this request owns.
+                restaurant_found_dict = await (lookup or _EarlyLookup(client)).known_venue(
+                    extracted_info["restaurant_type"],
+                    extracted_info["neighborhood"],
+                    price_band(extracted_info.get("price")),
+                    price_msg,
+                )
+                if restaurant_found_dict is None:
+                    await progress(3, "Searching the web for a restaurant")
+                    restaurant_found_dict = await SEARCHES.do(
+                        key, lambda: _find_venue(client, extracted_info, price_msg)
+                    )
+                await SEARCH_CACHE.set_async(key, restaurant_found_dict)
 
             name = restaurant_found_dict.get("name", "N/A")
             address = restaurant_found_dict.get("address", "N/A")
@@ -202,6 +435,122 @@ def find_restaurant(user_query: str) -> str:
             return f"Error: I had trouble searching for a restaurant. {e}"
 
 
+def _venue_criteria(cuisine: str, neighborhood: str, band: str) -> dict:
+    return {"cuisine": cuisine, "neighborhood": neighborhood, "price_band": band}
+
+
+async def _known_venue(
+    client, request: str | None, cuisine: str, neighborhood: str, band: str, price_msg: str
+) -> dict | None:
+    """
+    The venue store's fresh match, else the recently found venue of the same cuisine
+    and price band, around the requested neighborhood, closest in meaning to the
+    user's `request` (or to the criteria, without one).
+    """
+    with span("venue_store.lookup"):
+        venue = VENUE_STORE.lookup(cuisine, neighborhood, band)
+    if venue is None:
+        near = locate(neighborhood)
+        criteria = {"cuisine": cuisine}
+        if band != ANY_PRICE:
+            criteria["price_band"] = band
+        if near is None:
+            criteria["neighborhood"] = neighborhood
+        venue = await find_similar(
+            client,
+            request or f"{cuisine} restaurant in {neighborhood}, Paris, {price_msg}",
+            "restaurant",
+            criteria,
+            near,
+        )
+    return venue
+
+
+class _EarlyLookup:
+    """
+    Looks for a known venue as soon as the cuisine and neighborhood have streamed
+    in, assuming no price constraint, while the rest of the extraction is still
+    being generated. The result is only used if the final details agree.
+    """
+
+    def __init__(self, client, request: str | None = None):
+        self._client = client
+        self._request = request
+        self._key = None
+        self._task = None
+
+    def on_field(self, fields: dict) -> None:
+        cuisine, neighborhood = fields.get("restaurant_type"), fields.get("neighborhood")
+        if self._task is not None or not isinstance(cuisine, str) or not isinstance(neighborhood, str):
+            return
+        self._key = (cuisine, neighborhood, ANY_PRICE)
+        self._task = asyncio.create_task(
+            _known_venue(self._client, self._request, cuisine, neighborhood, ANY_PRICE, "any price")
+        )
+        self._task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def known_venue(
+        self, cuisine: str, neighborhood: str, band: str, price_msg: str
+    ) -> dict | None:
+        if self._task is not None:
+            used = self._key == (cuisine, neighborhood, band)
+            inc("early_venue_lookups", outcome="used" if used else "discarded")
+            if used:
+                return await self._task
+        return await _known_venue(self._client, self._request, cuisine, neighborhood, band, price_msg)
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+
+async def _find_venue(client, extracted_info: dict, price_msg: str) -> dict:
+    """Searches the web for a restaurant, and records it for later requests like this one."""
+    cuisine = extracted_info["restaurant_type"]
+    neighborhood = extracted_info["neighborhood"]
+    band = price_band(extracted_info.get("price"))
+    venue = await _search_restaurant(client, extracted_info, price_msg)
+    VENUE_STORE.record(venue, cuisine, neighborhood, band)
+    await remember(
+        client,
+        f"{venue.get('name')}, {cuisine} restaurant in {neighborhood}, Paris, "
+        f"{price_msg}, {venue.get('address')}",
+        venue,
+        "restaurant",
+        _venue_criteria(cuisine, neighborhood, band),
+        locate(neighborhood),
+    )
+    return venue
+
+
+async def _search_restaurant(client, extracted_info: dict, price_msg: str) -> dict:
+    search_prompt = f"""
+    Find a single, real, and well-rated restaurant matching these criteria:
+    - Cuisine: {extracted_info.get('restaurant_type')}
+    - Location/Neighborhood: {extracted_info.get('neighborhood')}
+    - Price: {price_msg}
+    - Note: This is a booking for {extracted_info.get('number_of_people')} people on {extracted_info.get('date')} at {extracted_info.get('time')}, try making sure there is room at this time for those persons.
+    - Allergies to note: {extracted_info.get('allergies', 'None')}
+    """
+
+    response = await start_conversation(client, RESTAURANT_AGENT, search_prompt)
+
+    final_message_content = next(
+        (
+            output.content
+            for output in response.outputs
+            if hasattr(output, "type") and output.type == "message.output"
+        ),
+        None,
+    )
+
+    if not final_message_content:
+        raise ValueError("The search agent did not return a final answer.")
+
+    with span("search.parse"):
+        return parse_object(final_message_content, Venue).model_dump(exclude_none=True)
+
+
 if __name__ == "__main__":
 
     user_call_1 = "I need a reservation for an Italian place in Paris 16 for 2 people on October 19th, 2025 at 7:00 PM. Price range is 20-50€. Please note a Gluten allergy."
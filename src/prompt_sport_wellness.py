@@ -1,10 +1,44 @@
+import asyncio
 import json
 import re
-from datetime import datetime
-from mistralai import Mistral
-from dotenv import load_dotenv
+from datetime import date, datetime
 import os
 
+from src.agents import start_conversation
+from src.cache import TTLCache, criteria_key, normalize_query
+from src import routing
+from src.extractor import agrees_with_rules, parse_neighborhood
+from src.metrics import span
+from src.mistral_gateway import get_client
+from src.schemas import ExtractedSportBooking, Venue
+from src.semantic import find_similar, remember
+from src.singleflight import SingleFlight
+from src.sport_catalog import get_catalog, locate, normalize_sport, wellness_for
+from src.structured import parse_object
+
+
+SPORT_AGENT = {
+    "model": "mistral-large-latest",
+    "name": "Web Search Sport Finder",
+    "description": "Finds real sports venues (tennis, padel, gym, etc.)",
+    "instructions": "Use your web_search tool to find one real sports venue matching the request. \
+                          Return JSON: {'name','address','phone_number'} only.",
+    "tools": [{"type": "web_search"}],
+}
+
+REQUIRED_FIELDS = ["sport_type", "location", "date", "time", "number_of_people"]
+
+# Query -> extracted JSON, and normalized search criteria -> venue found.
+EXTRACTION_CACHE = TTLCache(
+    "sport_extraction", ttl=float(os.getenv("EXTRACTION_CACHE_TTL", 24 * 3600))
+)
+SEARCH_CACHE = TTLCache("sport_search", ttl=float(os.getenv("SEARCH_CACHE_TTL", 3600)))
+# Catalog venue (name and address) -> its phone number, "" when none was found.
+PHONE_CACHE = TTLCache("sport_phone", ttl=float(os.getenv("PHONE_CACHE_TTL", 30 * 24 * 3600)))
+# Identical extractions and searches running at the same time share one request.
+EXTRACTIONS = SingleFlight("sport_extraction")
+SEARCHES = SingleFlight("sport_search")
+PHONES = SingleFlight("sport_phone")
 
 def parse_time(time_str: str | None) -> str | None:
     if not time_str:
@@ -30,15 +64,21 @@ def parse_people(people_str: str | None) -> int | None:
     return None
 
 
-def find_sports_wellness(user_query: str) -> str:
+async def find_sports_wellness_async(user_query: str) -> str:
     """
     Analyze user request for a sports activity, then suggest a matching wellness activity.
     Returns JSON with both.
     """
-    client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
-    extraction_model = "mistral-large-latest"
-    agent_model = "mistral-large-latest"
+    with span("tool.find_sports_wellness"):
+        return await _find_sports_wellness(get_client(), user_query)
 
+
+def find_sports_wellness(user_query: str) -> str:
+    """Blocking wrapper around `find_sports_wellness_async`."""
+    return asyncio.run(find_sports_wellness_async(user_query))
+
+
+async def _find_sports_wellness(client, user_query: str) -> str:
     # Step 1: Extract information
     extraction_prompt = f"""
     You are a sports and wellness booking assistant. Analyze the user's request and
@@ -49,15 +89,25 @@ def find_sports_wellness(user_query: str) -> str:
     User request: "{user_query}"
     """
 
-    try:
-        extraction_response = client.chat.complete(
-            model=extraction_model,
-            messages=[{"role": "user", "content": extraction_prompt}],
-            response_format={"type": "json_object"},
-        )
-        extracted_info = json.loads(extraction_response.choices[0].message.content)
-    except Exception as e:
-        return f"Error: Could not extract details. {e}"
+    # Relative dates ("tomorrow") only mean the same thing on the same day.
+    extraction_key = f"{date.today().isoformat()}|{normalize_query(user_query)}"
+    extracted_info = await EXTRACTION_CACHE.get_async(extraction_key)
+    if extracted_info is None:
+        try:
+            extracted_info, _ = await EXTRACTIONS.do(
+                extraction_key,
+                lambda: routing.extract(
+                    client,
+                    extraction_prompt,
+                    ExtractedSportBooking,
+                    plausible=lambda fields: agrees_with_rules(
+                        user_query, fields, keys=("date", "time", "number_of_people")
+                    ),
+                ),
+            )
+        except Exception as e:
+            return f"Error: Could not extract details. {e}"
+        await EXTRACTION_CACHE.set_async(extraction_key, extracted_info)
 
     # Clean extracted info
     extracted_info["time"] = parse_time(extracted_info.get("time"))
@@ -66,8 +116,7 @@ def find_sports_wellness(user_query: str) -> str:
     )
 
     # Step 2: Check if enough info to proceed
-    required_fields = ["sport_type", "location", "date", "time", "number_of_people"]
-    missing_info = [f for f in required_fields if extracted_info.get(f) is None]
+    missing_info = [f for f in REQUIRED_FIELDS if extracted_info.get(f) is None]
 
     if missing_info:
         found_details = {k: v for k, v in extracted_info.items() if v is not None}
@@ -80,61 +129,43 @@ def find_sports_wellness(user_query: str) -> str:
             indent=2,
         )
 
-    try:
-        websearch_agent = client.beta.agents.create(
-            model=agent_model,
-            name="Web Search Sport Finder",
-            description="Finds real sports venues (tennis, padel, gym, etc.)",
-            instructions="Use your web_search tool to find one real sports venue matching the request. \
-                          Return JSON: {'name','address','phone_number'} only.",
-            tools=[{"type": "web_search"}],
-        )
-
-        search_prompt = f"""
-        Find one sports venue for:
-        - Sport: {extracted_info.get('sport_type')}
-        - Location: {extracted_info.get('location')}
-        - Date: {extracted_info.get('date')}
-        - Time: {extracted_info.get('time')}
-        - People: {extracted_info.get('number_of_people')}
-        """
-
-        response = client.beta.conversations.start(
-            agent_id=websearch_agent.id, inputs=search_prompt
+    # Step 3: Nearest open venues from the local catalog, or a web search
+    with span("search.catalog"):
+        nearby = get_catalog().find(
+            extracted_info.get("sport_type"),
+            extracted_info.get("location"),
+            extracted_info.get("date"),
+            extracted_info.get("time"),
         )
+    sport_found, alternatives = None, []
+    if nearby:
+        # The call tool needs the phone number, which the catalog does not keep.
+        try:
+            phone_number = await _venue_phone(client, nearby[0])
+        except Exception:
+            phone_number = None
+        if phone_number:
+            sport_found = {**nearby[0], "phone_number": phone_number}
+            alternatives = nearby[1:]
+    if sport_found is None:
+        try:
+            search_key = criteria_key(extracted_info, REQUIRED_FIELDS)
+            sport_found = await SEARCH_CACHE.get_async(search_key)
+            if sport_found is None:
+                sport_found = await _similar_venue(client, user_query, extracted_info) or await SEARCHES.do(search_key, lambda: _find_venue(client, extracted_info))
+                await SEARCH_CACHE.set_async(search_key, sport_found)
+        except Exception as e:
+            return f"Error during sport search: {e}"
 
-        final_message_content = next(
-            (
-                o.content
-                for o in response.outputs
-                if hasattr(o, "type") and o.type == "message.output"
-            ),
-            None,
-        )
-
-        clean_json_str = re.sub(
-            r"^```json\s*|\s*```$", "", final_message_content, flags=re.MULTILINE
-        )
-        sport_found = json.loads(clean_json_str)
-
-    except Exception as e:
-        return f"Error during sport search: {e}"
-
-    mapping = {
-        "tennis": "Massage dos et épaules",
-        "padel": "Massage dos et bras",
-        "fitness": "Massage jambes ou full body",
-        "running": "Massage jambes",
-        "escalade": "Massage avant-bras et dos",
-    }
-    wellness = mapping.get(
-        extracted_info.get("sport_type", "").lower(), "Massage récupération générale"
-    )
+    wellness = wellness_for(extracted_info.get("sport_type"))
 
+    booking = {"venue": sport_found, "details": extracted_info}
+    if alternatives:
+        booking["alternatives"] = alternatives
     return json.dumps(
         {
             "status": "success",
-            "sport_booking": {"venue": sport_found, "details": extracted_info},
+            "sport_booking": booking,
             "wellness_suggestion": {
                 "type": wellness,
                 "note": f"Recommended after {extracted_info.get('sport_type')}",
@@ -144,6 +175,86 @@ def find_sports_wellness(user_query: str) -> str:
     )
 
 
+def _venue_criteria(extracted_info: dict) -> dict:
+    sport, location = extracted_info.get("sport_type"), extracted_info.get("location")
+    return {
+        "sport": normalize_sport(sport) or sport,
+        "location": parse_neighborhood(location or "") or location,
+    }
+
+
+async def _similar_venue(client, user_query: str, extracted_info: dict) -> dict | None:
+    """A recently found venue for the same sport around the requested location."""
+    criteria = _venue_criteria(extracted_info)
+    near = locate(extracted_info.get("location"))
+    if near is not None:
+        del criteria["location"]
+    return await find_similar(client, user_query, "sport", criteria, near)
+
+
+async def _find_venue(client, extracted_info: dict) -> dict:
+    """Searches the web for a venue, and indexes it for later requests like this one."""
+    venue = await _search_sport(client, extracted_info)
+    await remember(
+        client,
+        f"{venue.get('name')}, {extracted_info.get('sport_type')} venue in "
+        f"{extracted_info.get('location')}, {venue.get('address')}",
+        venue,
+        "sport",
+        _venue_criteria(extracted_info),
+        locate(extracted_info.get("location")),
+    )
+    return venue
+
+
+async def _venue_phone(client, venue: dict) -> str | None:
+    """The phone number of a catalog venue, looked up once by the search agent."""
+    key = criteria_key(venue, ["name", "address"])
+    phone_number = await PHONE_CACHE.get_async(key)
+    if phone_number is None:
+        prompt = f"""
+    Find the phone number of this sports venue:
+    - Name: {venue['name']}
+    - Address: {venue['address']}, Paris
+    """
+        found = await PHONES.do(key, lambda: _ask_agent(client, prompt))
+        phone_number = found.get("phone_number") or ""
+        await PHONE_CACHE.set_async(key, phone_number)
+    return phone_number or None
+
+
+async def _search_sport(client, extracted_info: dict) -> dict:
+    search_prompt = f"""
+    Find one sports venue for:
+    - Sport: {extracted_info.get('sport_type')}
+    - Location: {extracted_info.get('location')}
+    - Date: {extracted_info.get('date')}
+    - Time: {extracted_info.get('time')}
+    - People: {extracted_info.get('number_of_people')}
+    """
+    return await _ask_agent(client, search_prompt)
+
+
+async def _ask_agent(client, prompt: str) -> dict:
+    """The venue the web-search agent answers `prompt` with."""
+    response = await start_conversation(client, SPORT_AGENT, prompt)
+
+    final_message_content = next(
+        (
+            o.content
+            for o in response.outputs
+            if hasattr(o, "type") and o.type == "message.output"
+        ),
+        None,
+    )
+
+    if not final_message_content:
+        raise ValueError("The search agent did not return a final answer.")
+
+    with span("search.parse"):
+        return parse_object(final_message_content, Venue).model_dump(exclude_none=True)
+
+
 """
 # --- Example Usage ---
 if __name__ == "__main__":
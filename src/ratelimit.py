@@ -0,0 +1,80 @@
+"""
+Client-side rate limiting for upstream APIs.
+"""
+
+import asyncio
+import email.utils
+import time
+
+import httpx
+
+
+class TokenBucket:
+    """
+    Allows `rate` operations per second on average, with bursts of up to `capacity`.
+    Waiters are served in arrival order: each one reserves its tokens up front and
+    sleeps until the bucket has refilled enough to cover them.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0, timeout: float | None = None) -> float:
+        """
+        Takes `tokens` from the bucket, waiting for them if needed.
+        Raises TimeoutError, without taking anything, if that would take longer than
+        `timeout` seconds. Returns the time waited.
+        """
+        self._refill()
+        wait = max(0.0, (tokens - self._tokens) / self.rate)
+        if timeout is not None and wait > timeout:
+            raise TimeoutError(f"Rate limited for another {wait:.1f}s")
+        self._tokens -= tokens
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class SharedTokenBucket:
+    """
+    A TokenBucket kept in the shared state backend (see src/shared_state.py), for a
+    quota shared by every worker process: each worker takes from the same tokens.
+    """
+
+    def __init__(self, state, key: str, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._state = state
+        self._key = key
+
+    async def acquire(self, tokens: float = 1.0, timeout: float | None = None) -> float:
+        """As `TokenBucket.acquire`."""
+        wait = await self._state.take_async(self._key, self.rate, self.capacity, tokens, timeout)
+        if wait is None:
+            raise TimeoutError("Rate limited by the shared quota")
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    """The delay asked for by a Retry-After header, in seconds or as an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,83 @@
+"""
+Model cascade for the extraction step.
+
+Field extraction is tried on a small, fast model first. Its answer is validated
+against the expected schema and, when the caller can judge it, checked for
+plausibility; only an invalid or doubtful answer escalates to the next, larger
+model. Every decision is counted in `concierge_extraction_routing_total`, and
+each tier is timed as the "extraction" stage labelled by model.
+
+Answers are streamed, so a malformed one is given up on, and escalated, as soon
+as it goes wrong.
+"""
+
+import os
+
+from pydantic import BaseModel, ValidationError
+
+from src.metrics import inc, span
+from src.structured import stream_object
+
+
+# Models tried in order, smallest first.
+EXTRACTION_MODELS = os.getenv(
+    "EXTRACTION_MODELS", "mistral-small-latest,mistral-large-latest"
+).split(",")
+
+
+def _validate(schema: type[BaseModel], data: dict, partial: bool) -> dict:
+    if not partial:
+        return schema.model_validate(data).model_dump()
+    # Follow-up turns only carry the keys the message mentions.
+    given = [k for k in data if k in schema.model_fields]
+    full = schema.model_validate({**dict.fromkeys(schema.model_fields), **data})
+    return full.model_dump(include=set(given))
+
+
+async def extract(
+    client,
+    prompt: str,
+    schema: type[BaseModel],
+    plausible=None,
+    partial: bool = False,
+    models: list[str] = EXTRACTION_MODELS,
+    on_field=None,
+) -> tuple[dict, str]:
+    """
+    Runs an extraction prompt through the model cascade.
+    Arguments:
+        client: The Mistral client
+        prompt: The extraction prompt, asking for a JSON object
+        schema: The pydantic model the answer must validate against
+        plausible: Optional check of a validated answer; False escalates it
+        partial: Whether keys may be left out of the answer
+        models: The models to try, smallest first
+        on_field: Called with the fields streamed so far as each one completes.
+            An escalated answer may have been partly reported already.
+    Returns:
+        The validated fields and the model that produced them. The last model's
+        answer is accepted as long as it validates; if it does not, the error is raised.
+    """
+    for tier, model in enumerate(models):
+        last = tier == len(models) - 1
+        try:
+            with span("extraction", model=model):
+                data = await stream_object(client, model, prompt, on_field)
+            with span("extraction.parse"):
+                fields = _validate(schema, data, partial)
+        except (ValidationError, ValueError) as e:
+            reason = "invalid"
+            error = e
+        except Exception as e:
+            reason = "error"
+            error = e
+        else:
+            if last or plausible is None or plausible(fields):
+                inc("extraction_routing", model=model, decision="accepted")
+                return fields, model
+            reason = "implausible"
+            error = None
+        inc("extraction_routing", model=model, decision="escalated", reason=reason)
+        if last:
+            raise error
+    raise ValueError("No extraction model configured.")
@@ -0,0 +1,75 @@
+"""
+Schemas of the JSON the models are asked to produce.
+
+Models are lenient about types (a list of allergies, a number of people as text,
+a price as a number), so scalar values are coerced to what the rest of the code
+expects. Anything else, like a missing key or a nested object where a value is
+expected, fails validation.
+"""
+
+from typing import Annotated
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict
+
+
+def _to_text(value):
+    if value is None or isinstance(value, str):
+        return value or None
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return ", ".join(value) or None
+    return value
+
+
+def _to_people(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+Text = Annotated[str | None, BeforeValidator(_to_text)]
+People = Annotated[int | str | None, BeforeValidator(_to_people)]
+
+
+class ExtractedBooking(BaseModel):
+    """The details of a restaurant booking request."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    restaurant_type: Text
+    neighborhood: Text
+    allergies: Text
+    time: Text
+    date: Text
+    number_of_people: People
+    price: Text
+    reservation_name: Text
+    time_flexibility: Text
+
+
+class ExtractedSportBooking(BaseModel):
+    """The details of a sports booking request."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    sport_type: Text
+    location: Text
+    date: Text
+    time: Text
+    number_of_people: People
+    price: Text
+    reservation_name: Text
+    time_flexibility: Text
+
+
+class Venue(BaseModel):
+    """A venue returned by a web-search agent."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    name: str
+    address: Text = None
+    phone_number: Text = None
@@ -0,0 +1,313 @@
+"""
+Semantic venue retrieval over Mistral embeddings.
+
+Venue descriptions are embedded once, normalised to unit length and kept in a
+float32 matrix backed by a memory-mapped `.npy` file, next to a JSON-lines file
+with the venue of each row. A query is answered with a single vectorised
+matrix-vector product, so fuzzy requests ("cosy trattoria near Trocadéro") can be
+matched against known venues without a web search.
+
+Each venue is indexed with the structured criteria it was found for (cuisine,
+neighborhood and price band, or sport and location), the position of its area and
+when it was found. A query only scores the venues with the criteria it accepts,
+found near the requested area and recently enough: embeddings of "Italian, Paris
+16" and "Japanese, Paris 15" are too close to tell apart by similarity alone.
+
+Several worker processes can share an index directory: appends take a lock file,
+and each process picks up the rows the others added before searching.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from src.extractor import normalize
+from src.lazy import lazy_import
+from src.metrics import span
+from src.sport_catalog import KM_PER_DEGREE
+from src.venue_store import VENUE_MAX_AGE
+
+np = lazy_import("numpy")
+
+
+EMBEDDING_MODEL = "mistral-embed"
+SEMANTIC_INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR", "semantic_index")
+# Cosine similarity above which a known venue is proposed instead of searching the web.
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", 0.85))
+# Venues found for an area further than this from the requested one, in km, are not proposed.
+SEMANTIC_MAX_DISTANCE_KM = float(os.getenv("SEMANTIC_MAX_DISTANCE_KM", 3))
+
+KINDS = ["restaurant", "sport"]
+
+logger = logging.getLogger(__name__)
+
+
+def _criterion_key(kind: str, field: str, value) -> str:
+    return json.dumps([kind, field, normalize(str(value))])
+
+
+async def embed(client, texts: list[str]) -> np.ndarray:
+    """Embeds `texts` with Mistral and returns them as unit-length float32 rows."""
+    with span("embeddings", model=EMBEDDING_MODEL):
+        response = await client.embeddings.create_async(model=EMBEDDING_MODEL, inputs=texts)
+    vectors = np.array([d.embedding for d in response.data], dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class SemanticIndex:
+    def __init__(self, directory: str = SEMANTIC_INDEX_DIR, initial_capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._dir = directory
+        self._vectors_path = os.path.join(directory, "vectors.npy")
+        self._venues_path = os.path.join(directory, "venues.jsonl")
+        self._lock_path = os.path.join(directory, "index.lock")
+        self._initial_capacity = initial_capacity
+        self._vectors = None
+        self._venues: list[dict] = []
+        # Bytes of venues.jsonl already read.
+        self._venues_read = 0
+        self._kinds = np.zeros(0, dtype=np.int8)
+        # When each venue was found (0 when unknown), and the position of its area (NaN when unknown).
+        self._found_at = np.zeros(0, dtype=np.float64)
+        self._positions = np.zeros((0, 2), dtype=np.float64)
+        # _criterion_key(kind, field, value) -> rows of the venues indexed with it
+        self._rows: dict[str, list[int]] = {}
+        self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._venues)
+
+    def count(self, kind: str, criteria: dict | None = None, **filters) -> int:
+        """The number of venues `search` would score, with the same arguments."""
+        with self._lock:
+            self._refresh()
+            return len(self._candidates(kind, criteria, **filters))
+
+    def add(self, vectors: np.ndarray, venues: list[dict]) -> None:
+        """
+        Appends unit-length `vectors` and their venues. Each venue needs a "kind"
+        (one of KINDS), and may have the "criteria" it matches, the "position"
+        (latitude, longitude) of its area and the time it was "found_at"; the rest
+        of the dict is returned as-is by `search`.
+        """
+        os.makedirs(self._dir, exist_ok=True)
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._refresh()
+            start, end = len(self._venues), len(self._venues) + len(venues)
+            self._reserve(end, vectors.shape[1])
+            self._vectors[start:end] = vectors
+            self._vectors.flush()
+            with open(self._venues_path, "a", encoding="utf-8") as f:
+                for venue in venues:
+                    f.write(json.dumps(venue) + "\n")
+                self._venues_read = f.tell()
+            self._extend(venues)
+
+    def search(
+        self,
+        query: np.ndarray,
+        kind: str,
+        k: int = 5,
+        criteria: dict | None = None,
+        **filters,
+    ) -> list[tuple[float, dict]]:
+        """
+        Returns up to `k` (cosine similarity, venue) pairs of the given kind, best
+        first. Only the venues matching `criteria` and `filters` are scored (see
+        `_candidates`).
+        """
+        with self._lock:
+            self._refresh()
+            rows = self._candidates(kind, criteria, **filters)
+        n = len(self._venues)
+        if len(rows) == 0:
+            return []
+        k = min(k, len(rows))
+        if len(rows) < n // 8:
+            scores = self._vectors[rows] @ query
+            top = np.argsort(-scores)[:k]
+            return [(float(scores[i]), self._venues[rows[i]]) for i in top]
+        # Most rows match: scoring them all is cheaper than gathering them.
+        scores = np.full(n, -np.inf, dtype=np.float32)
+        scores[rows] = (self._vectors[:n] @ query)[rows]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self._venues[i]) for i in top if np.isfinite(scores[i])]
+
+    def _candidates(
+        self,
+        kind: str,
+        criteria: dict | None = None,
+        near: tuple[float, float] | None = None,
+        max_km: float = SEMANTIC_MAX_DISTANCE_KM,
+        max_age: float | None = None,
+    ) -> np.ndarray:
+        """
+        The rows of the venues of `kind` indexed with, for each field of `criteria`,
+        its value or one of its values (a list), found for an area within `max_km`
+        of `near` and at most `max_age` seconds ago, when those are given.
+        """
+        n = len(self._venues)
+        mask = self._kinds[:n] == KINDS.index(kind)
+        for field, accepted in (criteria or {}).items():
+            values = accepted if isinstance(accepted, list) else [accepted]
+            matching = np.zeros(n, dtype=bool)
+            for value in values:
+                matching[self._rows.get(_criterion_key(kind, field, value), [])] = True
+            mask &= matching
+        if max_age is not None:
+            mask &= self._found_at[:n] >= time.time() - max_age
+        if near is not None:
+            dlat = self._positions[:n, 0] - near[0]
+            dlon = (self._positions[:n, 1] - near[1]) * np.cos(np.radians(near[0]))
+            with np.errstate(invalid="ignore"):
+                mask &= np.hypot(dlat, dlon) * KM_PER_DEGREE <= max_km
+        return np.flatnonzero(mask)
+
+    def _extend(self, venues: list[dict]) -> None:
+        start = len(self._venues)
+        self._venues.extend(venues)
+        self._kinds = np.concatenate(
+            [self._kinds, np.array([KINDS.index(v["kind"]) for v in venues], dtype=np.int8)]
+        )
+        self._found_at = np.concatenate(
+            [self._found_at, np.array([v.get("found_at") or 0 for v in venues], dtype=np.float64)]
+        )
+        self._positions = np.concatenate(
+            [
+                self._positions,
+                np.array(
+                    [v.get("position") or (np.nan, np.nan) for v in venues], dtype=np.float64
+                ).reshape(-1, 2),
+            ]
+        )
+        for row, venue in enumerate(venues, start):
+            for field, value in (venue.get("criteria") or {}).items():
+                self._rows.setdefault(_criterion_key(venue["kind"], field, value), []).append(row)
+
+    def _refresh(self) -> None:
+        """Loads the venues appended to the files since they were last read, by any process."""
+        try:
+            size = os.path.getsize(self._venues_path)
+        except FileNotFoundError:
+            return
+        if not os.path.exists(self._vectors_path):
+            return
+        if size == self._venues_read:
+            return
+        with open(self._venues_path, "rb") as f:
+            f.seek(self._venues_read)
+            data = f.read(size - self._venues_read)
+        # A line still being written is left for the next refresh.
+        data = data[: data.rfind(b"\n") + 1]
+        if not data:
+            return
+        # The rows of the new venues are flushed before the venues are appended.
+        self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+        added = [json.loads(line) for line in data.decode("utf-8").splitlines()]
+        added = added[: len(self._vectors) - len(self._venues)]
+        self._venues_read += len(data)
+        self._extend(added)
+
+    def _reserve(self, size: int, dim: int) -> None:
+        """Grows the memory-mapped matrix (doubling its capacity) to hold `size` rows."""
+        capacity = 0 if self._vectors is None else len(self._vectors)
+        if size <= capacity:
+            return
+        new_capacity = max(self._initial_capacity, capacity * 2, size)
+        os.makedirs(self._dir, exist_ok=True)
+        tmp_path = self._vectors_path + ".tmp.npy"
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, dim)
+        )
+        if self._vectors is not None:
+            grown[:capacity] = self._vectors
+        grown.flush()
+        del grown
+        self._vectors = None
+        os.replace(tmp_path, self._vectors_path)
+        self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+
+
+_index: SemanticIndex | None = None
+
+
+def get_index() -> SemanticIndex:
+    global _index
+    if _index is None:
+        _index = SemanticIndex()
+    return _index
+
+
+async def find_similar(
+    client,
+    text: str,
+    kind: str,
+    criteria: dict,
+    near: tuple[float, float] | None = None,
+    max_age: float = VENUE_MAX_AGE,
+) -> dict | None:
+    """
+    The known venue of `kind` matching `criteria`, found near `near` less than
+    `max_age` seconds ago, that best matches the request `text`, if it is similar
+    enough and has a phone number. Nothing is embedded when no venue qualifies.
+    Retrieval is best-effort: an embedding failure returns None so the caller falls
+    back to the web search.
+    """
+    index = get_index()
+    filters = {"near": near, "max_age": max_age}
+    if index.count(kind, criteria, **filters) == 0:
+        return None
+    try:
+        [query] = await embed(client, [text])
+    except Exception as e:
+        logger.warning("Semantic lookup skipped: %s", e)
+        return None
+    for score, venue in index.search(query, kind, k=5, criteria=criteria, **filters):
+        if score < SEMANTIC_MIN_SCORE:
+            break
+        if venue.get("phone_number"):
+            return {
+                k: v
+                for k, v in venue.items()
+                if k not in ("kind", "description", "criteria", "position", "found_at")
+            }
+    return None
+
+
+async def remember(
+    client,
+    text: str,
+    venue: dict,
+    kind: str,
+    criteria: dict,
+    position: tuple[float, float] | None = None,
+) -> None:
+    """
+    Embeds the description `text` of a venue found by web search and indexes it,
+    with the `position` of the area it was found for.
+    """
+    try:
+        vectors = await embed(client, [text])
+    except Exception as e:
+        logger.warning("Venue not indexed: %s", e)
+        return
+    get_index().add(
+        vectors,
+        [
+            {
+                **venue,
+                "kind": kind,
+                "description": text,
+                "criteria": criteria,
+                "position": position,
+                "found_at": time.time(),
+            }
+        ],
+    )
@@ -0,0 +1,171 @@
+"""
+Booking sessions: the fields already extracted in the previous turns of a search.
+
+With a session id, a follow-up message only has to be searched for what it adds
+or changes, instead of re-extracting the whole conversation. Sessions expire
+`SESSION_TTL` seconds after their last update.
+
+The backend is chosen with SESSION_BACKEND:
+    memory: a bounded LRU in the process, for a single worker
+    sqlite: a SQLite file at SESSION_DB_PATH, shared by every worker on the host
+    shared: the shared state backend (see src/shared_state.py)
+It defaults to shared when a shared STATE_BACKEND is configured, memory otherwise.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from src.shared_state import STATE_BACKEND, get_state, run_blocking
+
+
+SESSION_BACKEND = os.getenv(
+    "SESSION_BACKEND", "memory" if STATE_BACKEND == "memory" else "shared"
+)
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_TTL = float(os.getenv("SESSION_TTL", 3600))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", 10_000))
+
+
+class MemorySessionStore:
+    def __init__(self, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> dict | None:
+        """Returns a copy of the session fields, or None when missing or expired."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return json.loads(entry[1])
+
+    def set(self, session_id: str, fields: dict) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+            self._entries[session_id] = (time.time() + self.ttl, json.dumps(fields))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    async def get_async(self, session_id: str) -> dict | None:
+        return self.get(session_id)
+
+    async def set_async(self, session_id: str, fields: dict) -> None:
+        self.set(session_id, fields)
+
+
+class SqliteSessionStore:
+    """
+    Sessions kept in SQLite only, without an in-process copy, so that every worker
+    sees the latest turn. Expired sessions are purged as new ones are written.
+    """
+
+    def __init__(
+        self,
+        path: str = SESSION_DB_PATH,
+        ttl: float = SESSION_TTL,
+        max_entries: int = SESSION_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, fields TEXT NOT NULL, "
+            "expires_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_by_expiry ON sessions (expires_at)"
+        )
+        self._db.commit()
+
+    def get(self, session_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fields FROM sessions WHERE id = ? AND expires_at >= ?",
+                (session_id, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, session_id: str, fields: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                (session_id, json.dumps(fields), now + self.ttl),
+            )
+            self._db.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+            # Beyond the cap, the sessions closest to expiry go first.
+            self._db.execute(
+                "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions "
+                "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
+
+    async def get_async(self, session_id: str) -> dict | None:
+        return await run_blocking(self.get, session_id)
+
+    async def set_async(self, session_id: str, fields: dict) -> None:
+        await run_blocking(self.set, session_id, fields)
+
+
+class SharedSessionStore:
+    """Sessions kept in the shared state backend, which expires them."""
+
+    def __init__(self, state=None, ttl: float = SESSION_TTL):
+        self.ttl = ttl
+        self._state = state or get_state()
+
+    def get(self, session_id: str) -> dict | None:
+        fields = self._state.get("session", session_id)
+        return json.loads(fields) if fields else None
+
+    def set(self, session_id: str, fields: dict) -> None:
+        self._state.set("session", session_id, json.dumps(fields), ttl=self.ttl)
+
+    def delete(self, session_id: str) -> None:
+        self._state.delete("session", session_id)
+
+    async def get_async(self, session_id: str) -> dict | None:
+        fields = await self._state.get_async("session", session_id)
+        return json.loads(fields) if fields else None
+
+    async def set_async(self, session_id: str, fields: dict) -> None:
+        await self._state.set_async("session", session_id, json.dumps(fields), ttl=self.ttl)
+
+
+def create_session_store(backend: str = SESSION_BACKEND):
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    if backend == "shared":
+        return SharedSessionStore()
+    raise ValueError(
+        f"Unknown SESSION_BACKEND: {backend!r} (expected memory, sqlite or shared)"
+    )
+
+
+def merge_fields(known: dict, delta: dict) -> dict:
+    """The known fields, updated with the ones a follow-up message gave."""
+    return {**known, **{k: v for k, v in delta.items() if v is not None}}
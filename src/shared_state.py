@@ -0,0 +1,276 @@
+"""
+State shared by the worker processes of the server.
+
+Caches, sessions and call completions are kept as namespaced string values with
+an optional expiry, in the backend chosen with STATE_BACKEND:
+    memory: in the process (default), for a single worker
+    sqlite: a SQLite file at STATE_DB_PATH, shared by every worker on the host
+    redis: a Redis-compatible server at REDIS_URL, shared across hosts (needs
+        the redis package)
+
+Every backend has the same small interface: `get`, `set` and `delete`, and
+`take` for the token buckets of quotas shared by the workers. Each method has an
+`_async` twin for the event loop: the sqlite and redis backends wait on I/O, so
+these run them on a small pool of threads (STATE_THREADS). The call queue and
+the call records stay in their own SQLite files, which are already shared by the
+workers of a host.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_PREFIX = os.getenv("STATE_PREFIX", "concierge")
+STATE_THREADS = int(os.getenv("STATE_THREADS", 8))
+
+_executor = ThreadPoolExecutor(max_workers=STATE_THREADS, thread_name_prefix="state")
+
+
+async def run_blocking(function, *args, **kwargs):
+    """Runs a blocking call to a state backend on the state threads."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, functools.partial(function, *args, **kwargs)
+    )
+
+
+def _take_tokens(
+    stored: str | None, now: float, rate: float, capacity: float, tokens: float, max_wait: float | None
+) -> tuple[str | None, float]:
+    """
+    The token bucket arithmetic of `take`, on the stored (level, updated_at) of a
+    bucket. Returns the new value to store (None when nothing is taken) and the
+    time the caller must wait for its tokens.
+    """
+    level, updated = json.loads(stored) if stored else (capacity, now)
+    level = min(capacity, level + max(0.0, now - updated) * rate)
+    wait = max(0.0, (tokens - level) / rate)
+    if max_wait is not None and wait > max_wait:
+        return None, wait
+    return json.dumps([level - tokens, now]), wait
+
+
+def _bucket_ttl(rate: float, capacity: float) -> float:
+    # Once full again, a bucket is the same as one never used.
+    return capacity / rate + 60
+
+
+class _Backend:
+    # Whether calls wait on I/O, and so must not run on the event loop.
+    blocking = True
+
+    async def _call(self, method, *args, **kwargs):
+        if not self.blocking:
+            return method(*args, **kwargs)
+        return await run_blocking(method, *args, **kwargs)
+
+    async def get_async(self, namespace: str, key: str) -> str | None:
+        return await self._call(self.get, namespace, key)
+
+    async def set_async(self, namespace: str, key: str, value: str, ttl: float | None = None) -> None:
+        await self._call(self.set, namespace, key, value, ttl)
+
+    async def delete_async(self, namespace: str, key: str) -> None:
+        await self._call(self.delete, namespace, key)
+
+    async def take_async(
+        self, key: str, rate: float, capacity: float, tokens: float = 1.0, max_wait: float | None = None
+    ) -> float | None:
+        return await self._call(self.take, key, rate, capacity, tokens, max_wait)
+
+
+class MemoryState(_Backend):
+    shared = False
+    blocking = False
+
+    def __init__(self):
+        self._entries: dict[tuple[str, str], tuple[float | None, str]] = {}
+        self._lock = threading.RLock()
+
+    def get(self, namespace: str, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] < time.time():
+                del self._entries[(namespace, key)]
+                return None
+            return entry[1]
+
+    def set(self, namespace: str, key: str, value: str, ttl: float | None = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[(namespace, key)] = (expires_at, value)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def take(
+        self, key: str, rate: float, capacity: float, tokens: float = 1.0, max_wait: float | None = None
+    ) -> float | None:
+        """
+        Takes `tokens` from the bucket `key` (refilled at `rate` per second, up to
+        `capacity`), in advance if it does not hold them yet. Returns how long to
+        wait before using them, or None without taking anything if that is longer
+        than `max_wait`.
+        """
+        with self._lock:
+            value, wait = _take_tokens(self.get("bucket", key), time.time(), rate, capacity, tokens, max_wait)
+            if value is None:
+                return None
+            self.set("bucket", key, value, ttl=_bucket_ttl(rate, capacity))
+        return wait
+
+
+class SqliteState(_Backend):
+    """Values in a SQLite file; expired rows are purged as new ones are written."""
+
+    shared = True
+
+    def __init__(self, path: str = STATE_DB_PATH, purge_every: int = 256):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state (namespace TEXT, key TEXT, value TEXT NOT NULL, "
+            "expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        self._db.execute("DELETE FROM state WHERE expires_at < ?", (time.time(),))
+        self._db.commit()
+        self._purge_every = purge_every
+        self._writes = 0
+
+    def get(self, namespace: str, key: str) -> str | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at >= ?)",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, namespace: str, key: str, value: str, ttl: float | None = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)",
+                (namespace, key, value, now + ttl if ttl is not None else None),
+            )
+            self._writes += 1
+            if self._writes % self._purge_every == 0:
+                self._db.execute("DELETE FROM state WHERE expires_at < ?", (now,))
+            self._db.commit()
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            )
+            self._db.commit()
+
+    def take(
+        self, key: str, rate: float, capacity: float, tokens: float = 1.0, max_wait: float | None = None
+    ) -> float | None:
+        """See `MemoryState.take`. The write lock is held across the read and the write."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._db.execute(
+                    "SELECT value FROM state WHERE namespace = 'bucket' AND key = ? "
+                    "AND (expires_at IS NULL OR expires_at >= ?)",
+                    (key, now),
+                ).fetchone()
+                value, wait = _take_tokens(row and row[0], now, rate, capacity, tokens, max_wait)
+                if value is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO state VALUES ('bucket', ?, ?, ?)",
+                        (key, value, now + _bucket_ttl(rate, capacity)),
+                    )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return None if value is None else wait
+
+
+class RedisState(_Backend):
+    """Values in Redis (or any server speaking its protocol), under `prefix:namespace:key`."""
+
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = STATE_PREFIX):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND=redis needs the redis package: pip install redis") from e
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self._prefix}:{namespace}:{key}"
+
+    def get(self, namespace: str, key: str) -> str | None:
+        return self._redis.get(self._key(namespace, key))
+
+    def set(self, namespace: str, key: str, value: str, ttl: float | None = None) -> None:
+        self._redis.set(
+            self._key(namespace, key), value, px=max(1, int(ttl * 1000)) if ttl is not None else None
+        )
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._redis.delete(self._key(namespace, key))
+
+    def take(
+        self, key: str, rate: float, capacity: float, tokens: float = 1.0, max_wait: float | None = None
+    ) -> float | None:
+        """See `MemoryState.take`. Retried until no other client wrote the bucket in between."""
+        import redis
+
+        name = self._key("bucket", key)
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(name)
+                    value, wait = _take_tokens(pipe.get(name), time.time(), rate, capacity, tokens, max_wait)
+                    if value is None:
+                        pipe.unwatch()
+                        return None
+                    pipe.multi()
+                    pipe.set(name, value, px=int(_bucket_ttl(rate, capacity) * 1000))
+                    pipe.execute()
+                    return wait
+                except redis.WatchError:
+                    continue
+
+
+def create_state(backend: str = STATE_BACKEND):
+    if backend == "memory":
+        return MemoryState()
+    if backend == "sqlite":
+        return SqliteState()
+    if backend == "redis":
+        return RedisState()
+    raise ValueError(f"Unknown STATE_BACKEND: {backend!r} (expected memory, sqlite or redis)")
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def get_state():
+    """The state backend of this process, created on first use."""
+    global _state
+    with _state_lock:
+        if _state is None:
+            _state = create_state()
+        return _state
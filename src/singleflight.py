@@ -0,0 +1,74 @@
+"""
+Request coalescing for identical concurrent operations.
+
+When a client retries a search on a timeout, or several agents ask for the same
+transcript, identical requests run at the same time. A `SingleFlight` group runs
+one operation per key at a time: the first request starts it, the ones arriving
+while it is in flight wait for it, and all of them get its result or its error.
+Each request gets its own copy of the result, as from the caches, so it can
+change it freely.
+
+    SEARCHES = SingleFlight("restaurant_search")
+    venue = await SEARCHES.do(key, lambda: _find_venue(client, extracted_info))
+
+A request that is cancelled only stops waiting; the operation itself is cancelled
+when no request is waiting for it any more. The operation must not use anything
+one request owns (its progress callback, tasks it cancels when it ends), since
+the other requests depend on it too. Coalesced requests are counted in
+`concierge_coalesced_requests_total`, by group. Flights are per process: with
+several workers, the shared caches take over once the first result is stored.
+"""
+
+import asyncio
+import copy
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TypeVar
+
+from src.metrics import inc
+
+T = TypeVar("T")
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: dict[Hashable, _Flight] = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, operation: Callable[[], Awaitable[T]]) -> T:
+        """
+        The result of `operation()`, or of the identical operation already in
+        flight under `key`.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(operation()))
+            flight.task.add_done_callback(lambda task: self._land(key, flight))
+            inc("singleflight_operations", group=self.name)
+        else:
+            inc("coalesced_requests", group=self.name)
+        flight.waiters += 1
+        try:
+            return copy.deepcopy(await asyncio.shield(flight.task))
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is left to use the result. Requests arriving from now on
+                # start a new operation rather than join one being cancelled.
+                self._land(key, flight)
+                flight.task.cancel()
+
+    def _land(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if flight.task.done() and not flight.task.cancelled():
+            # Retrieved here, so an error nobody waited for is not logged as lost.
+            flight.task.exception()
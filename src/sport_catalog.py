@@ -0,0 +1,266 @@
+"""
+Local catalog of sports venues, searched before the web.
+
+Venues are loaded from a CSV file (SPORT_CATALOG_PATH) with their coordinates,
+the sports they offer and their opening hours, and bucketed into a grid of
+roughly 1 km cells. A request is located from its arrondissement or neighborhood
+name, its sport type is normalised ("Tennis court" -> tennis, "padel tennis" ->
+padel, typos included), and the nearest venues offering that sport and open at
+the requested time are found by scanning the grid in rings around that point.
+`wellness_for` pairs the sport with a recovery massage.
+
+Anything the catalog cannot answer (an unknown sport or place, no venue nearby)
+is left to the web-search agent.
+"""
+
+import csv
+import difflib
+import math
+import os
+import re
+import threading
+from datetime import date
+
+from src.extractor import NEIGHBORHOODS, normalize, parse_date, parse_neighborhood, parse_time
+
+
+SPORT_CATALOG_PATH = os.getenv(
+    "SPORT_CATALOG_PATH", os.path.join(os.path.dirname(__file__), "data", "sport_venues.csv")
+)
+# Venues further away than this, in km, are not proposed.
+SPORT_MAX_DISTANCE_KM = float(os.getenv("SPORT_MAX_DISTANCE_KM", 5))
+
+SPORTS = {
+    "tennis": ["tennis", "court de tennis", "tennis court"],
+    "padel": ["padel", "paddle", "padel tennis", "paddle tennis"],
+    "running": ["running", "run", "jogging", "footing", "course a pied", "trail"],
+    "fitness": ["fitness", "gym", "salle de sport", "musculation", "crossfit", "workout", "cardio"],
+    "escalade": ["escalade", "climbing", "bouldering", "bloc", "grimpe"],
+    "natation": ["natation", "swimming", "swim", "piscine", "pool", "nage"],
+}
+
+WELLNESS = {
+    "tennis": "Massage dos et épaules",
+    "padel": "Massage dos et bras",
+    "fitness": "Massage jambes ou full body",
+    "running": "Massage jambes",
+    "escalade": "Massage avant-bras et dos",
+    "natation": "Massage épaules et nuque",
+}
+DEFAULT_WELLNESS = "Massage récupération générale"
+
+# Approximate centres, for distances from a requested area.
+ARRONDISSEMENT_CENTERS = {
+    1: (48.8625, 2.3363), 2: (48.8683, 2.3428), 3: (48.8630, 2.3601), 4: (48.8543, 2.3576),
+    5: (48.8445, 2.3507), 6: (48.8491, 2.3328), 7: (48.8562, 2.3122), 8: (48.8727, 2.3125),
+    9: (48.8770, 2.3375), 10: (48.8761, 2.3607), 11: (48.8591, 2.3800), 12: (48.8397, 2.3887),
+    13: (48.8283, 2.3623), 14: (48.8292, 2.3265), 15: (48.8401, 2.2930), 16: (48.8637, 2.2769),
+    17: (48.8873, 2.3067), 18: (48.8925, 2.3484), 19: (48.8871, 2.3848), 20: (48.8634, 2.4011),
+}
+NEIGHBORHOOD_CENTERS = {
+    "Le Marais": (48.8590, 2.3620),
+    "Montmartre": (48.8867, 2.3431),
+    "Pigalle": (48.8821, 2.3374),
+    "Saint-Germain-des-Prés": (48.8539, 2.3338),
+    "Latin Quarter": (48.8493, 2.3470),
+    "Bastille": (48.8532, 2.3691),
+    "Oberkampf": (48.8650, 2.3760),
+    "République": (48.8674, 2.3636),
+    "Canal Saint-Martin": (48.8710, 2.3650),
+    "Belleville": (48.8720, 2.3770),
+    "Batignolles": (48.8850, 2.3170),
+    "Opéra": (48.8712, 2.3320),
+    "Les Halles": (48.8620, 2.3470),
+    "Champs-Élysées": (48.8698, 2.3078),
+    "Trocadéro": (48.8626, 2.2875),
+    "Passy": (48.8580, 2.2830),
+    "Auteuil": (48.8480, 2.2620),
+    "Montparnasse": (48.8421, 2.3219),
+    "Butte-aux-Cailles": (48.8270, 2.3500),
+    "Bercy": (48.8383, 2.3826),
+    "Nation": (48.8483, 2.3959),
+    "Sentier": (48.8690, 2.3460),
+}
+PARIS_CENTER = (48.8566, 2.3522)
+
+# Grid cells of about 1.1 km on each side at the latitude of Paris.
+CELL_LAT = 0.01
+CELL_LON = 0.015
+KM_PER_DEGREE = 111.2
+
+_DAYS = ["mo", "tu", "we", "th", "fr", "sa", "su"]
+_HOURS_RE = re.compile(r"(\w\w)(?:-(\w\w))?\s+(\d{2}):(\d{2})-(\d{2}):(\d{2})")
+# Other sports whose names contain a catalog alias: "table tennis" is not tennis.
+OTHER_SPORTS = [
+    "table tennis", "tennis de table", "ping pong", "ping-pong", "beach tennis",
+    "stand up paddle", "stand-up paddle", "paddle board", "paddle boarding",
+]
+
+_SPORT_OF = {normalize(alias): sport for sport, aliases in SPORTS.items() for alias in aliases}
+_SPORT_OF.update({normalize(name): None for name in OTHER_SPORTS})
+# Longest first, so "padel tennis" wins over "tennis", and "table tennis" maps to no sport.
+_SPORT_RE = re.compile(
+    r"\b(" + "|".join(re.escape(a) for a in sorted(_SPORT_OF, key=len, reverse=True)) + r")\b"
+)
+
+
+def normalize_sport(text: str | None) -> str | None:
+    """
+    The catalog sport named in `text`, tolerating extra words and small typos.
+    None for a sport the catalog does not have, even one named like a catalog
+    sport ("table tennis").
+    """
+    if not text:
+        return None
+    text = normalize(text)
+    match = _SPORT_RE.search(text)
+    if match:
+        return _SPORT_OF[match.group(1)]
+    for word in re.findall(r"[a-z]+", text):
+        close = difflib.get_close_matches(word, _SPORT_OF, n=1, cutoff=0.8)
+        if close:
+            return _SPORT_OF[close[0]]
+    return None
+
+
+def wellness_for(sport_type: str | None) -> str:
+    return WELLNESS.get(normalize_sport(sport_type), DEFAULT_WELLNESS)
+
+
+def locate(location: str | None) -> tuple[float, float] | None:
+    """The coordinates of the neighborhood or arrondissement named in `location`."""
+    if not location:
+        return None
+    area = parse_neighborhood(location)
+    if area is None:
+        return PARIS_CENTER if "paris" in normalize(location) else None
+    arrondissement = re.fullmatch(r"Paris (\d+)", area)
+    if arrondissement:
+        return ARRONDISSEMENT_CENTERS[int(arrondissement.group(1))]
+    name = area.split(" (Paris")[0]
+    return NEIGHBORHOOD_CENTERS.get(name) or ARRONDISSEMENT_CENTERS[NEIGHBORHOODS[name][1]]
+
+
+def parse_hours(hours: str) -> dict[int, tuple[int, int]]:
+    """Opening hours ("Mo-Fr 08:00-22:00; Sa-Su 09:00-19:00") as minutes, by weekday."""
+    opening = {}
+    for first, last, h1, m1, h2, m2 in _HOURS_RE.findall(hours.lower()):
+        start, end = _DAYS.index(first), _DAYS.index(last or first)
+        for day in range(start, end + 1):
+            opening[day] = (int(h1) * 60 + int(m1), int(h2) * 60 + int(m2))
+    return opening
+
+
+def distance_km(a: tuple[float, float], b: tuple[float, float]) -> float:
+    """Equirectangular distance, accurate to a few metres at the scale of a city."""
+    dlat = a[0] - b[0]
+    dlon = (a[1] - b[1]) * math.cos(math.radians((a[0] + b[0]) / 2))
+    return math.hypot(dlat, dlon) * KM_PER_DEGREE
+
+
+class SportCatalog:
+    def __init__(self, path: str = SPORT_CATALOG_PATH):
+        self.venues: list[dict] = []
+        self._cells: dict[tuple[int, int], list[int]] = {}
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = csv.DictReader(line for line in f if not line.startswith("#"))
+            for row in rows:
+                self._add(row)
+
+    def _add(self, row: dict) -> None:
+        venue = {
+            "name": row["name"],
+            "address": row["address"],
+            "position": (float(row["lat"]), float(row["lon"])),
+            "sports": frozenset(s.strip() for s in row["sports"].split(";")),
+            "hours": row["hours"],
+            "opening": parse_hours(row["hours"]),
+        }
+        self._cells.setdefault(_cell(venue["position"]), []).append(len(self.venues))
+        self.venues.append(venue)
+
+    def nearest(
+        self,
+        sport: str,
+        position: tuple[float, float],
+        weekday: int | None = None,
+        minute: int | None = None,
+        k: int = 3,
+        max_km: float = SPORT_MAX_DISTANCE_KM,
+    ) -> list[tuple[float, dict]]:
+        """
+        Up to `k` (distance in km, venue) pairs offering `sport`, nearest first,
+        open on `weekday` at `minute` past midnight when those are given.
+        """
+        ci, cj = _cell(position)
+        rings = math.ceil(max_km / (CELL_LAT * KM_PER_DEGREE)) + 1
+        found: list[tuple[float, dict]] = []
+        for ring in range(rings + 1):
+            # Anything in a further ring is at least this far away.
+            if len(found) >= k and found[k - 1][0] <= (ring - 1) * CELL_LAT * KM_PER_DEGREE:
+                break
+            for i in range(ci - ring, ci + ring + 1):
+                for j in range(cj - ring, cj + ring + 1):
+                    if max(abs(i - ci), abs(j - cj)) != ring:
+                        continue
+                    for index in self._cells.get((i, j), ()):
+                        venue = self.venues[index]
+                        if sport not in venue["sports"] or not _open(venue, weekday, minute):
+                            continue
+                        distance = distance_km(position, venue["position"])
+                        if distance <= max_km:
+                            found.append((distance, venue))
+            found.sort(key=lambda pair: pair[0])
+        return found[:k]
+
+    def find(self, sport_type: str | None, location: str | None, day=None, time=None) -> list[dict]:
+        """
+        The nearest venues for an extracted request, as the search agent would
+        return them, or an empty list when the catalog cannot answer.
+        """
+        sport = normalize_sport(sport_type)
+        position = locate(location)
+        if sport is None or position is None:
+            return []
+        when = parse_date(str(day)) if day else None
+        at = parse_time(str(time)) if time else None
+        matches = self.nearest(
+            sport,
+            position,
+            weekday=when.weekday() if isinstance(when, date) else None,
+            minute=int(at[:2]) * 60 + int(at[3:]) if at else None,
+        )
+        return [
+            {
+                "name": venue["name"],
+                "address": venue["address"],
+                "distance_km": round(distance, 1),
+                "opening_hours": venue["hours"],
+            }
+            for distance, venue in matches
+        ]
+
+
+def _cell(position: tuple[float, float]) -> tuple[int, int]:
+    return int(position[0] // CELL_LAT), int(position[1] // CELL_LON)
+
+
+def _open(venue: dict, weekday: int | None, minute: int | None) -> bool:
+    if weekday is None:
+        return True
+    hours = venue["opening"].get(weekday)
+    if hours is None:
+        return False
+    return minute is None or hours[0] <= minute < hours[1]
+
+
+_catalog: SportCatalog | None = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> SportCatalog:
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = SportCatalog()
+        return _catalog
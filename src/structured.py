@@ -0,0 +1,125 @@
+"""
+Structured model output: JSON objects parsed as they stream in.
+
+`JSONObjectStream` is fed the text of a completion chunk by chunk and hands back
+each top-level field of the object as soon as its value is complete, so callers
+can act on the first fields while the rest is still being generated. Anything
+that cannot be the start or the continuation of a JSON object (prose before the
+object, a broken value, text after it) raises ValueError right away instead of
+after the whole answer has been received. A ```json fence around the object is
+tolerated.
+"""
+
+import json
+import time
+
+from pydantic import BaseModel
+
+from src.metrics import observe
+
+_FENCE = "```json"
+
+
+class JSONObjectStream:
+    def __init__(self):
+        self.fields: dict = {}
+        self._state = "start"
+        self._prefix = ""
+        self._segment: list[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> list[tuple[str, object]]:
+        """Consumes the next chunk and returns the (key, value) pairs it completed."""
+        completed = []
+        for ch in text:
+            if self._state == "object":
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif ch == "\\":
+                        self._escape = True
+                    elif ch == '"':
+                        self._in_string = False
+                elif ch == '"':
+                    self._in_string = True
+                elif ch in "{[":
+                    self._depth += 1
+                elif ch in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        completed += self._flush(closing=True)
+                        self._state = "end"
+                        continue
+                elif ch == "," and self._depth == 1:
+                    completed += self._flush(closing=False)
+                    continue
+                self._segment.append(ch)
+            elif self._state == "start":
+                if ch == "{":
+                    self._state, self._depth = "object", 1
+                    continue
+                self._prefix += ch
+                if not _FENCE.startswith(self._prefix.strip()):
+                    raise ValueError(f"Expected a JSON object, got {self._prefix.strip()[:40]!r}")
+            elif not (ch.isspace() or ch == "`"):
+                raise ValueError("Unexpected text after the JSON object.")
+        return completed
+
+    def close(self) -> dict:
+        """Returns the whole object, or raises ValueError if it was cut short."""
+        if self._state != "end":
+            raise ValueError("The JSON object is incomplete.")
+        return self.fields
+
+    def _flush(self, closing: bool) -> list[tuple[str, object]]:
+        segment = "".join(self._segment).strip()
+        self._segment = []
+        if not segment:
+            if closing and not self.fields:
+                return []
+            raise ValueError("Malformed JSON object: empty member.")
+        member = json.loads("{" + segment + "}")
+        if len(member) != 1:
+            raise ValueError("Malformed JSON object: expected one key per member.")
+        self.fields.update(member)
+        return list(member.items())
+
+
+def parse_object(content: str | None, schema: type[BaseModel]) -> BaseModel:
+    """Parses a complete answer (optionally fenced) into `schema`."""
+    if not content:
+        raise ValueError("The model did not return an answer.")
+    stream = JSONObjectStream()
+    stream.feed(content)
+    return schema.model_validate(stream.close())
+
+
+async def stream_object(client, model: str, prompt: str, on_field=None) -> dict:
+    """
+    Streams a JSON-mode chat completion and returns the object it contains.
+    `on_field(fields)` is called with the fields received so far every time one
+    more is complete. Raises ValueError as soon as the answer cannot be a JSON object.
+    """
+    started = time.perf_counter()
+    stream = JSONObjectStream()
+    response = await client.chat.stream_async(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        response_format={"type": "json_object"},
+    )
+    async with response as events:
+        async for event in events:
+            if not event.data.choices:
+                continue
+            content = event.data.choices[0].delta.content
+            if not isinstance(content, str) or not content:
+                continue
+            completed = stream.feed(content)
+            if completed:
+                if len(stream.fields) == len(completed):
+                    observe("extraction.first_field", time.perf_counter() - started, model=model)
+                if on_field is not None:
+                    on_field(dict(stream.fields))
+    return stream.close()
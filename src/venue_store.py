@@ -0,0 +1,104 @@
+"""
+Persistent store of the venues found by the web-search agents.
+
+Every restaurant returned by `find_restaurant` is recorded with its cuisine,
+neighborhood and price band, so later searches for the same (cuisine,
+neighborhood, price band) can be answered locally while the entry is fresh.
+Availability is not stored: the booking call checks it anyway.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from src.extractor import normalize
+
+
+VENUE_DB_PATH = os.getenv("VENUE_DB_PATH", "venues.db")
+# How long a venue found by web search can be reused, in seconds (default: a week).
+VENUE_MAX_AGE = float(os.getenv("VENUE_MAX_AGE", 7 * 24 * 3600))
+
+ANY_PRICE = "any"
+
+
+def price_band(price: dict | None) -> str:
+    """Buckets a parsed price range ({"min", "max"}) into a coarse band."""
+    if not price:
+        return ANY_PRICE
+    amount = price.get("max") or price.get("min")
+    if amount is None:
+        return ANY_PRICE
+    if amount <= 20:
+        return "budget"
+    if amount <= 50:
+        return "moderate"
+    if amount <= 100:
+        return "upscale"
+    return "luxury"
+
+
+class VenueStore:
+    def __init__(self, path: str = VENUE_DB_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS venues (
+                name TEXT NOT NULL,
+                address TEXT NOT NULL,
+                phone_number TEXT,
+                cuisine TEXT NOT NULL,
+                neighborhood TEXT NOT NULL,
+                price_band TEXT NOT NULL,
+                found_at REAL NOT NULL,
+                PRIMARY KEY (cuisine, neighborhood, price_band, name, address)
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS venues_by_criteria "
+            "ON venues (cuisine, neighborhood, price_band, found_at)"
+        )
+        self._db.commit()
+
+    def record(self, venue: dict, cuisine: str, neighborhood: str, band: str) -> None:
+        """Adds a venue found by web search, or refreshes it if already known."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO venues VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    venue.get("name", "N/A"),
+                    venue.get("address", "N/A"),
+                    venue.get("phone_number"),
+                    normalize(cuisine),
+                    normalize(neighborhood),
+                    band,
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def lookup(
+        self, cuisine: str, neighborhood: str, band: str, max_age: float = VENUE_MAX_AGE
+    ) -> dict | None:
+        """
+        Returns the most recently found venue matching the criteria, or None if
+        there is none younger than `max_age` seconds. Any band matches ANY_PRICE.
+        """
+        query = (
+            "SELECT name, address, phone_number FROM venues "
+            "WHERE cuisine = ? AND neighborhood = ? AND found_at >= ? "
+            "AND phone_number IS NOT NULL"
+        )
+        params = [normalize(cuisine), normalize(neighborhood), time.time() - max_age]
+        if band != ANY_PRICE:
+            query += " AND price_band = ?"
+            params.append(band)
+        with self._lock:
+            row = self._db.execute(
+                query + " ORDER BY found_at DESC LIMIT 1", params
+            ).fetchone()
+        if row is None:
+            return None
+        return {"name": row[0], "address": row[1], "phone_number": row[2]}
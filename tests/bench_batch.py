@@ -0,0 +1,99 @@
+"""
+Batch search benchmark.
+
+Resolves the same N restaurant requests, against the fake Mistral server, once
+with N sequential `find_restaurant_async` calls (as a client calling
+cherche_restaurant in a loop does) and once with a single
+`find_restaurants_async` batch. Each run searches its own neighborhoods so
+neither reuses what the other found. A few requests share their criteria, and
+a few need the LLM to be understood.
+
+Usage:
+    python -m tests.bench_batch
+    python -m tests.bench_batch --queries 20 --search-latency 1.0
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+from tests.fake_bland import serve_in_thread
+from tests.fake_mistral import create_app as create_mistral_app
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+parser.add_argument("--queries", type=int, default=10)
+parser.add_argument("--search-latency", type=float, default=0.5)
+parser.add_argument("--output", default=f"bench_results/batch-{time.strftime('%Y%m%d-%H%M%S')}.json")
+args = parser.parse_args()
+
+mistral_app = create_mistral_app(latency=0.05, search_latency=args.search_latency)
+mistral_url, mistral_server = serve_in_thread(mistral_app)
+workdir = tempfile.mkdtemp(prefix="bench_batch_")
+os.environ.update(
+    MISTRAL_API_KEY="bench",
+    MISTRAL_SERVER_URL=mistral_url,
+    MISTRAL_REQUESTS_PER_SECOND="100000",
+    CACHE_PATH=os.path.join(workdir, "cache.db"),
+    VENUE_DB_PATH=os.path.join(workdir, "venues.db"),
+    SEMANTIC_INDEX_DIR=os.path.join(workdir, "semantic_index"),
+)
+logging.disable(logging.INFO)
+
+from src.prompt_resto_client import find_restaurant_async, find_restaurants_async  # noqa: E402
+
+CUISINES = ["Italian", "Japanese", "French", "Lebanese", "Thai"]
+
+
+def queries(first_arrondissement: int) -> list[str]:
+    found = []
+    for i in range(args.queries):
+        # Every fourth request repeats the criteria of the one before it.
+        n = i - 1 if i % 4 == 3 else i
+        cuisine = CUISINES[n % len(CUISINES)]
+        arrondissement = (first_arrondissement + n) % 20 + 1
+        if i % 5 == 4:
+            # Phrased so the rules cannot complete it.
+            found.append(f"somewhere {cuisine.lower()}-ish around the {arrondissement}th for a few of us, tomorrow evening")
+        else:
+            found.append(f"{cuisine} restaurant in Paris {arrondissement} for 4 people tomorrow at 8pm, no allergies")
+    return found
+
+
+async def main() -> dict:
+    start = time.perf_counter()
+    for query in queries(0):
+        await find_restaurant_async(query)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = await find_restaurants_async(queries(10))
+    batched = time.perf_counter() - start
+
+    statuses = {}
+    for result in batch["results"]:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    print(f"{args.queries} requests: sequential {sequential:.2f}s, batch {batched:.2f}s ({sequential / batched:.1f}x)")
+    print(f"batch: {batch['searches']} distinct searches, statuses {statuses}")
+    return {
+        "sequential_s": round(sequential, 3),
+        "batch_s": round(batched, 3),
+        "searches": batch["searches"],
+        "statuses": statuses,
+    }
+
+
+results = asyncio.run(main())
+mistral_server.should_exit = True
+
+os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+with open(args.output, "w") as f:
+    json.dump(
+        {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), "results": results},
+        f,
+        indent=2,
+    )
+print(f"results written to {args.output}")
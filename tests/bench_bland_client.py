@@ -0,0 +1,93 @@
+"""
+Load test for the pooled Bland client.
+
+Sends the same status requests to the fake Bland server twice: once opening a new
+HTTP client per request (as the caller used to), once through the shared
+`BlandClient`. Reports per-request latency and how many TCP connections the server
+saw. A last run turns away 20% of the requests with 429/503 to show the retries.
+
+Usage:
+    python -m tests.bench_bland_client
+"""
+
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from src.bland_client import BlandClient
+from tests.fake_bland import create_app, serve_in_thread
+
+REQUESTS = 400
+CONCURRENCY = 20
+
+app = create_app(latency=0.005, call_seconds=3600)
+base_url, server = serve_in_thread(app)
+flaky_app = create_app(latency=0.005, call_seconds=3600, error_rate=0.2, retry_after=0.05)
+flaky_url, flaky_server = serve_in_thread(flaky_app)
+
+
+async def load(get_call) -> list[float]:
+    slots = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def one(call_id):
+        async with slots:
+            start = time.perf_counter()
+            await get_call(call_id)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(c) for c in list(app.state.calls) * (REQUESTS // len(app.state.calls))))
+    return latencies
+
+
+def report(name: str, latencies: list[float], stats: dict) -> None:
+    ms = sorted(x * 1000 for x in latencies)
+    print(
+        f"{name:>10}: mean {statistics.mean(ms):6.1f} ms, p50 {ms[len(ms) // 2]:6.1f} ms, "
+        f"p95 {ms[int(len(ms) * 0.95)]:6.1f} ms, "
+        f"{stats['requests']} requests over {stats['connections']} connections"
+    )
+
+
+async def main() -> None:
+    client = BlandClient(base_url=base_url, calls_per_minute=6000)
+    for _ in range(10):
+        await client.create_call({"phone_number": "+33100000000"})
+
+    async def fresh_client(call_id):
+        async with httpx.AsyncClient(base_url=base_url, timeout=15) as http:
+            r = await http.get(f"/v1/calls/{call_id}")
+            r.raise_for_status()
+            return r.json()
+
+    async with httpx.AsyncClient() as http:
+        await http.delete(f"{base_url}/_stats")
+        report("per-call", await load(fresh_client), (await http.get(f"{base_url}/_stats")).json())
+        await http.delete(f"{base_url}/_stats")
+        report("pooled", await load(client.get_call), (await http.get(f"{base_url}/_stats")).json())
+
+    flaky = BlandClient(base_url=flaky_url, backoff=0.05, max_retries=5)
+    flaky_app.state.calls.update(app.state.calls)
+    failures = 0
+
+    async def flaky_get(call_id):
+        nonlocal failures
+        try:
+            await flaky.get_call(call_id)
+        except httpx.HTTPStatusError:
+            failures += 1
+
+    latencies = await load(flaky_get)
+    stats = flaky_app.state.stats
+    report("flaky", latencies, stats)
+    print(f"{stats['errors']} upstream errors retried, {failures} requests failed")
+    await client.aclose()
+    await flaky.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
+    server.should_exit = True
+    flaky_server.should_exit = True
@@ -0,0 +1,79 @@
+"""
+Call-completion benchmark: webhook delivery vs. polling.
+
+Places calls on the fake Bland server, fetches their transcripts concurrently and
+reports how long after the end of each call the transcript came back and how many
+requests Bland received. Run it with and without the webhook to compare.
+
+Usage:
+    python -m tests.bench_call_completion           # webhook mounted on the MCP app
+    python -m tests.bench_call_completion --polling # no webhook, backoff polling only
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+from tests.fake_bland import create_app, free_port, serve_in_thread
+
+CALLS = 10
+CALL_SECONDS = 3.0
+
+polling = "--polling" in sys.argv
+bland_app = create_app(latency=0.02, call_seconds=CALL_SECONDS)
+bland_url, bland_server = serve_in_thread(bland_app)
+mcp_port = free_port()
+os.environ["BLAND_API_URL"] = bland_url
+os.environ["BLAND_CALLS_PER_MINUTE"] = "100000"
+workdir = tempfile.mkdtemp()
+os.environ["CALL_DB_PATH"] = os.path.join(workdir, "calls.db")
+os.environ["CALL_QUEUE_DB_PATH"] = os.path.join(workdir, "call_queue.db")
+if not polling:
+    os.environ["BLAND_WEBHOOK_URL"] = f"http://127.0.0.1:{mcp_port}/bland/webhook"
+    os.environ["BLAND_WEBHOOK_SECRET"] = "bench-webhook-secret"
+
+import main  # noqa: E402
+from src.caller import send_bland_pathway_call_async, get_call_transcript_async  # noqa: E402
+
+
+async def book(i: int) -> float:
+    message = await send_bland_pathway_call_async(
+        phone_number="+33100000000",
+        restaurant_name=f"Bistro {i}",
+        number_of_people=2,
+        date_of_reservation="tomorrow",
+        time_of_reservation="8:00 PM",
+        reservation_name="Bench",
+    )
+    call_id = message.split("call_id=", 1)[1].split()[0].strip("'\"")
+    ends_at = bland_app.state.calls[call_id]["started"] + CALL_SECONDS
+    await get_call_transcript_async(call_id)
+    return time.time() - ends_at
+
+
+async def main_() -> None:
+    # The MCP app shares this event loop, as the webhook and the tools do in production.
+    mcp_server = uvicorn.Server(
+        uvicorn.Config(main.mcp.streamable_http_app(), port=mcp_port, log_level="warning")
+    )
+    serving = asyncio.create_task(mcp_server.serve())
+    while not mcp_server.started:
+        await asyncio.sleep(0.01)
+
+    lags = await asyncio.gather(*(book(i) for i in range(CALLS)))
+    print(f"mode: {'polling' if polling else 'webhook'}")
+    print(f"transcript lag after call end: median {statistics.median(lags):.2f}s, max {max(lags):.2f}s")
+    print(f"requests to Bland: {bland_app.state.stats['requests']} for {CALLS} calls")
+
+    mcp_server.should_exit = True
+    await serving
+
+
+if __name__ == "__main__":
+    asyncio.run(main_())
+    bland_server.should_exit = True
@@ -0,0 +1,72 @@
+"""
+Extraction cascade benchmark.
+
+Runs the LLM extraction of `find_restaurant` on queries the rules cannot complete,
+against the fake Mistral server, once with the large model only and once with the
+small-then-large cascade. The fake small model answers three times faster and
+leaves out keys in 10% of its answers. Reports the median and p95 latency and the
+requests each model received.
+
+Usage:
+    python -m tests.bench_cascade
+"""
+
+import asyncio
+import os
+import statistics
+import time
+
+from tests.fake_bland import serve_in_thread
+from tests.fake_mistral import create_app
+
+QUERIES = 100
+CONCURRENCY = 10
+
+app = create_app(latency=0.3, small_latency=0.1, small_invalid_rate=0.1)
+base_url, server = serve_in_thread(app)
+os.environ.update(MISTRAL_API_KEY="bench", MISTRAL_SERVER_URL=base_url)
+
+from mistralai import Mistral  # noqa: E402
+
+from src import routing  # noqa: E402
+from src.prompt_resto_client import _extract_with_llm  # noqa: E402
+
+
+def query(i: int) -> str:
+    return f"Somewhere nice for dinner with {i % 5 + 2} friends, maybe request {i}"
+
+
+async def run(models: list[str]) -> None:
+    routing.EXTRACTION_MODELS[:] = models
+    before = {k: v for k, v in app.state.stats.items() if k.startswith("chat.")}
+    latencies = []
+    slots = asyncio.Semaphore(CONCURRENCY)
+    async with Mistral(api_key="bench", server_url=base_url) as client:
+
+        async def one(i):
+            async with slots:
+                start = time.perf_counter()
+                await _extract_with_llm(client, query(i))
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one(i) for i in range(QUERIES)))
+    latencies.sort()
+    requests = {
+        k.removeprefix("chat."): v - before.get(k, 0)
+        for k, v in app.state.stats.items()
+        if k.startswith("chat.") and v != before.get(k, 0)
+    }
+    print(
+        f"{' -> '.join(models):>42}: median {statistics.median(latencies) * 1000:4.0f} ms, "
+        f"p95 {latencies[int(0.95 * len(latencies))] * 1000:4.0f} ms, requests {requests}"
+    )
+
+
+async def main() -> None:
+    await run(["mistral-large-latest"])
+    await run(["mistral-small-latest", "mistral-large-latest"])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
+    server.should_exit = True
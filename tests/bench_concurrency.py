@@ -0,0 +1,66 @@
+"""
+Concurrency benchmark for the async tool backends.
+
+Measures how many `send_bland_pathway_call_async` invocations per second a single
+event loop serves, first on its own and then while hundreds of
+`get_call_transcript_async` long polls are in flight against the fake Bland server.
+
+Usage:
+    python -m tests.bench_concurrency
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from tests.fake_bland import create_app, serve_in_thread
+
+CALLS = 300
+LONG_POLLS = 200
+
+app = create_app(latency=0.05, call_seconds=3600)
+base_url, server = serve_in_thread(app)
+os.environ["BLAND_API_URL"] = base_url
+os.environ["BLAND_CALLS_PER_MINUTE"] = "100000"
+os.environ["CALL_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "calls.db")
+
+from src.caller import send_bland_pathway_call_async, get_call_transcript_async  # noqa: E402
+
+
+async def place_call() -> str:
+    return await send_bland_pathway_call_async(
+        phone_number="+33100000000",
+        restaurant_name="Benchmark Bistro",
+        number_of_people=2,
+        date_of_reservation="tomorrow",
+        time_of_reservation="8:00 PM",
+        reservation_name="Bench",
+    )
+
+
+async def burst() -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(place_call() for _ in range(CALLS)))
+    return CALLS / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    baseline = await burst()
+    print(f"baseline: {baseline:.0f} calls/s")
+
+    call_ids = list(app.state.calls)[:LONG_POLLS]
+    polls = [asyncio.create_task(get_call_transcript_async(c)) for c in call_ids]
+    await asyncio.sleep(0.5)
+    loaded = await burst()
+    print(f"with {len(polls)} transcript polls in flight: {loaded:.0f} calls/s")
+    print(f"throughput ratio: {loaded / baseline:.2f}")
+
+    for task in polls:
+        task.cancel()
+    await asyncio.gather(*polls, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
+    server.should_exit = True
@@ -0,0 +1,234 @@
+"""
+End-to-end benchmark of the MCP tools.
+
+Serves `main.py` over streamable HTTP against the fake Mistral and Bland servers,
+then calls each tool from MCP clients at rising concurrency. For every tool and
+concurrency level it reports p50/p95/p99 latency, throughput, errors and the
+requests the tool sent upstream. Results are written as JSON so runs can be
+compared over time.
+
+Caches and stores live in a temporary directory, so each run starts cold: the
+first level pays for the web searches, later ones mostly hit the venue store.
+
+Usage:
+    python -m tests.bench_e2e
+    python -m tests.bench_e2e --levels 1 8 32 --requests 64 --error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+import uvicorn
+
+from tests.fake_bland import create_app as create_bland_app, free_port, serve_in_thread
+from tests.fake_mistral import create_app as create_mistral_app
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 32])
+parser.add_argument("--requests", type=int, default=32, help="tool calls per tool and level")
+parser.add_argument("--mistral-latency", type=float, default=0.05)
+parser.add_argument("--search-latency", type=float, default=0.5)
+parser.add_argument("--bland-latency", type=float, default=0.02)
+parser.add_argument("--call-seconds", type=float, default=1.0)
+parser.add_argument("--error-rate", type=float, default=0.0)
+parser.add_argument("--output", default=f"bench_results/e2e-{time.strftime('%Y%m%d-%H%M%S')}.json")
+args = parser.parse_args()
+
+mistral_app = create_mistral_app(args.mistral_latency, args.search_latency, args.error_rate)
+mistral_url, mistral_server = serve_in_thread(mistral_app)
+bland_app = create_bland_app(args.bland_latency, args.call_seconds, error_rate=args.error_rate)
+bland_url, bland_server = serve_in_thread(bland_app)
+mcp_port = free_port()
+workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+os.environ.update(
+    MISTRAL_API_KEY="bench",
+    MISTRAL_SERVER_URL=mistral_url,
+    BLAND_API_KEY="bench",
+    BLAND_API_URL=bland_url,
+    BLAND_CALLS_PER_MINUTE="100000",
+    CALL_QUEUE_MAX_CALLS="100000",
+    MISTRAL_REQUESTS_PER_SECOND="100000",
+    BLAND_WEBHOOK_URL=f"http://127.0.0.1:{mcp_port}/bland/webhook",
+    BLAND_WEBHOOK_SECRET="bench-webhook-secret",
+    CACHE_PATH=os.path.join(workdir, "cache.db"),
+    VENUE_DB_PATH=os.path.join(workdir, "venues.db"),
+    CALL_DB_PATH=os.path.join(workdir, "calls.db"),
+    CALL_QUEUE_DB_PATH=os.path.join(workdir, "call_queue.db"),
+    SEMANTIC_INDEX_DIR=os.path.join(workdir, "semantic_index"),
+)
+
+import main  # noqa: E402
+from mcp import ClientSession  # noqa: E402
+from mcp.client.streamable_http import streamablehttp_client  # noqa: E402
+
+# The server runs with debug logging, which would drown the report.
+logging.disable(logging.INFO)
+
+CUISINES = ["Italian", "Japanese", "Indian", "Lebanese", "Thai", "Mexican", "Greek", "Korean"]
+AREAS = ["Paris 3", "Paris 6", "Paris 11", "Paris 15", "Paris 16", "Paris 18"]
+
+
+def restaurant_query(rng: random.Random) -> str:
+    # One in four leaves out the time, so the extraction falls back to the model.
+    time_of_day = "" if rng.random() < 0.25 else f" at {rng.randint(18, 21)}:00"
+    return (
+        f"A {rng.choice(CUISINES)} restaurant in {rng.choice(AREAS)} for "
+        f"{rng.randint(2, 6)} people tomorrow{time_of_day}, no allergies"
+    )
+
+
+def booking(rng: random.Random) -> dict:
+    return {
+        "number_of_people": rng.randint(2, 6),
+        "date_of_reservation": "tomorrow",
+        "time_of_reservation": "8:00 PM",
+        "reservation_name": "Bench",
+    }
+
+
+def candidate(rng: random.Random) -> dict:
+    return {"phone_number": f"+331{rng.randint(0, 10**8):08d}", "restaurant_name": "Bench Bistro"}
+
+
+async def call_tool(session: ClientSession, name: str, arguments: dict) -> str:
+    result = await session.call_tool(name, arguments)
+    if result.isError:
+        raise RuntimeError(result.content[0].text if result.content else "tool error")
+    return result.content[0].text
+
+
+async def cherche_restaurant(session, rng):
+    await call_tool(session, "cherche_restaurant", {"prompt_utilisateur": restaurant_query(rng)})
+
+
+async def call_restaurant(session, rng):
+    await call_tool(session, "call_restaurant", {**candidate(rng), **booking(rng)})
+
+
+async def fetch_call_transcript(session, rng):
+    # Transcripts are only available once a call was placed, so both are timed.
+    message = await call_tool(session, "call_restaurant", {**candidate(rng), **booking(rng)})
+    job_id = message.split("job_id=", 1)[1].split()[0].strip("'\".")
+    await call_tool(session, "fetch_call_transcript", {"call_id": job_id})
+
+
+async def call_restaurants(session, rng):
+    await call_tool(
+        session,
+        "call_restaurants",
+        {"candidates": [candidate(rng) for _ in range(3)], **booking(rng)},
+    )
+
+
+TOOLS = [cherche_restaurant, call_restaurant, fetch_call_transcript, call_restaurants]
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def upstream_counts() -> dict:
+    return {
+        **{f"mistral.{k}": v for k, v in mistral_app.state.stats.items()},
+        **{f"bland.{k}": v for k, v in bland_app.state.stats.items() if k != "connections"},
+    }
+
+
+async def run_level(tool, concurrency: int, requests: int) -> dict:
+    """Calls `tool` `requests` times from `concurrency` MCP sessions."""
+    url = f"http://127.0.0.1:{mcp_port}/mcp"
+    pending = list(range(requests))
+    latencies, errors = [], []
+
+    async def client(worker: int) -> None:
+        rng = random.Random(f"{tool.__name__}-{concurrency}-{worker}")
+        async with streamablehttp_client(url) as (read, write, _):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                while pending:
+                    pending.pop()
+                    start = time.perf_counter()
+                    try:
+                        await tool(session, rng)
+                        latencies.append(time.perf_counter() - start)
+                    except Exception as e:
+                        errors.append(str(e))
+
+    before = upstream_counts()
+    start = time.perf_counter()
+    await asyncio.gather(*(client(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    after = upstream_counts()
+    return {
+        "tool": tool.__name__,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "p50_s": round(percentile(latencies, 0.50), 4) if latencies else None,
+        "p95_s": round(percentile(latencies, 0.95), 4) if latencies else None,
+        "p99_s": round(percentile(latencies, 0.99), 4) if latencies else None,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "upstream": {k: after[k] - before.get(k, 0) for k in after if after[k] != before.get(k, 0)},
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main_() -> None:
+    # The MCP app shares this event loop, as the webhook and the tools do in production.
+    mcp_server = uvicorn.Server(
+        uvicorn.Config(main.mcp.streamable_http_app(), port=mcp_port, log_level="warning")
+    )
+    serving = asyncio.create_task(mcp_server.serve())
+    while not mcp_server.started:
+        await asyncio.sleep(0.01)
+
+    results = []
+    print(f"{'tool':>22} {'conc':>4} {'p50':>7} {'p95':>7} {'p99':>7} {'rps':>7} {'err':>4}  upstream")
+    for tool in TOOLS:
+        for level in args.levels:
+            r = await run_level(tool, level, max(args.requests, level))
+            results.append(r)
+            print(
+                f"{r['tool']:>22} {level:>4} {r['p50_s'] or 0:7.3f} {r['p95_s'] or 0:7.3f} "
+                f"{r['p99_s'] or 0:7.3f} {r['throughput_rps']:7.1f} {r['errors']:>4}  {r['upstream']}"
+            )
+
+    mcp_server.should_exit = True
+    await serving
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "commit": git_commit(),
+                "config": vars(args),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_())
+    mistral_server.should_exit = True
+    bland_server.should_exit = True
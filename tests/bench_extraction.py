@@ -0,0 +1,70 @@
+"""
+Hit-rate and latency benchmark for the rule-based pre-extractor.
+
+A hit is a query that `pre_extract` fully resolves, so `find_restaurant`
+skips the LLM extraction for it.
+
+Usage:
+    python -m tests.bench_extraction
+"""
+
+import statistics
+import time
+
+from src.extractor import pre_extract
+
+QUERIES = [
+    "Italian, Paris 16, 2 people, 19/10 at 19:00, 20-50€",
+    "Japanese, Le Marais, 4 people, tomorrow at 20:30",
+    "sushi near Trocadéro tomorrow at 8pm for two, under 40€",
+    "Japonais dans le Marais ce soir 20h30 pour 4 personnes",
+    "table for 6 at a brasserie in 75008 on 2025-12-24 at 21:00, name: Dupont",
+    "Thai in Paris 11, 3 people, friday 19h30",
+    "Lebanese restaurant, Paris 5, 2 pers, 12/11 at 12:30, max 25€",
+    "Indian, Montmartre, 5 guests, saturday 8:15 PM, 15-30€",
+    "Pizzeria in the 17e for 2 tonight at 9pm",
+    "Vegan place at Oberkampf for 3 people tomorrow 19:45, gluten allergy",
+    "Korean BBQ, Paris 13, 8 people, 31/12 at 22:00, under the name Martin",
+    "Seafood, Saint-Germain, 2 people, 14 February at 20:00, 50-100€",
+    "Mexican tacos in Pigalle, 4 pax, demain 21h",
+    "Greek restaurant in Paris 15 for 2 people on October 19th, 2025 at 7:00 PM",
+    "Chinese dim sum, Belleville, 6 people, sunday at noon",
+    "Steakhouse in Paris 8, 4 people, 2025-11-03 at 20:00, more than 40€",
+    "Vietnamese pho, Paris 13, 1 person, today at 12:15",
+    "French bistro, Batignolles, 2 people, next friday at 7:30 PM, flexible by 30 minutes",
+    "Spanish tapas near Bastille for 5 people, 20/10 at 20h",
+    "Moroccan couscous, Paris 20, 7 people, 18 octobre à 19h30",
+    # Queries the rules should leave to the LLM.
+    "I need a reservation for an Italian place in Paris 16 for 2 people on October 19th, 2025 at 7:00 PM. Price range is 20-50€. Please note a shrimp intolerance.",
+    "Somewhere romantic for our anniversary next week",
+    "French or Italian in the 11e, friday 19h, 3 pers",
+    "A nice place for dinner with friends around 8 or 9pm",
+    "Find me a restaurant near the Eiffel Tower for a big group",
+    "Je cherche un bon restaurant pas cher",
+    "Italian in Paris 16 or Paris 17, 2 people, tomorrow at 19:00",
+    "Sushi for 4 tomorrow",
+    "Something spicy in Paris 10 at 20:00",
+    "Book the same place as last time",
+]
+
+ROUNDS = 200
+
+
+def main() -> None:
+    hits = sum(pre_extract(query) is not None for query in QUERIES)
+    timings = []
+    for _ in range(ROUNDS):
+        for query in QUERIES:
+            start = time.perf_counter()
+            pre_extract(query)
+            timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    print(f"hit rate: {hits}/{len(QUERIES)} ({hits / len(QUERIES):.0%}) queries skip the LLM")
+    print(
+        f"latency: median {statistics.median(timings):.0f}µs, "
+        f"p95 {timings[int(len(timings) * 0.95)]:.0f}µs, max {timings[-1]:.0f}µs"
+    )
+
+
+if __name__ == "__main__":
+    main()
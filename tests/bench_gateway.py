@@ -0,0 +1,132 @@
+"""
+Traffic-spike benchmark of the Mistral gateway.
+
+Sends a burst of distinct restaurant searches at once against the fake Mistral
+server with a requests-per-second quota, so part of the burst is answered with
+429s as the real API would. Runs them twice: with a new, unlimited client per
+search (as before the gateway) and through the shared gateway client. Reports
+successes, errors, latencies and the 429s seen upstream.
+
+Usage:
+    python -m tests.bench_gateway
+    python -m tests.bench_gateway --requests 400 --quota 50 --queue-timeout 60
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from tests.fake_bland import serve_in_thread
+from tests.fake_mistral import create_app as create_mistral_app
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+parser.add_argument("--requests", type=int, default=200)
+parser.add_argument("--quota", type=float, default=40, help="upstream requests per second")
+parser.add_argument("--queue-timeout", type=float, default=30)
+parser.add_argument("--search-latency", type=float, default=0.2)
+parser.add_argument("--output", default=f"bench_results/gateway-{time.strftime('%Y%m%d-%H%M%S')}.json")
+args = parser.parse_args()
+
+mistral_app = create_mistral_app(latency=0.05, search_latency=args.search_latency, requests_per_second=args.quota)
+mistral_url, mistral_server = serve_in_thread(mistral_app)
+workdir = tempfile.mkdtemp(prefix="bench_gateway_")
+os.environ.update(
+    MISTRAL_API_KEY="bench",
+    MISTRAL_SERVER_URL=mistral_url,
+    # Each model gets its share of the quota; retries absorb the overlap.
+    MISTRAL_REQUESTS_PER_SECOND=str(args.quota / 2),
+    MISTRAL_QUEUE_TIMEOUT=str(args.queue_timeout),
+    CACHE_PATH=os.path.join(workdir, "cache.db"),
+    VENUE_DB_PATH=os.path.join(workdir, "venues.db"),
+    SEMANTIC_INDEX_DIR=os.path.join(workdir, "semantic_index"),
+)
+logging.disable(logging.INFO)
+
+from mistralai import Mistral  # noqa: E402
+
+from src import metrics  # noqa: E402
+from src.mistral_gateway import get_client  # noqa: E402
+from src.prompt_resto_client import _find_restaurant, _no_progress  # noqa: E402
+
+CUISINES = ["Italian", "Japanese", "French", "Lebanese", "Thai", "Indian", "Chinese", "Mexican"]
+
+
+def query(i: int, run: str) -> str:
+    # Each run searches its own arrondissements, so it finds nothing the other stored.
+    arrondissement = i % 10 + (11 if run == "gateway" else 1)
+    cuisine = CUISINES[i // 10 % len(CUISINES)]
+    return f"{cuisine} restaurant in Paris {arrondissement} for {i % 4 + 2} people tomorrow at 8pm, no allergies"
+
+
+async def direct(q: str) -> str:
+    async with Mistral(api_key="bench", server_url=mistral_url) as client:
+        return await _find_restaurant(client, q, _no_progress)
+
+
+async def gateway(q: str) -> str:
+    return await _find_restaurant(get_client(), q, _no_progress)
+
+
+async def run(name: str, search) -> dict:
+    before = dict(mistral_app.state.stats)
+    latencies, errors = [], 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        start = time.perf_counter()
+        reply = await search(query(i, name))
+        if reply.startswith("I found this restaurant"):
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    ordered = sorted(latencies)
+    stats = mistral_app.state.stats
+    return {
+        "client": name,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "p50_s": round(statistics.median(ordered), 3) if ordered else None,
+        "p99_s": round(ordered[int(0.99 * (len(ordered) - 1))], 3) if ordered else None,
+        "upstream_requests": sum(stats[k] - before.get(k, 0) for k in ("chat", "agents", "conversations", "embeddings")),
+        "upstream_429": stats["rate_limited"] - before["rate_limited"],
+    }
+
+
+async def main() -> list[dict]:
+    results = [await run("direct", direct), await run("gateway", gateway)]
+    print(f"{'client':>8} {'ok':>5} {'err':>5} {'time':>7} {'p50':>7} {'p99':>7} {'429s':>5}")
+    for r in results:
+        print(
+            f"{r['client']:>8} {r['succeeded']:5d} {r['errors']:5d} {r['elapsed_s']:7.2f} "
+            f"{r['p50_s'] or 0:7.3f} {r['p99_s'] or 0:7.3f} {r['upstream_429']:5d}"
+        )
+    return results
+
+
+results = asyncio.run(main())
+mistral_server.should_exit = True
+gateway_metrics = [
+    line for line in metrics.render().splitlines()
+    if line.startswith("concierge_mistral_")
+    or line.startswith(("concierge_stage_seconds_sum", "concierge_stage_seconds_count")) and "mistral.queue" in line
+]
+print("\n".join(gateway_metrics))
+
+os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+with open(args.output, "w") as f:
+    json.dump(
+        {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), "results": results},
+        f,
+        indent=2,
+    )
+print(f"results written to {args.output}")
@@ -0,0 +1,160 @@
+"""
+Offline performance regression test, from recorded upstream traffic.
+
+Runs a fixed workload of tool invocations (restaurant searches understood by the
+rules and by the LLM, a sports search, a booking call and its transcript) and
+reports, for each invocation, its wall time, its CPU time and the number of
+requests it sent to Mistral and Bland.
+
+With --record, the workload runs against the fake Mistral and Bland servers and
+their traffic is saved to a cassette. With --replay, it runs offline against
+that cassette, at the recorded pace or as fast as possible, so only the work done
+by the build itself is measured. Given the results of an earlier replay with
+--baseline, the run fails (exit status 1) when an invocation makes a different
+number of upstream requests, or takes more CPU time than the tolerance allows.
+
+Usage:
+    python -m tests.bench_replay --record cassettes/bench.jsonl.gz
+    python -m tests.bench_replay --replay cassettes/bench.jsonl.gz --output bench_results/replay-base.json
+    python -m tests.bench_replay --replay cassettes/bench.jsonl.gz --baseline bench_results/replay-base.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+mode = parser.add_mutually_exclusive_group(required=True)
+mode.add_argument("--record", metavar="CASSETTE")
+mode.add_argument("--replay", metavar="CASSETTE")
+parser.add_argument("--speed", choices=["fast", "recorded"], default="fast")
+parser.add_argument("--baseline", help="results of an earlier replay to compare with")
+parser.add_argument("--cpu-tolerance", type=float, default=0.25, help="allowed CPU time increase, as a fraction")
+parser.add_argument("--output", default=f"bench_results/replay-{time.strftime('%Y%m%d-%H%M%S')}.json")
+args = parser.parse_args()
+
+workdir = tempfile.mkdtemp(prefix="bench_replay_")
+os.environ.update(
+    CASSETTE_MODE="record" if args.record else "replay",
+    CASSETTE_PATH=args.record or args.replay,
+    CASSETTE_SPEED=args.speed,
+    # Keys unlike anything else in the traffic, so redacting them leaves the rest intact.
+    MISTRAL_API_KEY="bench-mistral-key-4f1c",
+    BLAND_API_KEY="bench-bland-key-9a2e",
+    MISTRAL_REQUESTS_PER_SECOND="100000",
+    BLAND_CALLS_PER_MINUTE="100000",
+    PRELOAD_BACKENDS="0",
+    CACHE_PATH=os.path.join(workdir, "cache.db"),
+    VENUE_DB_PATH=os.path.join(workdir, "venues.db"),
+    SEMANTIC_INDEX_DIR=os.path.join(workdir, "semantic_index"),
+    CALL_DB_PATH=os.path.join(workdir, "calls.db"),
+    CALL_QUEUE_DB_PATH=os.path.join(workdir, "call_queue.db"),
+)
+os.environ.pop("BLAND_WEBHOOK_URL", None)
+if args.record:
+    os.makedirs(os.path.dirname(args.record) or ".", exist_ok=True)
+    if os.path.exists(args.record):
+        os.remove(args.record)
+    from tests.fake_bland import create_app as create_bland_app, serve_in_thread
+    from tests.fake_mistral import create_app as create_mistral_app
+
+    os.environ["MISTRAL_SERVER_URL"], mistral_server = serve_in_thread(
+        create_mistral_app(latency=0.05, search_latency=0.3)
+    )
+    os.environ["BLAND_API_URL"], bland_server = serve_in_thread(
+        create_bland_app(latency=0.02, call_seconds=0.5)
+    )
+else:
+    # Never contacted: every request is answered from the cassette.
+    os.environ["MISTRAL_SERVER_URL"] = os.environ["BLAND_API_URL"] = "http://replay.invalid"
+logging.disable(logging.INFO)
+
+from src import cassette, metrics  # noqa: E402
+from src.caller import get_call_transcript_async, start_call_async  # noqa: E402
+from src.prompt_resto_client import find_restaurant_async  # noqa: E402
+from src.prompt_sport_wellness import find_sports_wellness_async  # noqa: E402
+
+# Absolute dates, so a replay on another day sends the same requests.
+WORKLOAD = [
+    ("cherche_restaurant (rules)", lambda: find_restaurant_async(
+        "Italian restaurant in Paris 11 for 2 people on 2026-11-20 at 8pm, no allergies"
+    )),
+    ("cherche_restaurant (llm)", lambda: find_restaurant_async(
+        "something japanese-ish near the 3rd for four of us on 2026-11-21, around 9pm"
+    )),
+    ("find_sports_wellness", lambda: find_sports_wellness_async(
+        "Tennis in Paris 15 on 2026-11-22 at 6pm for 2 people"
+    )),
+    ("call_restaurant + fetch_call_transcript", lambda: call_and_fetch()),
+]
+
+
+async def call_and_fetch() -> str:
+    call_id = await start_call_async(
+        phone_number="+33100000000",
+        restaurant_name="Chez Replay",
+        number_of_people=2,
+        date_of_reservation="2026-11-20",
+        time_of_reservation="20:00",
+        reservation_name="Dupont",
+    )
+    return await get_call_transcript_async(call_id)
+
+
+async def main() -> list[dict]:
+    results = []
+    for name, invoke in WORKLOAD:
+        before = dict(cassette.counts)
+        wall, cpu = time.perf_counter(), time.process_time()
+        await invoke()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        results.append(
+            {
+                "invocation": name,
+                "wall_s": round(wall, 4),
+                "cpu_s": round(cpu, 4),
+                "upstream": {s: n - before.get(s, 0) for s, n in cassette.counts.items() if n != before.get(s, 0)},
+            }
+        )
+    return results
+
+
+results = asyncio.run(main())
+if args.record:
+    mistral_server.should_exit = bland_server.should_exit = True
+
+print(f"{'invocation':<42} {'wall':>7} {'cpu':>7}  upstream")
+for r in results:
+    print(f"{r['invocation']:<42} {r['wall_s']:7.3f} {r['cpu_s']:7.3f}  {r['upstream']}")
+
+regressions = []
+if args.baseline:
+    with open(args.baseline) as f:
+        baseline = {r["invocation"]: r for r in json.load(f)["results"]}
+    for r in results:
+        base = baseline.get(r["invocation"])
+        if base is None:
+            continue
+        if r["upstream"] != base["upstream"]:
+            regressions.append(f"{r['invocation']}: upstream requests {base['upstream']} -> {r['upstream']}")
+        if r["cpu_s"] > base["cpu_s"] * (1 + args.cpu_tolerance) + 0.005:
+            regressions.append(f"{r['invocation']}: CPU time {base['cpu_s']:.3f}s -> {r['cpu_s']:.3f}s")
+# Requests answered from another body than the one recorded (a prompt changed) or not at all.
+print("\n".join(line for line in metrics.render().splitlines() if line.startswith("concierge_cassette_replays")))
+for message in regressions:
+    print(f"REGRESSION: {message}")
+
+os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+with open(args.output, "w") as f:
+    json.dump(
+        {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), "results": results},
+        f,
+        indent=2,
+    )
+print(f"results written to {args.output}")
+sys.exit(1 if regressions else 0)
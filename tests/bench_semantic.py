@@ -0,0 +1,63 @@
+"""
+Query latency and memory benchmark for the semantic venue index.
+
+Fills an index with 100k random unit vectors of the mistral-embed dimension
+(no API calls) and times top-k cosine-similarity queries against it.
+
+Usage:
+    python -m tests.bench_semantic [number_of_vectors]
+"""
+
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from src.semantic import SemanticIndex
+
+DIM = 1024
+BATCH = 10_000
+QUERIES = 200
+
+
+def main(size: int) -> None:
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        index = SemanticIndex(directory)
+        start = time.perf_counter()
+        for offset in range(0, size, BATCH):
+            n = min(BATCH, size - offset)
+            vectors = rng.standard_normal((n, DIM), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            kinds = ["restaurant", "sport"]
+            index.add(
+                vectors,
+                [{"name": f"venue {offset + i}", "kind": kinds[i % 2]} for i in range(n)],
+            )
+        print(f"indexed {len(index)} vectors of dim {DIM} in {time.perf_counter() - start:.1f}s")
+
+        reopened = SemanticIndex(directory)
+        queries = rng.standard_normal((QUERIES, DIM), dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        reopened.search(queries[0], "restaurant", k=5)  # page the matrix in
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            reopened.search(query, "restaurant", k=5)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        file_size = os.path.getsize(os.path.join(directory, "vectors.npy"))
+        print(
+            f"top-5 query: median {statistics.median(timings):.1f}ms, "
+            f"p95 {timings[int(len(timings) * 0.95)]:.1f}ms"
+        )
+        print(f"vectors file: {file_size / 2**20:.0f} MiB (memory-mapped)")
+        print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
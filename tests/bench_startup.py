@@ -0,0 +1,156 @@
+"""
+Cold-start benchmark of the MCP server.
+
+Starts fresh Python processes and measures:
+- import: how long `import main` takes;
+- ready: from spawning a server process to its first HTTP response (/metrics);
+- first search: the latency of the first cherche_restaurant call on that server,
+  which pays for whatever was left to load on first use, next to the second one.
+
+Each measure is the median over `--runs` processes, against the fake Mistral
+server. The run fails (exit status 1) when the import or ready time goes over
+its budget, so a slow import sneaking back into main.py is caught.
+
+Usage:
+    python -m tests.bench_startup
+    python -m tests.bench_startup --runs 10 --max-import-ms 600 --max-ready-ms 1000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+from tests.fake_bland import free_port, serve_in_thread
+from tests.fake_mistral import create_app as create_mistral_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_MAIN = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+SERVE_MAIN = (
+    "import sys, uvicorn, main; "
+    "uvicorn.run(main.mcp.streamable_http_app(), port=int(sys.argv[1]), log_level='warning')"
+)
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+parser.add_argument("--runs", type=int, default=5)
+parser.add_argument("--max-import-ms", type=float, default=800)
+parser.add_argument("--max-ready-ms", type=float, default=1200)
+args = parser.parse_args()
+
+logging.disable(logging.INFO)
+mistral_app = create_mistral_app(latency=0.05, search_latency=0.2)
+mistral_url, mistral_server = serve_in_thread(mistral_app)
+
+
+def environment(workdir: str) -> dict:
+    return {
+        **os.environ,
+        "PYTHONWARNINGS": "ignore",
+        "MISTRAL_API_KEY": "bench",
+        "MISTRAL_SERVER_URL": mistral_url,
+        "CACHE_PATH": os.path.join(workdir, "cache.db"),
+        "VENUE_DB_PATH": os.path.join(workdir, "venues.db"),
+        "SEMANTIC_INDEX_DIR": os.path.join(workdir, "semantic_index"),
+        "CALL_DB_PATH": os.path.join(workdir, "calls.db"),
+        "CALL_QUEUE_DB_PATH": os.path.join(workdir, "call_queue.db"),
+        "SESSION_DB_PATH": os.path.join(workdir, "sessions.db"),
+    }
+
+
+def import_time() -> float:
+    with tempfile.TemporaryDirectory() as workdir:
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_MAIN],
+            cwd=ROOT,
+            env=environment(workdir),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return float(out.stdout.split()[-1])
+
+
+async def search(url: str) -> float:
+    async with streamablehttp_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            start = time.perf_counter()
+            result = await session.call_tool(
+                "cherche_restaurant",
+                {"prompt_utilisateur": "Italian in Paris 11 for 2 people tomorrow at 8pm, no allergies"},
+            )
+            if result.isError:
+                raise RuntimeError(result.content[0].text)
+            return time.perf_counter() - start
+
+
+async def server_times() -> tuple[float, float, float]:
+    """Time to the first response, then latencies of the first and second searches."""
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-c", SERVE_MAIN, str(port)],
+            cwd=ROOT,
+            env=environment(workdir),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            async with httpx.AsyncClient() as client:
+                while True:
+                    try:
+                        response = await client.get(f"http://127.0.0.1:{port}/metrics")
+                        if response.status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    if process.poll() is not None:
+                        raise RuntimeError("the server exited before answering")
+                    await asyncio.sleep(0.005)
+            ready = time.perf_counter() - start
+            url = f"http://127.0.0.1:{port}/mcp"
+            first = await search(url)
+            second = await search(url)
+        finally:
+            process.terminate()
+            process.wait()
+    return ready, first, second
+
+
+async def main_() -> int:
+    imports = [import_time() for _ in range(args.runs)]
+    runs = [await server_times() for _ in range(args.runs)]
+    results = {
+        "import": statistics.median(imports) * 1000,
+        "ready": statistics.median(r[0] for r in runs) * 1000,
+        "first search": statistics.median(r[1] for r in runs) * 1000,
+        "second search": statistics.median(r[2] for r in runs) * 1000,
+    }
+    for name, ms in results.items():
+        print(f"{name:>14} {ms:8.1f} ms")
+
+    over = [
+        f"{name} took {results[name]:.0f} ms, over the {budget:.0f} ms budget"
+        for name, budget in (("import", args.max_import_ms), ("ready", args.max_ready_ms))
+        if results[name] > budget
+    ]
+    for message in over:
+        print(f"REGRESSION: {message}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    status = asyncio.run(main_())
+    mistral_server.should_exit = True
+    sys.exit(status)
@@ -0,0 +1,187 @@
+"""
+Throughput scaling of the server with the number of worker processes.
+
+For each worker count, starts `serve.py --workers N` (with the sqlite state
+backend, so every run shares its caches the same way) against the fake Mistral
+server, warms the caches with a few searches, then drives cherche_restaurant
+calls from several client processes for a fixed duration. Reports throughput,
+latency and the scaling efficiency against one worker: rps(N) / (N * rps(1)).
+
+Requests are raw JSON-RPC posts, which the stateless HTTP transport accepts
+without a session, to keep the clients cheap. Scaling can only be near-linear up
+to the number of cores left once the clients have theirs.
+
+Usage:
+    python -m tests.bench_workers
+    python -m tests.bench_workers --workers 1 2 4 8 --clients 4 --duration 20
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from tests.fake_bland import free_port, serve_in_thread
+from tests.fake_mistral import create_app as create_mistral_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEADERS = {"accept": "application/json, text/event-stream"}
+QUERIES = [
+    f"{cuisine} restaurant in Paris {arrondissement} for {people} people tomorrow at 8pm, no allergies"
+    for cuisine in ("Italian", "Japanese", "French", "Lebanese")
+    for arrondissement in (3, 11)
+    for people in (2, 4)
+]
+
+
+def tool_call(query: str) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "tools/call",
+        "params": {"name": "cherche_restaurant", "arguments": {"prompt_utilisateur": query}},
+    }
+
+
+async def drive(url: str, concurrency: int, duration: float) -> tuple[list[float], int]:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def loop(worker: int) -> None:
+        nonlocal errors
+        i = worker
+        async with httpx.AsyncClient(timeout=60) as client:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.post(url, json=tool_call(QUERIES[i % len(QUERIES)]), headers=HEADERS)
+                if response.status_code == 200 and '"isError":false' in response.text:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+                i += concurrency
+
+    await asyncio.gather(*(loop(w) for w in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(url: str, concurrency: int, duration: float, results) -> None:
+    results.put(asyncio.run(drive(url, concurrency, duration)))
+
+
+def run(workers: int, args, mistral_url: str) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/mcp"
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {
+            **os.environ,
+            "PYTHONWARNINGS": "ignore",
+            "STATE_BACKEND": "sqlite",
+            "MISTRAL_API_KEY": "bench",
+            "MISTRAL_SERVER_URL": mistral_url,
+            "MISTRAL_REQUESTS_PER_SECOND": "100000",
+            "STATE_DB_PATH": os.path.join(workdir, "state.db"),
+            "VENUE_DB_PATH": os.path.join(workdir, "venues.db"),
+            "SEMANTIC_INDEX_DIR": os.path.join(workdir, "semantic_index"),
+            "CALL_DB_PATH": os.path.join(workdir, "calls.db"),
+            "CALL_QUEUE_DB_PATH": os.path.join(workdir, "call_queue.db"),
+        }
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port)],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                try:
+                    httpx.get(f"http://127.0.0.1:{port}/metrics")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.05)
+            # Every worker takes its first requests, and the shared caches fill up.
+            asyncio.run(drive(url, workers * 2, args.warmup))
+
+            context = multiprocessing.get_context("spawn")
+            results = context.Queue()
+            clients = [
+                context.Process(
+                    target=client_process, args=(url, args.concurrency, args.duration, results)
+                )
+                for _ in range(args.clients)
+            ]
+            for c in clients:
+                c.start()
+            outcomes = [results.get() for _ in clients]
+            for c in clients:
+                c.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    latencies = [l for ls, _ in outcomes for l in ls]
+    ordered = sorted(latencies)
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "errors": sum(e for _, e in outcomes),
+        "throughput_rps": round(len(latencies) / args.duration, 1),
+        "p50_s": round(statistics.median(ordered), 4) if ordered else None,
+        "p99_s": round(ordered[int(0.99 * (len(ordered) - 1))], 4) if ordered else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=2, help="client processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight per client")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--output", default=f"bench_results/workers-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if cores < max(args.workers) + args.clients:
+        print(
+            f"note: {cores} cores for up to {max(args.workers)} workers and {args.clients} "
+            "client processes, scaling will flatten past the core count"
+        )
+
+    mistral_app = create_mistral_app(latency=0.05, search_latency=0.2)
+    mistral_url, mistral_server = serve_in_thread(mistral_app)
+    results = []
+    print(f"{'workers':>7} {'rps':>8} {'p50':>7} {'p99':>7} {'err':>4} {'efficiency':>10}")
+    for workers in args.workers:
+        r = run(workers, args, mistral_url)
+        base = results[0] if results else r
+        r["efficiency"] = round(
+            r["throughput_rps"] / (workers / base["workers"] * base["throughput_rps"]), 2
+        )
+        results.append(r)
+        print(
+            f"{workers:>7} {r['throughput_rps']:8.1f} {r['p50_s'] or 0:7.3f} "
+            f"{r['p99_s'] or 0:7.3f} {r['errors']:>4} {r['efficiency']:>10.2f}"
+        )
+    mistral_server.should_exit = True
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(
+            {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "cores": cores, "config": vars(args), "results": results},
+            f,
+            indent=2,
+        )
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
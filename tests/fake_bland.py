@@ -0,0 +1,159 @@
+"""
+Local stand-in for the Bland API, used by the benchmarks.
+
+Calls are accepted immediately and complete `call_seconds` after they were placed,
+or when stopped. Phone numbers listed in `declining` turn the booking down.
+Every endpoint waits `latency` seconds before answering, and a fraction
+`error_rate` of the requests is turned away with a 429 (with Retry-After) or a
+503. Calls placed with a `webhook` get their final details posted to it when they
+complete. `/_stats` counts requests, webhooks, errors and the distinct client
+connections seen, which shows whether clients reuse their connections.
+
+Usage:
+    python tests/fake_bland.py  # serves on http://127.0.0.1:8765
+"""
+
+import asyncio
+import random
+import socket
+import threading
+import time
+import uuid
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def create_app(
+    latency: float = 0.05,
+    call_seconds: float = 5.0,
+    declining: tuple[str, ...] = (),
+    error_rate: float = 0.0,
+    retry_after: float = 0.1,
+) -> Starlette:
+    calls: dict[str, dict] = {}
+    stats = {"requests": 0, "webhooks": 0, "errors": 0, "connections": 0}
+    clients: set[tuple] = set()
+
+    async def upstream(request: Request) -> JSONResponse | None:
+        """Accounts for a request and simulates latency; returns an error response to send, if any."""
+        stats["requests"] += 1
+        if request.scope["client"] not in clients:
+            clients.add(request.scope["client"])
+            stats["connections"] = len(clients)
+        await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            stats["errors"] += 1
+            if random.random() < 0.5:
+                return JSONResponse(
+                    {"status": "error", "message": "Rate limited"},
+                    429,
+                    headers={"Retry-After": str(retry_after)},
+                )
+            return JSONResponse({"status": "error", "message": "Unavailable"}, 503)
+        return None
+
+    async def deliver_webhook(call_id: str, url: str):
+        await asyncio.sleep(call_seconds)
+        async with httpx.AsyncClient() as http:
+            await http.post(url, json=call_details(call_id))
+        stats["webhooks"] += 1
+
+    async def place_call(request: Request):
+        if (error := await upstream(request)) is not None:
+            return error
+        payload = await request.json()
+        call_id = str(uuid.uuid4())
+        calls[call_id] = {"payload": payload, "started": time.time()}
+        if payload.get("webhook"):
+            calls[call_id]["webhook"] = asyncio.create_task(
+                deliver_webhook(call_id, payload["webhook"])
+            )
+        return JSONResponse({"status": "success", "call_id": call_id})
+
+    def call_details(call_id: str) -> dict:
+        call = calls[call_id]
+        completed = call.get("stopped") or time.time() - call["started"] >= call_seconds
+        if call.get("stopped"):
+            summary = "The call was ended before a reservation was made."
+        elif call["payload"]["phone_number"] in declining:
+            summary = "The restaurant is fully booked at that time."
+        else:
+            summary = "The restaurant confirmed the reservation."
+        return {
+            "call_id": call_id,
+            "completed": completed,
+            "status": "completed" if completed else "in-progress",
+            "summary": summary if completed else None,
+            "concatenated_transcript": "Paige: Hi, I'd like to book a table.",
+        }
+
+    async def get_call(request: Request):
+        if (error := await upstream(request)) is not None:
+            return error
+        call_id = request.path_params["call_id"]
+        if call_id not in calls:
+            return JSONResponse({"status": "error", "message": "Call not found"}, 404)
+        return JSONResponse(call_details(call_id))
+
+    async def stop(request: Request):
+        if (error := await upstream(request)) is not None:
+            return error
+        call = calls.get(request.path_params["call_id"])
+        if call is None:
+            return JSONResponse({"status": "error", "message": "Call not found"}, 404)
+        call["stopped"] = True
+        return JSONResponse({"status": "success", "message": "Call ended"})
+
+    async def correct(request: Request):
+        if (error := await upstream(request)) is not None:
+            return error
+        return JSONResponse({"corrected": [{"text": "Hi, I'd like to book a table."}]})
+
+    async def get_stats(request: Request):
+        return JSONResponse(stats)
+
+    async def reset_stats(request: Request):
+        stats.update(requests=0, webhooks=0, errors=0, connections=0)
+        clients.clear()
+        return JSONResponse(stats)
+
+    app = Starlette(
+        routes=[
+            Route("/v1/calls", place_call, methods=["POST"]),
+            Route("/v1/calls/{call_id}", get_call, methods=["GET"]),
+            Route("/v1/calls/{call_id}/stop", stop, methods=["POST"]),
+            Route("/v1/calls/{call_id}/correct", correct, methods=["GET"]),
+            Route("/_stats", get_stats, methods=["GET"]),
+            Route("/_stats", reset_stats, methods=["DELETE"]),
+        ]
+    )
+    app.state.calls = calls
+    app.state.stats = stats
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_in_thread(app, port: int | None = None) -> tuple[str, uvicorn.Server]:
+    """Runs `app` on a background thread and returns its base URL and server."""
+    port = port or free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}", server
+
+
+if __name__ == "__main__":
+    uvicorn.run(create_app(), host="127.0.0.1", port=8765)
@@ -0,0 +1,272 @@
+"""
+Local stand-in for the Mistral API, used by the benchmarks.
+
+Serves the endpoints the concierge uses: chat completions (plain and streamed),
+agent creation, conversations and embeddings. Chat completions answer extraction
+prompts with the fields found in the quoted user request, completed with
+plausible defaults; conversations answer with a venue derived from the prompt;
+embeddings are deterministic pseudo-random unit vectors seeded by the text.
+
+Every endpoint waits `latency` seconds before answering (`search_latency` for
+conversations, which stand for web searches), and a fraction `error_rate` of the
+requests is answered with a 429 or a 500. With `requests_per_second`, requests
+over that quota in the current second are answered with a 429 and a Retry-After
+header, as the real rate limits are. Small models ("small" in their name)
+answer chat completions after `small_latency` instead, and a fraction
+`small_invalid_rate` of their answers leaves out keys, as cheaper models do.
+`/_stats` counts requests per endpoint, and chat completions per model.
+
+Point the SDK at it with MISTRAL_SERVER_URL.
+
+Usage:
+    python tests/fake_mistral.py  # serves on http://127.0.0.1:8766
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from datetime import date, timedelta
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from src.extractor import extract_delta, extract_fields
+
+EMBEDDING_DIM = 1024
+
+RESTAURANT_DEFAULTS = {
+    "restaurant_type": "Italian",
+    "neighborhood": "Paris 11",
+    "allergies": "no allergies",
+    "time": "20:00",
+    "number_of_people": 2,
+    "price": None,
+    "reservation_name": None,
+    "time_flexibility": None,
+}
+SPORT_DEFAULTS = {
+    "sport_type": "tennis",
+    "location": "Paris 15",
+    "time": "18:00",
+    "number_of_people": 2,
+    "price": None,
+    "reservation_name": None,
+    "time_flexibility": None,
+}
+
+
+def _usage() -> dict:
+    return {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150}
+
+
+def _user_request(prompt: str) -> str:
+    match = re.search(r'User request:\s*"(.*?)"', prompt, re.DOTALL)
+    return match.group(1) if match else prompt
+
+
+def extraction(prompt: str) -> dict:
+    """What a model would extract from an extraction prompt."""
+    query = _user_request(prompt)
+    if "already known" in prompt:
+        # A follow-up turn: only what the message says.
+        return extract_delta(query)
+    found = {k: v for k, v in extract_fields(query).items() if v is not None}
+    if "sport_type" in prompt:
+        return {**SPORT_DEFAULTS, "date": (date.today() + timedelta(days=1)).isoformat(), **found}
+    return {**RESTAURANT_DEFAULTS, "date": (date.today() + timedelta(days=1)).isoformat(), **found}
+
+
+def venue(prompt: str) -> dict:
+    """A venue for a search prompt, stable for the same prompt."""
+    digest = hashlib.sha256(prompt.encode()).hexdigest()
+    number = int(digest[:8], 16) % 10**8
+    return {
+        "name": f"Chez {digest[:6]}",
+        "address": f"{number % 200 + 1} rue de la Paix, 750{number % 20 + 1:02d} Paris",
+        "phone_number": f"+331{number:08d}",
+    }
+
+
+def embedding(text: str) -> list[float]:
+    seed = int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def create_app(
+    latency: float = 0.05,
+    search_latency: float = 0.5,
+    error_rate: float = 0.0,
+    small_latency: float | None = None,
+    small_invalid_rate: float = 0.0,
+    requests_per_second: float | None = None,
+) -> Starlette:
+    stats = {
+        "chat": 0, "agents": 0, "conversations": 0, "embeddings": 0, "errors": 0, "rate_limited": 0
+    }
+    # Start of the current one-second window, and requests counted in it.
+    window = [time.monotonic(), 0]
+    small_latency = latency if small_latency is None else small_latency
+
+    async def upstream(endpoint: str, delay: float) -> JSONResponse | None:
+        """Accounts for a request and simulates latency; returns an error response to send, if any."""
+        stats[endpoint] += 1
+        if requests_per_second is not None:
+            now = time.monotonic()
+            if now - window[0] >= 1:
+                window[:] = [now, 0]
+            window[1] += 1
+            if window[1] > requests_per_second:
+                stats["rate_limited"] += 1
+                return JSONResponse(
+                    {"message": "Requests rate limit exceeded"},
+                    429,
+                    headers={"Retry-After": f"{1 - (now - window[0]):.3f}"},
+                )
+        await asyncio.sleep(delay)
+        if random.random() < error_rate:
+            stats["errors"] += 1
+            if random.random() < 0.5:
+                return JSONResponse({"message": "Requests rate limit exceeded"}, 429)
+            return JSONResponse({"message": "Internal server error"}, 500)
+        return None
+
+    async def chat(request: Request):
+        body = await request.json()
+        small = "small" in body["model"]
+        if (error := await upstream("chat", small_latency if small else latency)) is not None:
+            return error
+        stats[f"chat.{body['model']}"] = stats.get(f"chat.{body['model']}", 0) + 1
+        prompt = body["messages"][-1]["content"]
+        fields = extraction(prompt)
+        if small and random.random() < small_invalid_rate:
+            fields = dict(list(fields.items())[: len(fields) // 2])
+        content = json.dumps(fields)
+        completion_id = str(uuid.uuid4())
+        if not body.get("stream"):
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "model": body["model"],
+                    "created": int(time.time()),
+                    "usage": _usage(),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                }
+            )
+
+        async def events():
+            pieces = [content[i : i + 16] for i in range(0, len(content), 16)]
+            for i, piece in enumerate(pieces):
+                last = i == len(pieces) - 1
+                chunk = {
+                    "id": completion_id,
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": piece},
+                            "finish_reason": "stop" if last else None,
+                        }
+                    ],
+                }
+                if last:
+                    chunk["usage"] = _usage()
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(0)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def create_agent(request: Request):
+        if (error := await upstream("agents", latency)) is not None:
+            return error
+        body = await request.json()
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        return JSONResponse(
+            {
+                **body,
+                "id": f"ag_{uuid.uuid4().hex}",
+                "object": "agent",
+                "version": 0,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+
+    async def start_conversation(request: Request):
+        if (error := await upstream("conversations", search_latency)) is not None:
+            return error
+        body = await request.json()
+        inputs = body["inputs"]
+        prompt = inputs if isinstance(inputs, str) else json.dumps(inputs)
+        return JSONResponse(
+            {
+                "object": "conversation.response",
+                "conversation_id": f"conv_{uuid.uuid4().hex}",
+                "usage": _usage(),
+                "outputs": [
+                    {
+                        "object": "entry",
+                        "type": "message.output",
+                        "role": "assistant",
+                        "id": f"msg_{uuid.uuid4().hex}",
+                        "agent_id": body.get("agent_id"),
+                        "content": "```json\n" + json.dumps(venue(prompt)) + "\n```",
+                    }
+                ],
+            }
+        )
+
+    async def embeddings(request: Request):
+        if (error := await upstream("embeddings", latency)) is not None:
+            return error
+        body = await request.json()
+        inputs = body["input"] if "input" in body else body["inputs"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        return JSONResponse(
+            {
+                "id": str(uuid.uuid4()),
+                "object": "list",
+                "model": body["model"],
+                "usage": _usage(),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": embedding(text)}
+                    for i, text in enumerate(inputs)
+                ],
+            }
+        )
+
+    async def get_stats(request: Request):
+        return JSONResponse(stats)
+
+    app = Starlette(
+        routes=[
+            Route("/v1/chat/completions", chat, methods=["POST"]),
+            Route("/v1/agents", create_agent, methods=["POST"]),
+            Route("/v1/conversations", start_conversation, methods=["POST"]),
+            Route("/v1/embeddings", embeddings, methods=["POST"]),
+            Route("/_stats", get_stats, methods=["GET"]),
+        ]
+    )
+    app.state.stats = stats
+    return app
+
+
+if __name__ == "__main__":
+    uvicorn.run(create_app(), host="127.0.0.1", port=8766)
@@ -0,0 +1,155 @@
+"""
+Fields the rule-based pre-extractor reads from restaurant requests, and the
+requests it leaves to the LLM.
+
+Usage:
+    python -m pytest tests/test_extractor.py
+"""
+
+from datetime import date
+
+import pytest
+
+from src.extractor import pre_extract
+
+# A Wednesday, so relative dates resolve the same way on any day.
+TODAY = date(2025, 10, 15)
+FIELDS = ["restaurant_type", "neighborhood", "date", "time", "number_of_people", "price"]
+
+
+@pytest.mark.parametrize(
+    "query, expected, extra",
+    [
+        (
+            "Italian, Paris 16, 2 people, 19/10 at 19:00, 20-50€",
+            ("Italian", "Paris 16", "2025-10-19", "19:00", 2, "20-50€"),
+            {},
+        ),
+        (
+            "Japanese, Le Marais, 4 people, tomorrow at 20:30",
+            ("Japanese", "Le Marais", "2025-10-16", "20:30", 4, None),
+            {},
+        ),
+        (
+            "sushi near Trocadéro tomorrow at 8pm for two, under 40€",
+            ("Japanese", "Trocadéro", "2025-10-16", "20:00", 2, "under 40€"),
+            {},
+        ),
+        (
+            "Japonais dans le Marais ce soir 20h30 pour 4 personnes",
+            ("Japanese", "Le Marais", "2025-10-15", "20:30", 4, None),
+            {},
+        ),
+        (
+            "table for 6 at a brasserie in 75008 on 2025-12-24 at 21:00, name: Dupont",
+            ("French", "Paris 8", "2025-12-24", "21:00", 6, None),
+            {"reservation_name": "Dupont"},
+        ),
+        (
+            "Thai in Paris 11, 3 people, friday 19h30",
+            ("Thai", "Paris 11", "2025-10-17", "19:30", 3, None),
+            {},
+        ),
+        (
+            "Lebanese restaurant, Paris 5, 2 pers, 12/11 at 12:30, max 25€",
+            ("Lebanese", "Paris 5", "2025-11-12", "12:30", 2, "max 25€"),
+            {},
+        ),
+        (
+            "Indian, Montmartre, 5 guests, saturday 8:15 PM, 15-30€",
+            ("Indian", "Montmartre", "2025-10-18", "20:15", 5, "15-30€"),
+            {},
+        ),
+        (
+            "Pizzeria in the 17e for 2 tonight at 9pm",
+            ("Italian", "Paris 17", "2025-10-15", "21:00", 2, None),
+            {},
+        ),
+        (
+            "Vegan place at Oberkampf for 3 people tomorrow 19:45, gluten allergy",
+            ("Vegetarian", "Oberkampf", "2025-10-16", "19:45", 3, None),
+            {"allergies": "gluten"},
+        ),
+        (
+            "Korean BBQ, Paris 13, 8 people, 31/12 at 22:00, under the name Martin",
+            ("Korean", "Paris 13", "2025-12-31", "22:00", 8, None),
+            {"reservation_name": "Martin"},
+        ),
+        (
+            "Seafood, Saint-Germain, 2 people, 14 February at 20:00, 50-100€",
+            ("Seafood", "Saint-Germain-des-Prés", "2026-02-14", "20:00", 2, "50-100€"),
+            {},
+        ),
+        (
+            "Mexican tacos in Pigalle, 4 pax, demain 21h",
+            ("Mexican", "Pigalle", "2025-10-16", "21:00", 4, None),
+            {},
+        ),
+        (
+            "Greek restaurant in Paris 15 for 2 people on October 19th, 2025 at 7:00 PM",
+            ("Greek", "Paris 15", "2025-10-19", "19:00", 2, None),
+            {},
+        ),
+        (
+            "Chinese dim sum, Belleville, 6 people, sunday at noon",
+            ("Chinese", "Belleville", "2025-10-19", "12:00", 6, None),
+            {},
+        ),
+        (
+            "Steakhouse in Paris 8, 4 people, 2025-11-03 at 20:00, more than 40€",
+            ("Steakhouse", "Paris 8", "2025-11-03", "20:00", 4, "more than 40€"),
+            {},
+        ),
+        (
+            "Vietnamese pho, Paris 13, 1 person, today at 12:15",
+            ("Vietnamese", "Paris 13", "2025-10-15", "12:15", 1, None),
+            {},
+        ),
+        (
+            "French bistro, Batignolles, 2 people, next friday at 7:30 PM, flexible by 30 minutes",
+            ("French", "Batignolles", "2025-10-17", "19:30", 2, None),
+            {"time_flexibility": "flexible by 30 minutes"},
+        ),
+        (
+            "Spanish tapas near Bastille for 5 people, 20/10 at 20h",
+            ("Spanish", "Bastille", "2025-10-20", "20:00", 5, None),
+            {},
+        ),
+        (
+            "Moroccan couscous, Paris 20, 7 people, 18 octobre à 19h30",
+            ("Moroccan", "Paris 20", "2025-10-18", "19:30", 7, None),
+            {},
+        ),
+    ],
+)
+def test_rules_hit(query, expected, extra):
+    fields = pre_extract(query, TODAY)
+    assert fields is not None
+    assert tuple(fields[key] for key in FIELDS) == expected
+    assert fields["allergies"] == extra.get("allergies", "no allergies")
+    assert fields["reservation_name"] == extra.get("reservation_name")
+    assert fields["time_flexibility"] == extra.get("time_flexibility")
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "I need a reservation for an Italian place in Paris 16 for 2 people on October 19th, 2025 "
+        "at 7:00 PM. Price range is 20-50€. Please note a shrimp intolerance.",
+        "Somewhere romantic for our anniversary next week",
+        "French or Italian in the 11e, friday 19h, 3 pers",
+        "A nice place for dinner with friends around 8 or 9pm",
+        "Italian in Paris 16 or Paris 17, 2 people, tomorrow at 19:00",
+        "Sushi for 4 tomorrow",
+        "Something spicy in Paris 10 at 20:00",
+        # A price the rules cannot read would be searched as "any price".
+        "Italian, Paris 16, 2 people, 19/10 at 19:00, around 30€ per person",
+        "Italian, Paris 16, 2 people, 19/10 at 19:00, budget 40 euros",
+        "Italian, Paris 16, 2 people, 19/10 at 19:00, cheap",
+        # So would a name or a time flexibility.
+        "Italian, Paris 16, 2 people, 19/10 at 19:00, book it under my name",
+        "Italian, Paris 16, 2 people, 19/10 at 19:00, give or take half an hour",
+    ],
+)
+def test_left_to_the_llm(query):
+    assert pre_extract(query, TODAY) is None
@@ -0,0 +1,79 @@
+"""
+Outcome and booking details read from call summaries.
+
+Usage:
+    python -m pytest tests/test_post_call.py
+"""
+
+import time
+from datetime import datetime
+
+import pytest
+
+from src.post_call import CALENDAR_TIMEZONE, booking_details, booking_outcome, call_result
+
+CALL = {
+    "restaurant_name": "Chez Test",
+    "phone_number": "+33100000000",
+    "number_of_people": 2,
+    "date_of_reservation": "2026-11-20",
+    "time_of_reservation": "20:25",
+    "reservation_name": "Paige",
+    "placed_at": datetime(2026, 11, 1, 12, tzinfo=CALENDAR_TIMEZONE).timestamp(),
+}
+
+
+@pytest.mark.parametrize(
+    "summary, outcome, booked_at",
+    [
+        (
+            "Paige asked for a table for 2 at 8pm but it was not available; the restaurant "
+            "offered 9pm, which Paige accepted and the reservation was confirmed.",
+            "confirmed",
+            "21:00",
+        ),
+        ("The restaurant was fully booked at 8pm but confirmed a table at 9:15 PM.", "confirmed", "21:15"),
+        ("The restaurant couldn't take the booking at 8pm, they booked 9pm instead.", "confirmed", "21:00"),
+        ("The reservation was confirmed for 9pm instead of 8pm.", "confirmed", "21:00"),
+        ("The reservation was confirmed under Paige.", "confirmed", "20:25"),
+        ("The restaurant will call back to confirm.", "unknown", "20:25"),
+        ("The reservation will be confirmed by text message.", "unknown", "20:25"),
+        ("The restaurant was fully booked. No reservation was made.", "declined", "20:25"),
+        ("They first confirmed, but then realized they were fully booked.", "declined", "20:25"),
+        ("The call went to voicemail.", "declined", "20:25"),
+        ("They confirmed the table, but later cancelled the reservation.", "declined", "20:25"),
+        ("Paige booked a table for 2 at 8pm. The host said parking is not available nearby.", "unknown", "20:00"),
+        ("The reservation is confirmed. They cannot accommodate dogs.", "unknown", "20:25"),
+        (
+            "The reservation was confirmed for 8pm. The terrace is closed, so they will seat you inside.",
+            "unknown",
+            "20:00",
+        ),
+        ("", "unknown", "20:25"),
+    ],
+)
+def test_outcome_and_time(summary, outcome, booked_at):
+    assert booking_outcome(summary) == outcome
+    assert booking_details(CALL, summary)["time"] == booked_at
+
+
+def test_confirmed_alternative_gets_calendar_event_at_booked_time():
+    summary = "8pm was not available, but the restaurant confirmed a table at 9:15 PM."
+    result = call_result("call-1", {**CALL, "completed_at": time.time()}, summary, "")
+    assert result["outcome"] == "confirmed"
+    assert result["booking"]["date"] == "2026-11-20"
+    assert "DTSTART:20261120T201500Z" in result["ics"]
+    assert "dates=20261120T211500%2F20261120T231500" in result["calendar_link"]
+
+
+def test_pending_confirmation_has_no_calendar_event():
+    result = call_result("call-2", CALL, "The restaurant will call back to confirm.", "")
+    assert result["outcome"] == "unknown"
+    assert "ics" not in result and "calendar_link" not in result
+
+
+def test_unrelated_refusal_after_confirmation_is_left_to_the_llm():
+    summary = "The reservation is confirmed. They cannot accommodate dogs."
+    result = call_result("call-3", CALL, summary, "")
+    assert result["outcome"] == "unknown"
+    assert "ics" not in result